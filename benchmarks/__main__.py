@@ -0,0 +1,168 @@
+"""Runs the benchmark suite and writes the results as JSON.
+
+Run from the repository root:
+
+    $ python -m benchmarks --years 2 --stations 3 -o results.json
+
+With --http the sources collect over HTTP from a local mock API, with
+optional latency, rate limiting and errors injected (see benchmarks.mockapi).
+
+Passing a previous results file with --compare reports every metric that got
+worse by more than the tolerance and exits with a failure status.
+"""
+
+import argparse
+import datetime
+import json
+import platform
+import sqlite3
+import sys
+import tempfile
+
+from benchmarks import ingest, mockapi, startup
+
+sources = ["pepco", "solaredge", "weather", "gshp"]
+
+# Metrics compared between runs and whether a larger value is better
+metrics = {
+    "rows_per_second": True,
+    "format_seconds": False,
+    "peak_memory_bytes": False,
+    "database_bytes": False,
+}
+
+
+def compare(previous, current, tolerance):
+    """Lists the metrics that regressed by more than ``tolerance``."""
+    regressions = []
+    for name, result in current["sources"].items():
+        before = previous.get("sources", {}).get(name)
+        if before is None:
+            continue
+
+        for metric, larger_is_better in metrics.items():
+            old, new = before.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+
+            change = (new - old) / old
+            if larger_is_better:
+                change = -change
+
+            if change > tolerance:
+                regressions.append(
+                    "{} {}: {:.4g} -> {:.4g}".format(name, metric, old, new)
+                )
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        "python -m benchmarks", description="Runs the netzero benchmark suite"
+    )
+    parser.add_argument(
+        "--years", type=float, default=1, help="years of data to generate"
+    )
+    parser.add_argument(
+        "--stations", type=int, default=3, help="number of weather stations"
+    )
+    parser.add_argument(
+        "--source",
+        choices=sources,
+        action="append",
+        dest="sources",
+        help="only benchmark this source (can be repeated)",
+    )
+    parser.add_argument(
+        "--http", action="store_true", help="collect over HTTP from the mock API"
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0, help="mock API latency in seconds"
+    )
+    parser.add_argument(
+        "--rate-limit", type=int, help="mock API requests per second before HTTP 429"
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0, help="fraction of mock API errors"
+    )
+    parser.add_argument(
+        "-o", "--output", default="benchmark_results.json", help="results file"
+    )
+    parser.add_argument(
+        "--compare", metavar="RESULTS", help="previous results file to compare with"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="allowed relative regression when comparing (default 0.2)",
+    )
+    arguments = parser.parse_args()
+
+    results = {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "parameters": vars(arguments),
+        "startup": startup.run(),
+    }
+
+    server = None
+    base_url = None
+    if arguments.http:
+        profile = mockapi.Profile(
+            arguments.latency,
+            rate_limit=arguments.rate_limit,
+            error_rate=arguments.error_rate,
+        )
+        server = mockapi.serve(profile)
+        base_url = "http://{}:{}".format(*server.server_address)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        results["sources"] = ingest.run(
+            arguments.sources or sources,
+            workdir,
+            arguments.years,
+            arguments.stations,
+            base_url,
+        )
+
+    if server is not None:
+        server.shutdown()
+
+    with open(arguments.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    for name, result in results["sources"].items():
+        print(
+            "{:<10} {:>10.0f} rows/s  format {:.3f}s  peak {:.1f} MB  db {:.1f} MB{}".format(
+                name,
+                result["rows_per_second"],
+                result["format_seconds"],
+                result["peak_memory_bytes"] / 2**20,
+                result["database_bytes"] / 2**20,
+                "  ERROR " + result["error"] if result["error"] else "",
+            )
+        )
+
+    failed = [r["command"] for r in results["startup"] if not r["ok"]]
+    for command in failed:
+        print("startup over budget: " + command)
+
+    if arguments.compare:
+        with open(arguments.compare) as f:
+            previous = json.load(f)
+
+        regressions = compare(previous, results, arguments.tolerance)
+        for regression in regressions:
+            print("regression: " + regression)
+
+        failed += regressions
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
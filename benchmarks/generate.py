@@ -0,0 +1,157 @@
+"""Synthetic payloads shaped like the responses of each data source.
+
+The generators are deterministic for a given seed so benchmark runs are
+comparable with each other.
+"""
+
+import datetime
+import math
+import random
+import time
+
+import netzero.util
+
+# Number of fields in a Symphony sample, most of which netzero ignores
+symphony_fields = 100
+
+
+def green_button_xml(start_date, end_date, interval=3600, seed=0):
+    """Generates a Green Button XML document with readings every ``interval`` seconds.
+
+    Returns
+    -------
+    The document as a string.
+    """
+    rng = random.Random(seed)
+
+    start = int(time.mktime(start_date.timetuple()))
+    end = int(time.mktime((end_date + datetime.timedelta(days=1)).timetuple()))
+
+    parts = [
+        '<feed xmlns="http://www.w3.org/2005/Atom" xmlns:espi="http://naesb.org/espi">',
+        "<id>urn:uuid:0</id><title>Green Button Usage Feed</title>",
+    ]
+
+    # Pepco splits the readings into one entry per day
+    for day_start in range(start, end, 86400):
+        parts.append(
+            "<entry><title>Energy Usage</title><content><espi:IntervalBlock>"
+            "<espi:interval><espi:duration>86400</espi:duration>"
+            "<espi:start>{}</espi:start></espi:interval>".format(day_start)
+        )
+        for reading in range(day_start, min(day_start + 86400, end), interval):
+            parts.append(
+                "<espi:IntervalReading><espi:timePeriod>"
+                "<espi:duration>{}</espi:duration><espi:start>{}</espi:start>"
+                "</espi:timePeriod><espi:value>{}</espi:value>"
+                "</espi:IntervalReading>".format(
+                    interval, reading, rng.randint(100, 3000)
+                )
+            )
+        parts.append("</espi:IntervalBlock></content></entry>")
+
+    parts.append("</feed>")
+
+    return "".join(parts)
+
+
+def solaredge_energy(start_date, end_date, seed=0, time_unit="QUARTER_OF_AN_HOUR"):
+    """Generates a SolarEdge ``energy.json`` response.
+
+    ``time_unit`` is "QUARTER_OF_AN_HOUR" or "DAY". Every day is generated from
+    its own seed, so its daily total is the sum of its quarter hours however
+    the request is split up.
+    """
+    values = []
+    for day in netzero.util.iter_days(start_date, end_date):
+        rng = random.Random(seed ^ day.toordinal())
+        midnight = datetime.datetime.combine(day, datetime.time())
+
+        quarters = []
+        for quarter in range(96):
+            hour = quarter / 4
+            if 6 <= hour < 20:
+                value = round(
+                    1500 * math.sin(math.pi * (hour - 6) / 14) * rng.random(), 3
+                )
+            else:
+                value = None  # SolarEdge reports nights as null
+
+            quarters.append(
+                {
+                    "date": (
+                        midnight + datetime.timedelta(minutes=15 * quarter)
+                    ).strftime("%Y-%m-%d %H:%M:%S"),
+                    "value": value,
+                }
+            )
+
+        if time_unit == "DAY":
+            total = sum(quarter["value"] or 0 for quarter in quarters)
+            values.append(
+                {
+                    "date": midnight.strftime("%Y-%m-%d %H:%M:%S"),
+                    "value": round(total, 3),
+                }
+            )
+        else:
+            values.extend(quarters)
+
+    return {
+        "energy": {
+            "timeUnit": time_unit,
+            "unit": "Wh",
+            "measuredBy": "INVERTER",
+            "values": values,
+        }
+    }
+
+
+def noaa_results(start_date, end_date, stations, seed=0):
+    """Generates one page of NOAA CDO ``data`` results with daily TMAX values."""
+    rng = random.Random(seed ^ start_date.toordinal())
+
+    results = []
+    for day in netzero.util.iter_days(start_date, end_date):
+        seasonal = 60 - 25 * math.cos(2 * math.pi * day.timetuple().tm_yday / 365)
+        for station in stations:
+            results.append(
+                {
+                    "date": day.strftime("%Y-%m-%dT00:00:00"),
+                    "datatype": "TMAX",
+                    "station": station,
+                    "attributes": ",,7,",
+                    "value": round(seasonal + rng.gauss(0, 6)),
+                }
+            )
+
+    return {
+        "metadata": {"resultset": {"offset": 1, "count": len(results), "limit": 1000}},
+        "results": results,
+    }
+
+
+def symphony_day(date, interval=60, seed=0):
+    """Generates a Symphony ``fetch.php`` response for one day.
+
+    Every field of a sample is a string, like the real payload.
+    """
+    rng = random.Random(seed ^ date.toordinal())
+
+    start = int(time.mktime(date.timetuple()))
+
+    samples = []
+    for timestamp in range(start, start + 86400, interval):
+        sample = {
+            str(field): "{:.1f}".format(rng.uniform(0, 120))
+            for field in range(3, symphony_fields + 1)
+        }
+        sample["1"] = str(timestamp)
+        sample["2"] = datetime.datetime.fromtimestamp(timestamp).strftime(
+            "%Y-%m-%d %H:%M:%S"
+        )
+        sample["78"] = str(rng.choice([0, 0, 0, rng.randint(800, 4500)]))
+
+        samples.append(sample)
+
+    return samples
@@ -0,0 +1,172 @@
+"""Collection and export benchmarks for each builtin source.
+
+Each source collects synthetic data into its own database, either with the
+network calls replaced by the generators in `benchmarks.generate` or over HTTP
+from `benchmarks.mockapi`. The benchmark for a source runs in a fresh process
+so its peak memory can be measured on its own.
+"""
+
+import concurrent.futures
+import configparser
+import datetime
+import json
+import os
+import resource
+import sys
+import time
+import unittest.mock
+
+import netzero.db
+from benchmarks import generate
+
+start_date = datetime.date(2015, 1, 1)
+
+
+def make_config(workdir, stations, base_url=None):
+    config = configparser.ConfigParser()
+    config["pepco"] = {"files": json.dumps([os.path.join(workdir, "pepco.xml")])}
+    config["solar"] = {"api_key": "benchmark", "site_id": "1"}
+    config["weather"] = {
+        "api_key": "benchmark",
+        "stations": json.dumps(
+            ["GHCND:BENCH{:05d}".format(i) for i in range(stations)]
+        ),
+    }
+    config["gshp"] = {"username": "benchmark", "password": "benchmark"}
+
+    if base_url is not None:
+        config["solar"]["base_url"] = base_url
+        config["weather"]["base_url"] = base_url + "/cdo-web/api/v2"
+        config["gshp"]["base_url"] = base_url
+
+    return config
+
+
+def prepare(name, config, end_date, http=False):
+    """Replaces the network access of a source with synthetic payloads.
+
+    Returns
+    -------
+    The source class and a list of patches to apply while collecting. There are
+    no patches when collecting over ``http`` from the mock API.
+    """
+    if http and name != "pepco":
+        from netzero.sources import load
+
+        return dict(load())[name], []
+
+    if name == "pepco":
+        from netzero.builtin.pepco import Pepco
+
+        with open(json.loads(config["pepco"]["files"])[0], "w") as f:
+            f.write(generate.green_button_xml(start_date, end_date))
+
+        return Pepco, []
+    elif name == "solaredge":
+        from netzero.builtin.solar import Solar
+
+        def query_api(self, start, end, time_unit="QUARTER_OF_AN_HOUR"):
+            return generate.solaredge_energy(start, end, time_unit=time_unit)
+
+        return Solar, [unittest.mock.patch.object(Solar, "query_api", query_api)]
+    elif name == "weather":
+        from netzero.builtin.weather import Weather
+
+        def query_api(self, start, end):
+            return generate.noaa_results(start, end, self.stations)
+
+        return Weather, [unittest.mock.patch.object(Weather, "query_api", query_api)]
+    elif name == "gshp":
+        from netzero.builtin import gshp
+        from netzero.builtin.gshp import Gshp
+
+        def scrape_json(self, session, date):
+            body = json.dumps(generate.symphony_day(date)).encode()
+
+            # Decoded in the chunks it would be downloaded in
+            chunks = [body[i : i + 65536] for i in range(0, len(body), 65536)]
+            if self.telemetry is not None:
+                return gshp.decode_telemetry(chunks)
+            return gshp.decode_samples(chunks)
+
+        return (
+            Gshp,
+            [
+                unittest.mock.patch.object(
+                    Gshp, "establish_session", lambda self: unittest.mock.Mock()
+                ),
+                unittest.mock.patch.object(Gshp, "scrape_json", scrape_json),
+            ],
+        )
+    else:
+        raise ValueError("Unknown source: {}".format(name))
+
+
+def run_source(name, workdir, years, stations, base_url=None):
+    """Benchmarks collecting and formatting one source.
+
+    Meant to run in its own process, see `run`.
+    """
+    end_date = start_date + datetime.timedelta(days=round(365.25 * years) - 1)
+    database = os.path.join(workdir, name + ".sqlite3")
+
+    config = make_config(workdir, stations, base_url)
+    source_class, patches = prepare(name, config, end_date, base_url is not None)
+
+    result = {"rows": 0, "error": None}
+
+    # Keep the progress output of the sources out of the benchmark output
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        source = source_class(config, database)
+
+        for patch in patches:
+            patch.start()
+
+        start = time.perf_counter()
+        try:
+            source.collect(start_date, end_date)
+        except Exception as e:
+            result["error"] = "{}: {}".format(type(e).__name__, e)
+        result["collect_seconds"] = time.perf_counter() - start
+
+        for patch in patches:
+            patch.stop()
+
+        start = time.perf_counter()
+        [row[0] for row in source.format(start_date, end_date)]
+        result["format_seconds"] = time.perf_counter() - start
+
+        source.conn.close()
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    conn = netzero.db.connect(database)
+    for row in netzero.db.metadata(conn):
+        if row[0] == source_class.name:
+            result["rows"] = row[3]
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+
+    result["rows_per_second"] = result["rows"] / result["collect_seconds"]
+    result["database_bytes"] = os.path.getsize(database)
+
+    # ru_maxrss is in kilobytes on Linux but bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    result["peak_memory_bytes"] = peak if sys.platform == "darwin" else peak * 1024
+
+    return result
+
+
+def run(sources, workdir, years, stations, base_url=None):
+    """Benchmarks each of the sources in a separate process."""
+    results = {}
+    for name in sources:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=1) as executor:
+            results[name] = executor.submit(
+                run_source, name, workdir, years, stations, base_url
+            ).result()
+
+    return results
@@ -0,0 +1,243 @@
+"""Local stand-in for the web APIs the builtin sources collect from.
+
+Serves the SolarEdge site and bulk energy endpoints, the NOAA CDO data endpoint
+and the Symphony login and fetch.php pages with payloads from
+`benchmarks.generate`.
+Latency, rate limiting and server errors can be injected so collection
+throughput and retry behaviour can be measured without touching the real
+services. Injected errors depend only on the seed and the request, so runs are
+repeatable.
+
+Point the sources at it with the ``base_url`` field of each config section:
+
+    [solar]
+    base_url = http://localhost:8080
+    [weather]
+    base_url = http://localhost:8080/cdo-web/api/v2
+    [gshp]
+    base_url = http://localhost:8080
+
+and run it from the repository root:
+
+    $ python -m benchmarks.mockapi --port 8080 --latency 0.05 --error-rate 0.01
+"""
+
+import argparse
+import collections
+import datetime
+import http.server
+import json
+import random
+import threading
+import time
+import urllib.parse
+
+from benchmarks import generate
+
+
+class Profile:
+    """How badly the mock API behaves.
+
+    Parameters
+    ----------
+    latency : float
+        Mean seconds added to every response
+    jitter : float
+        Maximum seconds randomly added to or removed from the latency
+    rate_limit : int, optional
+        Requests allowed per second before answering with HTTP 429
+    error_rate : float
+        Fraction of requests answered with HTTP 500
+    seed : int
+        Seed for the injected latency and errors
+    """
+
+    def __init__(self, latency=0, jitter=0, rate_limit=None, error_rate=0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.error_rate = error_rate
+        self.seed = seed
+
+        self.lock = threading.Lock()
+        self.attempts = collections.Counter()
+        self.window = None
+        self.window_count = 0
+
+    def rng(self, request):
+        """A random generator for one attempt at a request.
+
+        Retrying a request gives a new attempt, so an injected error does not
+        repeat forever.
+        """
+        with self.lock:
+            self.attempts[request] += 1
+            attempt = self.attempts[request]
+
+        return random.Random("{}:{}:{}".format(self.seed, request, attempt))
+
+    def rate_limited(self):
+        if self.rate_limit is None:
+            return False
+
+        with self.lock:
+            window = int(time.monotonic())
+            if window != self.window:
+                self.window = window
+                self.window_count = 0
+            self.window_count += 1
+
+            return self.window_count > self.rate_limit
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.respond()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        self.respond()
+
+    def respond(self):
+        profile = self.server.profile
+        url = urllib.parse.urlsplit(self.path)
+        query = urllib.parse.parse_qs(url.query, keep_blank_values=True)
+
+        rng = profile.rng(self.command + " " + self.path)
+
+        delay = profile.latency + rng.uniform(-profile.jitter, profile.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+        if profile.rate_limited():
+            self.send(429, "text/plain", b"Too Many Requests", {"Retry-After": "1"})
+        elif rng.random() < profile.error_rate:
+            self.send(500, "text/plain", b"Internal Server Error")
+        elif url.path.startswith("/site/") and url.path.endswith("/energy.json"):
+            site_id = url.path.split("/")[2]
+            self.send_json(solaredge_energy(site_id, query))
+        elif url.path.startswith("/sites/") and url.path.endswith("/energy"):
+            sites = []
+            for site_id in url.path.split("/")[2].split(","):
+                energy = solaredge_energy(site_id, query)["energy"]
+                sites.append({"siteId": int(site_id), "energyValues": energy})
+
+            self.send_json(
+                {
+                    "sitesEnergy": {
+                        "timeUnit": query.get("timeUnit", ["DAY"])[0],
+                        "unit": "Wh",
+                        "count": len(sites),
+                        "siteEnergyList": sites,
+                    }
+                }
+            )
+        elif url.path.endswith("/data"):
+            payload = generate.noaa_results(
+                parse_date(query["startdate"][0], "%Y-%m-%d"),
+                parse_date(query["enddate"][0], "%Y-%m-%d"),
+                query.get("stationid", []),
+            )
+            self.send_json(payload)
+        elif url.path == "/account/login":
+            page = '<html><a title="AWL Tech View" href="/?awlid=mock">AWL</a></html>'
+            self.send(200, "text/html", page.encode())
+        elif url.path.startswith("/dealer/historical-data"):
+            self.send(200, "text/html", b"<html></html>")
+        elif url.path == "/fetch.php":
+            self.send_json(
+                generate.symphony_day(parse_date(query["date"][0], "%m-%d-%Y"))
+            )
+        else:
+            self.send(404, "text/plain", b"Not Found")
+
+    def send_json(self, payload):
+        self.send(200, "application/json", json.dumps(payload).encode())
+
+    def send(self, status, content_type, body, headers={}):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def solaredge_energy(site_id, query):
+    # Every site produces its own data
+    return generate.solaredge_energy(
+        parse_date(query["startDate"][0], "%Y-%m-%d"),
+        parse_date(query["endDate"][0], "%Y-%m-%d"),
+        seed=int(site_id),
+        time_unit=query.get("timeUnit", ["QUARTER_OF_AN_HOUR"])[0],
+    )
+
+
+def parse_date(text, format):
+    return datetime.datetime.strptime(text, format).date()
+
+
+def serve(profile, host="localhost", port=0):
+    """Starts the mock API in a background thread.
+
+    Returns
+    -------
+    The running server. Its base URL is ``"http://{}:{}".format(*server.server_address)``
+    and it is stopped with ``server.shutdown()``.
+    """
+    server = http.server.ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.profile = profile
+
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        "python -m benchmarks.mockapi", description="Serves mock source APIs"
+    )
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument(
+        "--latency", type=float, default=0, help="mean seconds added to responses"
+    )
+    parser.add_argument(
+        "--jitter", type=float, default=0, help="random variation of the latency"
+    )
+    parser.add_argument(
+        "--rate-limit", type=int, help="requests per second before HTTP 429"
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0, help="fraction of HTTP 500 responses"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    arguments = parser.parse_args()
+
+    profile = Profile(
+        arguments.latency,
+        arguments.jitter,
+        arguments.rate_limit,
+        arguments.error_rate,
+        arguments.seed,
+    )
+    server = serve(profile, arguments.host, arguments.port)
+
+    print("Serving mock APIs on http://{}:{}".format(*server.server_address))
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Cold start benchmark for the command line interface.
+
+Scheduled runs pay the interpreter and import cost of `netzero` every time,
+so this guards how long it takes before a command starts doing real work. It
+fails if a command takes longer than the budget or if it imports a source
+module (or its dependencies) that the command never selected.
+
+Run from the repository root:
+
+    $ python -m benchmarks.startup
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+# Commands to time, each paired with the modules it must not import
+commands = [
+    (["--help"], ["netzero.builtin", "netzero.library", "requests", "bs4"]),
+    (["collect", "--help"], ["netzero.builtin", "netzero.library", "requests", "bs4"]),
+    (["format", "--help"], ["netzero.builtin", "netzero.library", "requests", "bs4"]),
+]
+
+
+def imported_modules(args):
+    """Lists the modules imported while running a netzero command."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "netzero"] + args,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+
+    modules = []
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            modules.append(line.rsplit("|", 1)[1].strip())
+
+    return modules
+
+
+def wall_time(args, repeat):
+    """Measures the median wall time of a netzero command in seconds."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-m", "netzero"] + args,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        times.append(time.perf_counter() - start)
+
+    return statistics.median(times)
+
+
+def run(repeat=5, budget=0.5):
+    """Runs the benchmark.
+
+    Returns
+    -------
+    A list of results, one dict per command.
+    """
+    results = []
+    for args, forbidden in commands:
+        unexpected = [
+            module
+            for module in imported_modules(args)
+            if any(module == f or module.startswith(f + ".") for f in forbidden)
+        ]
+        seconds = wall_time(args, repeat)
+
+        results.append(
+            {
+                "command": " ".join(["netzero"] + args),
+                "seconds": seconds,
+                "budget": budget,
+                "unexpected_imports": unexpected,
+                "ok": seconds <= budget and not unexpected,
+            }
+        )
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5, help="runs per command")
+    parser.add_argument(
+        "--budget", type=float, default=0.5, help="allowed seconds per command"
+    )
+    arguments = parser.parse_args()
+
+    results = run(arguments.repeat, arguments.budget)
+
+    for result in results:
+        print(
+            "{:<24} {:.3f}s {}".format(
+                result["command"], result["seconds"], "ok" if result["ok"] else "FAIL"
+            )
+        )
+        for module in result["unexpected_imports"]:
+            print("    unexpected import: " + module)
+
+    if not all(result["ok"] for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
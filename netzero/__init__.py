@@ -0,0 +1,12 @@
+__all__ = ["load"]
+
+
+def __getattr__(name):
+    # Importing the library loads the whole export path, which most commands
+    # never use, so it waits until `netzero.load` is first looked up
+    if name == "load":
+        from netzero.library import load
+
+        return load
+
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
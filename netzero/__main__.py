@@ -8,9 +8,16 @@ import datetime
 
 import entrypoints
 
+import netzero.backup
+import netzero.check
 import netzero.collect
+import netzero.compact
+import netzero.daemon
 import netzero.format
+import netzero.instrument
+import netzero.serve
 import netzero.sources
+import netzero.status
 
 
 def main():
@@ -46,11 +53,76 @@ def main():
 
     netzero.format.add_args(format_parser)
 
+    # --- Status Arguments ---
+    status_parser = subparsers.add_parser(
+        "status",
+        description="Show what has been collected from each source",
+        help="Show collected data",
+    )
+    status_parser.set_defaults(func=netzero.status.main)
+
+    netzero.status.add_args(status_parser)
+
+    # --- Daemon Arguments ---
+    daemon_parser = subparsers.add_parser(
+        "daemon",
+        description="Collect data from sources on a schedule until stopped",
+        help="Collect data on a schedule",
+        prefix_chars="-+",
+    )
+    daemon_parser.set_defaults(func=netzero.daemon.main)
+
+    netzero.daemon.add_args(daemon_parser)
+
+    # --- Serve Arguments ---
+    serve_parser = subparsers.add_parser(
+        "serve",
+        description="Serve the collected data over a read-only HTTP API",
+        help="Serve data over HTTP",
+        prefix_chars="-+",
+    )
+    serve_parser.set_defaults(func=netzero.serve.main)
+
+    netzero.serve.add_args(serve_parser)
+
+    # --- Compact Arguments ---
+    compact_parser = subparsers.add_parser(
+        "compact",
+        description="Downsample readings older than the retention period of each "
+        "source and return the freed space",
+        help="Downsample old data",
+        prefix_chars="-+",
+    )
+    compact_parser.set_defaults(func=netzero.compact.main)
+
+    netzero.compact.add_args(compact_parser)
+
+    # --- Backup Arguments ---
+    backup_parser = subparsers.add_parser(
+        "backup",
+        description="Back up the database without stopping collection",
+        help="Back up the database",
+    )
+    backup_parser.set_defaults(func=netzero.backup.main)
+
+    netzero.backup.add_args(backup_parser)
+
+    # --- Check Arguments ---
+    check_parser = subparsers.add_parser(
+        "check",
+        description="Scan the collected readings for gaps, outliers and other issues",
+        help="Check data quality",
+        prefix_chars="-+",
+    )
+    check_parser.set_defaults(func=netzero.check.main)
+
+    netzero.check.add_args(check_parser)
+
     # --- Logic ---
     arguments = parser.parse_args()
 
     if arguments.func is not None:
-        arguments.func(arguments)
+        netzero.instrument.run(arguments.func, arguments)
     else:
         parser.print_help()
 
@@ -0,0 +1,322 @@
+"""Backups of the database taken while it is in use.
+
+Copying the database file while a source is writing to it can give a torn
+copy. `netzero backup` instead reads a consistent snapshot through SQLite's
+online backup API, a few pages at a time with a pause between them. Readers
+never block writers in the database's write-ahead logging mode, so collection
+carries on while the backup is taken.
+
+Backups are kept in a directory:
+
+    netzero-<time>.sqlite3[.gz]    a full copy of the database
+    netzero-<time>.pages[.gz]      the pages that changed since the backup
+                                   before it (with --incremental)
+    manifest                       a hash of every page of the latest backup
+
+The newest backup is rebuilt from the latest full copy and the incremental
+ones after it with ``netzero backup --restore FILE DIRECTORY``.
+"""
+
+import datetime
+import gzip
+import hashlib
+import os
+import shutil
+import sqlite3
+import struct
+import tempfile
+import time
+
+import netzero.db
+import netzero.util
+
+# Identifies a file of changed pages
+magic = b"NZPAGES1"
+
+# gzip's own default of 9 is about sixteen times slower for 3% less
+compresslevel = 6
+
+
+def add_args(parser):
+    netzero.db.add_args(parser)
+
+    parser.add_argument(
+        "--incremental",
+        help="only store the pages that changed since the last backup, if there "
+        "is one",
+        dest="incremental",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-z",
+        "--compress",
+        help="compress the backup with gzip",
+        dest="compress",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--pages",
+        metavar="N",
+        help="number of pages to copy at a time (default 256)",
+        dest="pages",
+        type=int,
+        default=256,
+    )
+    parser.add_argument(
+        "--sleep",
+        metavar="SECONDS",
+        help="pause between copying pages (default 0.01)",
+        dest="sleep",
+        type=float,
+        default=0.01,
+    )
+    parser.add_argument(
+        "--restore",
+        metavar="FILE",
+        help="rebuild the newest backup in the directory as FILE instead of "
+        "taking a backup",
+        dest="restore",
+    )
+
+    parser.add_argument("directory", help="the directory to keep backups in")
+
+
+def main(arguments):
+    if arguments.restore is not None:
+        restore(arguments.directory, arguments.restore)
+        netzero.util.print_status(
+            "Backup", "Restored {}".format(arguments.restore), newline=True
+        )
+        return
+
+    path = backup(
+        arguments.database,
+        arguments.directory,
+        arguments.incremental,
+        arguments.compress,
+        arguments.pages,
+        arguments.sleep,
+    )
+
+    netzero.util.print_status(
+        "Backup",
+        "Wrote {} ({} bytes)".format(path, os.path.getsize(path)),
+        newline=True,
+    )
+
+
+def backup(
+    database, directory, incremental=False, compress=False, pages=256, sleep=0.01
+):
+    """Backs up the database into a directory.
+
+    Returns
+    -------
+    The path of the new backup.
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    name = "netzero-" + datetime.datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    suffix = ".gz" if compress else ""
+
+    fd, temporary = tempfile.mkstemp(suffix=".sqlite3", prefix=".", dir=directory)
+    os.close(fd)
+
+    try:
+        snapshot(database, temporary, pages, sleep)
+
+        previous = load_manifest(directory)
+        page_size = read_page_size(temporary)
+
+        if incremental and previous is not None and previous[0] == page_size:
+            path = os.path.join(directory, name + ".pages" + suffix)
+            hashes = write_pages(temporary, path, page_size, previous[1], compress)
+        else:
+            path = os.path.join(directory, name + ".sqlite3" + suffix)
+            hashes = hash_pages(temporary, page_size)
+
+            if compress:
+                with open(temporary, "rb") as f:
+                    with gzip.open(path, "wb", compresslevel) as out:
+                        shutil.copyfileobj(f, out)
+            else:
+                os.replace(temporary, path)
+
+        save_manifest(directory, page_size, hashes)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+    return path
+
+
+def snapshot(database, path, pages=256, sleep=0.01):
+    """Copies a consistent snapshot of the database with the online backup API.
+
+    The copy is read inside one transaction, so it sees the database as it was
+    when it started however much is written to it meanwhile, and ``pages`` and
+    ``sleep`` only trade how long the backup takes against how much disk time
+    it takes from everything else.
+    """
+    if not os.path.exists(database):
+        raise ValueError("No database at {}".format(database))
+
+    def progress(status, remaining, total):
+        netzero.util.print_status(
+            "Backup", "Copied {} of {} pages".format(total - remaining, total)
+        )
+        time.sleep(sleep)
+
+    source = sqlite3.connect(database)
+    target = sqlite3.connect(path)
+    try:
+        # Without a read transaction held open, every write restarts the copy
+        source.execute("BEGIN")
+        source.execute("SELECT count(*) FROM sqlite_master").fetchone()
+
+        source.backup(target, pages=pages, progress=progress)
+    finally:
+        target.close()
+        source.close()
+
+
+def read_page_size(path):
+    """Reads the page size from the header of a database file."""
+    with open(path, "rb") as f:
+        f.seek(16)
+        (page_size,) = struct.unpack(">H", f.read(2))
+
+    # The largest page size does not fit and is stored as 1
+    return 65536 if page_size == 1 else page_size
+
+
+def read_pages(path, page_size):
+    with open(path, "rb") as f:
+        while True:
+            page = f.read(page_size)
+            if not page:
+                return
+            yield page
+
+
+def page_hash(page):
+    return hashlib.blake2b(page, digest_size=16).digest()
+
+
+def hash_pages(path, page_size):
+    return [page_hash(page) for page in read_pages(path, page_size)]
+
+
+def write_pages(path, output, page_size, previous, compress=False):
+    """Writes the pages of a database that differ from an earlier backup.
+
+    Parameters
+    ----------
+    path : str
+        The database
+    output : str
+        The file to write the changed pages to
+    previous : list of bytes
+        The hash of every page of the earlier backup
+
+    Returns
+    -------
+    The hash of every page of the database.
+    """
+    hashes = []
+
+    if compress:
+        out = gzip.open(output, "wb", compresslevel)
+    else:
+        out = open(output, "wb")
+
+    with out:
+        page_count = os.path.getsize(path) // page_size
+        out.write(magic + struct.pack(">II", page_size, page_count))
+
+        for number, page in enumerate(read_pages(path, page_size)):
+            digest = page_hash(page)
+            hashes.append(digest)
+
+            if number >= len(previous) or previous[number] != digest:
+                out.write(struct.pack(">I", number))
+                out.write(page)
+
+    return hashes
+
+
+def apply_pages(path, pages):
+    """Applies a file of changed pages to a copy of the backup before it."""
+    opener = gzip.open if pages.endswith(".gz") else open
+    with opener(pages, "rb") as changes, open(path, "r+b") as f:
+        if changes.read(len(magic)) != magic:
+            raise ValueError("{} is not a backup of changed pages".format(pages))
+
+        page_size, page_count = struct.unpack(">II", changes.read(8))
+        f.truncate(page_size * page_count)
+
+        while True:
+            number = changes.read(4)
+            if not number:
+                break
+
+            f.seek(struct.unpack(">I", number)[0] * page_size)
+            f.write(changes.read(page_size))
+
+
+def restore(directory, path):
+    """Rebuilds the newest backup in a directory.
+
+    Raises
+    ------
+    ValueError if there is no backup to restore, or the rebuilt database is
+    damaged.
+    """
+    if os.path.exists(path):
+        raise ValueError("{} already exists".format(path))
+
+    names = sorted(
+        name for name in os.listdir(directory) if name.startswith("netzero-")
+    )
+    full = [i for i, name in enumerate(names) if ".sqlite3" in name]
+    if not full:
+        raise ValueError("No backups in {}".format(directory))
+
+    chain = [os.path.join(directory, name) for name in names[full[-1] :]]
+
+    opener = gzip.open if chain[0].endswith(".gz") else open
+    with opener(chain[0], "rb") as f, open(path, "wb") as out:
+        shutil.copyfileobj(f, out)
+
+    for pages in chain[1:]:
+        apply_pages(path, pages)
+
+    conn = sqlite3.connect(path)
+    result = conn.execute("PRAGMA quick_check").fetchone()[0]
+    conn.close()
+
+    if result != "ok":
+        raise ValueError("The restored database is damaged: {}".format(result))
+
+
+def load_manifest(directory):
+    """Reads the page size and page hashes of the latest backup, if any."""
+    path = os.path.join(directory, "manifest")
+    if not os.path.exists(path):
+        return None
+
+    with open(path, "rb") as f:
+        (page_size,) = struct.unpack(">I", f.read(4))
+        data = f.read()
+
+    return page_size, [data[i : i + 16] for i in range(0, len(data), 16)]
+
+
+def save_manifest(directory, page_size, hashes):
+    path = os.path.join(directory, "manifest")
+
+    with open(path + ".tmp", "wb") as f:
+        f.write(struct.pack(">I", page_size))
+        f.write(b"".join(hashes))
+
+    os.replace(path + ".tmp", path)
@@ -1,17 +1,27 @@
 import datetime
 import json
 import os
-import sqlite3
+import re
 
 import bs4
 import requests
 
+import netzero.check
+import netzero.collect
+import netzero.db
+import netzero.instrument
 import netzero.util
+import netzero.web
+
+# The timestamp ("1") and wattage ("78") fields of a Symphony sample, whose
+# values are sent as strings of digits, or the end of the sample
+sample_token = re.compile(rb'"(1|78)"\s*:\s*"(-?\d+)"|(\})')
 
 
 class Gshp:
     name = "gshp"
     summary = "Symphony ground source heat pump data"
+    rollup = "sum"
 
     default_start = datetime.date(2016, 10, 31)
     default_end = datetime.date.today()
@@ -23,13 +33,34 @@ class Gshp:
 
         self.username = config["gshp"]["username"]
         self.password = config["gshp"]["password"]
+        self.base_url = config["gshp"].get(
+            "base_url", "https://symphony.mywaterfurnace.com"
+        )
 
-        self.conn = sqlite3.connect(database)
+        self.conn = netzero.db.connect(database)
         self.conn.create_aggregate("WATTAGG", 2, WattHourAgg)
 
         self.conn.execute(
             "CREATE TABLE IF NOT EXISTS gshp (time TIMESTAMP PRIMARY KEY, watts FLOAT)"
         )
+        netzero.db.create_metadata(self.conn, self.name, "gshp", "time")
+
+        # The other fields of every sample to keep, "all" or a list of their
+        # numbers, or None to only keep the watts
+        self.telemetry = config["gshp"].get("telemetry")
+        if self.telemetry is not None and self.telemetry != "all":
+            self.telemetry = json.loads(self.telemetry)
+            for field in self.telemetry:
+                if not str(field).isdigit():
+                    raise ValueError("Invalid Symphony field: '{}'".format(field))
+            self.telemetry = [str(field) for field in self.telemetry]
+
+        if self.telemetry is not None:
+            self.create_telemetry()
+
+        # Logged in lazily and kept between runs when collecting as a daemon
+        self.session = None
+        self.pipeline = netzero.collect.pipeline_options(config, "gshp")
 
     def collect(self, start_date=None, end_date=None):
         """Collects raw furnace usage data from the Symphony website.
@@ -46,34 +77,156 @@ class Gshp:
         if end_date is None:
             end_date = self.default_end
 
-        cur = self.conn.cursor()
+        # Compacted days only keep hourly samples and are not collected again
+        compacted = netzero.db.downsampled_before(self.conn, self.name)
+        if compacted is not None and start_date < compacted:
+            start_date = compacted
 
-        netzero.util.print_status("GSHP", "Establishing Session")
+        cur = self.conn.cursor()
+        inserted = 0
+        captured = 0
 
-        session = self.establish_session()
+        if self.session is None:
+            netzero.util.print_status("GSHP", "Establishing Session")
+            self.session = self.establish_session()
 
-        for day in netzero.util.iter_days(start_date, end_date):
+        def fetch(day):
             netzero.util.print_status(
                 "GSHP", "Collecting: {}".format(day.strftime("%Y-%m-%d"))
             )
 
-            parsed = self.scrape_json(session, day)
+            return self.scrape_json(self.session, day)
 
-            for row in parsed:
-                time = int(row["1"])  # Unix timestamp
-                time = datetime.datetime.fromtimestamp(time)
+        def write(parsed):
+            nonlocal inserted, captured
 
-                value = int(row["78"])  # The number of Watts
+            rows, telemetry = parsed
+            with netzero.instrument.phase(self.name, "write"):
+                cur.executemany("INSERT OR IGNORE INTO gshp VALUES (?, ?)", rows)
+                inserted += cur.rowcount
 
-                cur.execute("INSERT OR IGNORE INTO gshp VALUES (?, ?)", (time, value))
+                if telemetry is not None:
+                    captured += self.store_telemetry(cur, *telemetry)
 
-            self.conn.commit()
+                self.conn.commit()
+
+        days = netzero.util.iter_days(start_date, end_date)
+
+        pipeline = netzero.collect.Pipeline(
+            self.name, days, self.pipeline["queue_size"]
+        )
+        pipeline.map(fetch, self.pipeline["fetch_workers"])
+        pipeline.map(self.parse, self.pipeline["parse_workers"], phase="parse")
+
+        try:
+            pipeline.run(write)
+        except Exception:
+            # The login may have expired, log in again on the next run
+            self.session.close()
+            self.session = None
+            raise
 
         cur.close()
-        session.close()
+
+        netzero.db.record_collection(self.conn, self.name, "gshp", "time", inserted)
+        if self.telemetry is not None:
+            netzero.db.record_collection(
+                self.conn, "gshp_telemetry", "gshp_telemetry", "time", captured
+            )
 
         netzero.util.print_status("GSHP", "Complete", newline=True)
 
+    def parse(self, samples):
+        """Converts a day of Symphony samples into rows of the gshp table
+
+        Returns
+        -------
+        The rows of the gshp table, and the fields and rows of the
+        gshp_telemetry table or None if telemetry is not kept.
+        """
+        times = netzero.util.local_times([sample[0] for sample in samples])
+        rows = list(zip(times, [sample[1] for sample in samples]))
+
+        if self.telemetry is None:
+            return rows, None
+
+        if self.telemetry == "all":
+            fields = set()
+            for sample in samples:
+                fields.update(sample[2])
+            # The timestamp is already the key and "2" is the same time as text
+            fields = sorted(
+                (
+                    field
+                    for field in fields
+                    if field.isdigit() and field not in ("1", "2")
+                ),
+                key=int,
+            )
+        else:
+            fields = self.telemetry
+
+        # Empty fields are missing readings
+        telemetry = [
+            (row[0], *[sample[2].get(field) or None for field in fields])
+            for row, sample in zip(rows, samples)
+        ]
+
+        return rows, (fields, telemetry)
+
+    def create_telemetry(self):
+        """Creates the gshp_telemetry table, with a column for each field kept
+
+        Columns are named after the number of their field, like field_19, and
+        more are added as new fields are seen. Their REAL affinity stores the
+        numeric strings Symphony sends as numbers, whole ones as compact
+        integers, and missing readings as NULL.
+        """
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS gshp_telemetry (time TIMESTAMP PRIMARY KEY)
+            WITHOUT ROWID"""
+        )
+        netzero.db.create_metadata(
+            self.conn, "gshp_telemetry", "gshp_telemetry", "time"
+        )
+
+        self.telemetry_columns = {
+            row[1] for row in self.conn.execute("PRAGMA table_info(gshp_telemetry)")
+        }
+
+        if self.telemetry != "all":
+            self.add_telemetry_columns(self.conn, self.telemetry)
+            self.conn.commit()
+
+    def add_telemetry_columns(self, cur, fields):
+        for field in fields:
+            column = "field_" + field
+            if column not in self.telemetry_columns:
+                cur.execute(
+                    "ALTER TABLE gshp_telemetry ADD COLUMN {} REAL".format(column)
+                )
+                self.telemetry_columns.add(column)
+
+    def store_telemetry(self, cur, fields, rows):
+        """Inserts rows of some fields into the gshp_telemetry table
+
+        Returns
+        -------
+        The number of rows inserted.
+        """
+        self.add_telemetry_columns(cur, fields)
+
+        columns = ", ".join(["time"] + ["field_" + field for field in fields])
+        cur.executemany(
+            "INSERT OR IGNORE INTO gshp_telemetry ({}) VALUES ({})".format(
+                columns, ", ".join("?" * (len(fields) + 1))
+            ),
+            rows,
+        )
+
+        return cur.rowcount
+
     def establish_session(self) -> requests.Session:
         """Establishes a session with the symphony website 
         
@@ -88,16 +241,14 @@ class Gshp:
             "password": self.password,
         }
 
-        s = requests.Session()
-
-        # Allow the session to retry a connection up to 5 times
+        # Allow the session to retry a request up to 5 times
         # The GSHP website is flaky
-        retry_adapter = requests.adapters.HTTPAdapter(max_retries=5)
-        s.mount("http://", retry_adapter)
-        s.mount("https://", retry_adapter)
+        s = netzero.web.session(retries=5)
 
         # Login to the site
-        p = s.post("https://symphony.mywaterfurnace.com/account/login", data=payload)
+        p = netzero.web.request(
+            s, self.name, "POST", self.base_url + "/account/login", data=payload
+        )
 
         # Find the tokens that seem to be necessary for the next few steps
         soup = bs4.BeautifulSoup(p.text, "html.parser")
@@ -107,7 +258,9 @@ class Gshp:
         # Navigate some more
         # Navigating here allows us to actually collect the data.
         # Necessary in order the query the fetch.php script.
-        s.get("https://symphony.mywaterfurnace.com/dealer/historical-data" + field)
+        netzero.web.request(
+            s, self.name, "GET", self.base_url + "/dealer/historical-data" + field
+        )
 
         return s
 
@@ -123,67 +276,100 @@ class Gshp:
         
         Returns
         -------
-        A python list containing the data in the format:
+        A list of ``(timestamp, watts)`` tuples of ints, one for each sample.
+        When keeping telemetry each tuple also has the sample's dict of
+        fields, see `decode_telemetry`.
+
+        The response is a JSON array of samples in the format:
             [
                 {
-                    "1":_,
+                    "1":_, <-- This is the Unix timestamp of the entry
                     "2":_, <-- This is the time of the entry
                     ...
                     "78":_, <-- This is the energy usage (in Watts) for the entry
                     ...
                 }
             ]
-        Every value in the JSON objects is a string
+        Every value in the JSON objects is a string. Only the two fields we use
+        are decoded, see `decode_samples`.
         """
         params = {"json": "", "date": date.strftime("%m-%d-%Y")}
         # Putting the date you want information for after this url returns some
         # json containing all the data for that day.
         # Found with some simple network analysis using browser tools...
-        response = session.get(
-            "https://symphony.mywaterfurnace.com/fetch.php", params=params
+        response = netzero.web.request(
+            session,
+            self.name,
+            "GET",
+            self.base_url + "/fetch.php",
+            params=params,
+            stream=True,
         )
 
-        if response.ok:
-            return response.json()
-        else:
-            return []
+        with response:
+            if response.ok:
+                chunks = netzero.web.iter_content(response, self.name)
+                if self.telemetry is not None:
+                    return decode_telemetry(chunks)
+                return decode_samples(chunks)
+            else:
+                netzero.instrument.count(self.name, "api_errors")
+                return []
 
-    def min_date(self):
-        result = self.conn.execute("SELECT date(min(time)) FROM gshp").fetchone()[0]
+    def compact(self, before):
+        """Replaces the samples before a date with one sample for each hour
 
-        if result is None:
-            return None
-        else:
-            return datetime.datetime.strptime(result, "%Y-%m-%d").date()
+        The gshp_telemetry table is kept as it is.
 
-    def max_date(self):
-        result = self.conn.execute("SELECT date(max(time)) FROM gshp").fetchone()[0]
+        Returns
+        -------
+        The number of rows removed.
+        """
+        return netzero.db.downsample(
+            self.conn, self.name, "gshp", before, hourly_samples
+        )
 
-        if result is None:
-            return None
-        else:
-            return datetime.datetime.strptime(result, "%Y-%m-%d").date()
+    def check(self):
+        """Checks the samples for missing hours, outliers and other issues
+
+        The heat pump can be off for days, so only a wattage other than zero
+        that stays exactly the same is suspicious.
+
+        Returns
+        -------
+        A list of issues, see `netzero.check.scan`.
+        """
+        return netzero.check.scan(
+            self.conn,
+            "gshp",
+            "watts",
+            gap=datetime.timedelta(hours=1),
+            flat=datetime.timedelta(hours=1),
+            low=0,
+            since=netzero.db.downsampled_before(self.conn, self.name),
+        )
+
+    def min_date(self):
+        return netzero.db.date_bounds(self.conn, self.name)[0]
+
+    def max_date(self):
+        return netzero.db.date_bounds(self.conn, self.name)[1]
 
     def format(self, start_date, end_date):
         netzero.util.print_status("GSHP", "Querying Database")
 
+        netzero.db.ensure_calendar(self.conn, start_date, end_date)
+
+        # Each day's rows are found through the index on time, in order
         data = self.conn.execute(
             """
-            WITH RECURSIVE
-                range(d) AS (
-                    SELECT date(?)
-                    UNION ALL
-                    SELECT date(d, '+1 day')
-                    FROM range
-                    WHERE range.d <= date(?)
-                ),
-                data(d, v) AS (
-                    SELECT date(time), WATTAGG(time, watts)
-                    FROM gshp
-                    GROUP BY date(time)
-                )
-            SELECT v FROM range NATURAL LEFT JOIN data""",
-            (start_date, end_date),
+            SELECT WATTAGG(time, watts)
+            FROM calendar
+            LEFT JOIN gshp ON time >= day AND time < date(day, '+1 day')
+            WHERE day BETWEEN date(:start) AND date(:end)
+            GROUP BY day
+            ORDER BY day""",
+            {"start": start_date, "end": end_date},
         )
 
         netzero.util.print_status("GSHP", "Complete", newline=True)
@@ -191,6 +377,126 @@ class Gshp:
         return data
 
 
+def hourly_samples(rows):
+    """Combines the samples of whole days into one sample for each hour.
+
+    A sample's watts are counted from the previous sample of the day (see
+    `WattHourAgg`), so each hour is replaced by a sample at the time of its
+    last one, with the watts that give the hour's energy over the same span.
+    Daily energy is unchanged up to rounding the combined samples to whole
+    watts.
+    """
+    samples = []
+
+    hour = last = start = previous = None
+    energy = 0
+    for time, watts in rows:
+        stamp = datetime.datetime.fromisoformat(time)
+
+        if time[:13] != hour:
+            if hour is not None:
+                samples.append(hourly_sample(last, energy, start, previous))
+
+            if hour is None or time[:10] != hour[:10]:
+                # The first sample of a day is counted from midnight
+                previous = stamp.replace(hour=0, minute=0, second=0)
+
+            hour = time[:13]
+            start = previous
+            energy = 0
+
+        energy += round(watts / 1000, 3) * (stamp - previous).total_seconds()
+
+        previous = stamp
+        last = (time, watts)
+
+    if hour is not None:
+        samples.append(hourly_sample(last, energy, start, previous))
+
+    return samples
+
+
+def hourly_sample(last, energy, start, end):
+    """The sample spreading an hour's energy (in kW seconds) from start to end"""
+    seconds = (end - start).total_seconds()
+    if seconds == 0:  # Only a sample at midnight, which counts for nothing
+        return last
+
+    # Whole watts, like the samples, which WattHourAgg reads exactly
+    return (last[0], round(energy / seconds * 1000))
+
+
+def decode_samples(chunks):
+    """Decodes the timestamp and wattage of each sample in a Symphony payload.
+
+    The payload is scanned chunk by chunk as it is downloaded, for just the two
+    fields we use, instead of building a dict of dozens of strings for every
+    sample.
+
+    Parameters
+    ----------
+    chunks : iterable of bytes
+        The body of a ``fetch.php`` response
+
+    Returns
+    -------
+    A list of ``(timestamp, watts)`` tuples of ints.
+
+    Raises
+    ------
+    ValueError
+        If a sample is missing either field, or has one that is not a number.
+    """
+    samples = []
+    time = watts = None
+
+    def scan(data, end):
+        nonlocal time, watts
+
+        for key, value, _ in sample_token.findall(data, 0, end):
+            if key == b"1":
+                time = int(value)
+            elif key:
+                watts = int(value)
+            else:
+                # The fields of a sample may come in either order, so they are
+                # only paired up once it ends
+                if time is None or watts is None:
+                    raise ValueError("Sample without a numeric timestamp and wattage")
+
+                samples.append((time, watts))
+                time = watts = None
+
+    rest = b""
+    for chunk in chunks:
+        data = rest + chunk
+
+        # A field never contains a comma, so everything up to the last comma
+        # can be scanned and the rest saved for the next chunk
+        end = data.rfind(b",") + 1
+        scan(data, end)
+        rest = data[end:]
+
+    scan(rest, len(rest))
+    if time is not None or watts is not None:
+        raise ValueError("Sample without a numeric timestamp and wattage")
+
+    return samples
+
+
+def decode_telemetry(chunks):
+    """Decodes every field of each sample in a Symphony payload.
+
+    Returns
+    -------
+    A list of ``(timestamp, watts, fields)`` tuples, where ``fields`` is the
+    sample's dict of strings.
+    """
+    samples = json.loads(b"".join(chunks))
+
+    return [(int(sample["1"]), int(sample["78"]), sample) for sample in samples]
+
+
 # TODO -- Deal with missing data. Hours at a time may be unaccounted for!!!
 class WattHourAgg(object):
     """An Sqlite3 aggregator to convert GSHP power usage to energy usage
@@ -214,6 +520,9 @@ class WattHourAgg(object):
         previous entry and conert it to hours. Convert the watts to kilowatts 
         and multiply the time and the wattage to get the energy usage.
         """
+        if time is None:  # A day without any entries
+            return
+
         time = datetime.datetime.fromisoformat(time)
         # We'll say the numbers have 3 significant figures because it's not
         # specified
@@ -230,4 +539,7 @@ class WattHourAgg(object):
         self.prev_time = time
 
     def finalize(self):
+        if self.prev_time is None:
+            return None
+
         return round(self.watt_hours, 3)
@@ -40,9 +40,12 @@ import datetime
 import itertools
 import json
 import os
-import sqlite3
 import xml.etree.ElementTree as ETree
 
+import netzero.check
+import netzero.collect
+import netzero.db
+import netzero.instrument
 import netzero.util
 
 tags = {
@@ -61,17 +64,20 @@ tags = {
 class Pepco:
     name = "pepco"
     summary = "Pepco data"
+    rollup = "sum"
 
     def __init__(self, config, database):
         netzero.util.validate_config(config, entry="pepco", fields=["files"])
 
         self.files = json.loads(config["pepco"]["files"])
+        self.pipeline = netzero.collect.pipeline_options(config, "pepco")
 
-        self.conn = sqlite3.connect(database)
+        self.conn = netzero.db.connect(database)
 
         self.conn.execute(
             "CREATE TABLE IF NOT EXISTS pepco (time TIMESTAMP PRIMARY KEY, watt_hrs FLOAT)"
         )
+        netzero.db.create_metadata(self.conn, self.name, "pepco", "time")
 
     def collect(self, start_date=None, end_date=None) -> None:
         """Collects data from PEPCO XML files.
@@ -87,89 +93,117 @@ class Pepco:
             The end of the data collection range
         """
         cur = self.conn.cursor()
-        # Combine files into one long list of entries.
-        entries = self.concatenate_files(self.files)
-
-        # Iterate through each entry
-        for entry in entries:
-            # Find the IntervalBlock tag underneath the content tag
-            content = entry.find(tags["content"])
-            block = None
-            if content:
-                block = content.find(tags["IntervalBlock"])
-
-            # Only care about entries with IntervalBlock tags
-            if block is not None:
-                # Iterate through the readings, storing each one in the database
-                for reading in block.findall(tags["IntervalReading"]):
-                    # Read start time and usage in Wh from XML file
-                    start = int(
-                        reading.find(tags["timePeriod"]).find(tags["start"]).text
-                    )
-                    start = datetime.datetime.fromtimestamp(start)
-
-                    value = int(reading.find(tags["value"]).text)
-
-                    cur.execute(
-                        "INSERT OR IGNORE INTO pepco VALUES (?, ?)", (start, value)
-                    )
+        changes = self.conn.total_changes
 
+        def write(rows):
+            with netzero.instrument.phase(self.name, "write"):
+                # Every run reads the whole files again, compacted days included
+                rows = netzero.db.skip_downsampled(self.conn, self.name, rows)
+                cur.executemany("INSERT OR IGNORE INTO pepco VALUES (?, ?)", rows)
                 self.conn.commit()
 
+        # Reading the files is the parse stage, it hands over one block at a time
+        pipeline = netzero.collect.Pipeline(
+            self.name,
+            self.read_blocks(self.files),
+            self.pipeline["queue_size"],
+            phase="parse",
+        )
+        pipeline.run(write)
+
         cur.close()
 
-    def concatenate_files(self, files):
-        """
-        Generates entries from each of the provided Greenbutton data files.
+        netzero.db.record_collection(
+            self.conn, self.name, "pepco", "time", self.conn.total_changes - changes
+        )
 
-        :yields: 
+    def read_blocks(self, files):
+        """Generates the readings of each IntervalBlock in the Green Button files.
+
+        The files are parsed incrementally and every entry is discarded once
+        its readings have been read, so only one entry is in memory at a time.
+
+        :yields: a list of (start time, Wh) tuples for each IntervalBlock
         """
-        entries = []
         for f in files:
-            tree = ETree.parse(f)
+            root = None
+            for event, element in ETree.iterparse(f, events=("start", "end")):
+                if root is None:
+                    root = element
+                if event != "end" or element.tag != tags["entry"]:
+                    continue
+
+                # Find the IntervalBlock tag underneath the content tag
+                content = element.find(tags["content"])
+                block = None
+                if content:
+                    block = content.find(tags["IntervalBlock"])
+
+                # Only care about entries with IntervalBlock tags
+                if block is not None:
+                    starts = []
+                    values = []
+                    for reading in block.findall(tags["IntervalReading"]):
+                        # Read start time and usage in Wh from XML file
+                        period = reading.find(tags["timePeriod"])
+                        starts.append(int(period.find(tags["start"]).text))
+                        values.append(int(reading.find(tags["value"]).text))
+
+                    yield list(zip(netzero.util.local_times(starts), values))
+
+                # Drop the entries read so far
+                root.clear()
+
+    def compact(self, before):
+        """Replaces the readings before a date with hourly totals
+
+        Returns
+        -------
+        The number of rows removed.
+        """
+        return netzero.db.downsample(
+            self.conn, self.name, "pepco", before, netzero.util.hourly_totals
+        )
 
-            root = tree.getroot()
-            entries = root.findall(tags["entry"])
+    def check(self):
+        """Checks the readings for gaps, outliers and other issues
 
-            for entry in entries:
-                yield entry
+        A house always uses some energy, so a whole day of zeros is missing
+        data. The interval between readings depends on the meter.
 
-    def min_date(self):
-        result = self.conn.execute("SELECT date(min(time)) FROM pepco").fetchone()[0]
+        Returns
+        -------
+        A list of issues, see `netzero.check.scan`.
+        """
+        return netzero.check.scan(
+            self.conn,
+            "pepco",
+            "watt_hrs",
+            flat=datetime.timedelta(hours=6),
+            flat_zero=datetime.timedelta(days=1),
+            since=netzero.db.downsampled_before(self.conn, self.name),
+        )
 
-        if result is None:
-            return None
-        else:
-            return datetime.datetime.strptime(result, "%Y-%m-%d").date()
+    def min_date(self):
+        return netzero.db.date_bounds(self.conn, self.name)[0]
 
     def max_date(self):
-        result = self.conn.execute("SELECT date(max(time)) FROM pepco").fetchone()[0]
-
-        if result is None:
-            return None
-        else:
-            return datetime.datetime.strptime(result, "%Y-%m-%d").date()
+        return netzero.db.date_bounds(self.conn, self.name)[1]
 
     def format(self, start_date, end_date):
         netzero.util.print_status("Pepco", "Querying Database", newline=True)
 
+        netzero.db.ensure_calendar(self.conn, start_date, end_date)
+
         data = self.conn.execute(
             """
-            WITH RECURSIVE
-                range(d) AS (
-                    SELECT date(?)
-                    UNION ALL
-                    SELECT date(d, '+1 day')
-                    FROM range
-                    WHERE range.d <= date(?)
-                ),
-                data(d, v) AS (
-                    SELECT date(time), SUM(watt_hrs) / 1000
-                    FROM pepco
-                    GROUP BY date(time)
-                )
-            SELECT v FROM range NATURAL LEFT JOIN data""",
-            (start_date, end_date),
+            SELECT SUM(watt_hrs) / 1000
+            FROM calendar
+            LEFT JOIN pepco ON time >= day AND time < date(day, '+1 day')
+            WHERE day BETWEEN date(:start) AND date(:end)
+            GROUP BY day
+            ORDER BY day""",
+            {"start": start_date, "end": end_date},
         )
 
         netzero.util.print_status("Pepco", "Complete", newline=True)
@@ -7,22 +7,30 @@ data and convert it into a useful daily summation of energy production.
 Solar Edge API documentation (ca 2019):
 https://www.solaredge.com/sites/default/files/se_monitoring_api.pdf
 """
+import contextlib
 import datetime
 import json
 import os
-import requests
-import sqlite3
 
+import netzero.check
+import netzero.collect
+import netzero.db
+import netzero.instrument
 import netzero.util
+import netzero.web
 
 
 class Solar:
     name = "solaredge"
     summary = "Solar Edge data"
+    rollup = "sum"
 
     default_start = datetime.date(2016, 1, 27)
     default_end = datetime.date.today()
 
+    # The most sites the API returns in one bulk request
+    bulk_size = 100
+
     def __init__(self, config, database):
         netzero.util.validate_config(
             config, entry="solar", fields=["api_key", "site_id"]
@@ -30,17 +38,42 @@ class Solar:
 
         self.api_key = config["solar"]["api_key"]
         self.site_id = config["solar"]["site_id"]
+        self.base_url = config["solar"].get(
+            "base_url", "https://monitoringapi.solaredge.com"
+        )
+        self.session = netzero.web.session()
+        self.pipeline = netzero.collect.pipeline_options(config, "solar")
 
-        self.conn = sqlite3.connect(database)
+        # How many quarter hour requests a run may make, all of them by default
+        self.detail_requests = None
+        if "detail_requests" in config["solar"]:
+            self.detail_requests = config["solar"].getint("detail_requests")
+
+        self.conn = netzero.db.connect(database)
 
         self.conn.execute(
             "CREATE TABLE IF NOT EXISTS solaredge (time TIMESTAMP PRIMARY KEY, watt_hrs FLOAT)"
         )
+        netzero.db.create_metadata(self.conn, self.name, "solaredge", "time")
+
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS solaredge_daily (date DATE PRIMARY KEY, watt_hrs FLOAT)"
+        )
+        netzero.db.create_metadata(
+            self.conn, "solaredge_daily", "solaredge_daily", "date"
+        )
 
     def collect(self, start_date=None, end_date=None):
         """Collect raw solar data from SolarEdge
 
         Collects data using the SolarEdge API, storing it in the database.
+
+        Daily totals are collected first, a year per request, so daily exports
+        are usable after a handful of requests. Quarter hour detail is then
+        collected a month per request for the days that do not have it yet,
+        newest first. If the ``detail_requests`` option limits how many of
+        those requests a run may make, the rest of the detail is collected by
+        later runs.
         
         Parameters
         ----------
@@ -54,34 +87,266 @@ class Solar:
         if end_date is None:
             end_date = self.default_end
 
-        cur = self.conn.cursor()
+        self.collect_daily(start_date, end_date)
+        self.collect_detail(start_date, end_date)
 
-        # Iterate through each date range
-        for interval in netzero.util.time_intervals(start_date, end_date, days=30):
-            netzero.util.print_status(
-                "SolarEdge",
-                "Collecting: {} to {}".format(
-                    interval[0].strftime("%Y-%m-%d"), interval[1].strftime("%Y-%m-%d")
-                ),
+        netzero.util.print_status("SolarEdge", "Complete", newline=True)
+
+    def collect_daily(self, start_date, end_date):
+        """Collects the daily totals of a date range into solaredge_daily"""
+
+        def fetch(interval):
+            print_interval("Collecting daily totals", interval)
+            return self.query_api(interval[0], interval[1], "DAY")
+
+        # The API allows a year of daily totals per request
+        intervals = netzero.util.time_intervals(start_date, end_date, days=365)
+
+        with self.recording_daily():
+            pipeline = netzero.collect.Pipeline(
+                self.name, intervals, self.pipeline["queue_size"]
             )
+            pipeline.map(fetch, self.pipeline["fetch_workers"])
+            pipeline.map(self.parse_daily, self.pipeline["parse_workers"], "parse")
+            pipeline.run(self.store_daily)
+
+    def collect_detail(self, start_date, end_date):
+        """Collects the quarter hour detail missing from a date range.
+
+        Days before the range which have daily totals but no detail yet are
+        collected as well, after the range itself.
+        """
+
+        def fetch(interval):
+            print_interval("Collecting", interval)
+            return self.query_api(interval[0], interval[1])
+
+        intervals = self.missing_detail(start_date, end_date)
+        if self.detail_requests is not None:
+            intervals = intervals[: self.detail_requests]
+
+        with self.recording_detail():
+            pipeline = netzero.collect.Pipeline(
+                self.name, intervals, self.pipeline["queue_size"]
+            )
+            pipeline.map(fetch, self.pipeline["fetch_workers"])
+            pipeline.map(self.parse, self.pipeline["parse_workers"], phase="parse")
+            pipeline.run(self.store_detail)
+
+    @classmethod
+    def collect_bulk(cls, sources, start_date=None, end_date=None):
+        """Collects several sites with as few requests as possible.
+
+        The SolarEdge API returns the energy of up to `bulk_size` sites in one
+        request, so sites sharing an API key are collected together rather
+        than one request per site and date range. Each site's rows are still
+        written to the database of its own source.
+
+        Parameters
+        ----------
+        sources : list of Solar
+            The sources of the sites to collect
+        start_date : datetime.date, optional
+            The start of the time interval to collect data for
+        end_date : datetime.date, optional
+            The end of the time interval to collect data for
+        """
+        if start_date is None:
+            start_date = cls.default_start
+        if end_date is None:
+            end_date = cls.default_end
+
+        groups = {}
+        for source in sources:
+            groups.setdefault((source.api_key, source.base_url), []).append(source)
 
-            result = self.query_api(interval[0], interval[1])
+        for group in groups.values():
+            for i in range(0, len(group), cls.bulk_size):
+                cls.collect_group(group[i : i + cls.bulk_size], start_date, end_date)
 
-            for entry in result["energy"]["values"]:
-                date = datetime.datetime.strptime(entry["date"], "%Y-%m-%d %H:%M:%S")
-                value = entry["value"] or 0
+        netzero.util.print_status("SolarEdge", "Complete", newline=True)
+
+    @classmethod
+    def collect_group(cls, sources, start_date, end_date):
+        """Collects sites sharing an API key with one request per date range."""
+        sites = {source.site_id: source for source in sources}
+        first = sources[0]
+
+        def fetch(work):
+            interval, site_ids, time_unit = work
+            label = "Collecting" if time_unit != "DAY" else "Collecting daily totals"
+            print_interval("{} of {} sites".format(label, len(site_ids)), interval)
+            return first.query_bulk(site_ids, interval[0], interval[1], time_unit)
+
+        def parse(results, daily):
+            convert = first.parse_daily if daily else first.parse
+            return [
+                (sites[site_id], convert(result)) for site_id, result in results.items()
+            ]
 
-                cur.execute(
-                    "INSERT OR IGNORE INTO solaredge VALUES (?, ?)", (date, value)
+        def store(batch, daily):
+            for source, rows in batch:
+                if daily:
+                    source.store_daily(rows)
+                else:
+                    source.store_detail(rows)
+
+        def run(work, daily, recording):
+            with contextlib.ExitStack() as stack:
+                for source in sources:
+                    stack.enter_context(recording(source))
+
+                pipeline = netzero.collect.Pipeline(
+                    cls.name, work, first.pipeline["queue_size"]
                 )
+                pipeline.map(fetch, first.pipeline["fetch_workers"])
+                pipeline.map(
+                    lambda results: parse(results, daily),
+                    first.pipeline["parse_workers"],
+                    phase="parse",
+                )
+                pipeline.run(lambda batch: store(batch, daily))
+
+        # Every site needs the same daily totals
+        intervals = netzero.util.time_intervals(start_date, end_date, days=365)
+        run(
+            [(interval, list(sites), "DAY") for interval in intervals],
+            True,
+            cls.recording_daily,
+        )
+
+        # Sites with the same gaps in their detail share requests
+        needed = {}
+        for source in sources:
+            intervals = source.missing_detail(start_date, end_date)
+            if source.detail_requests is not None:
+                intervals = intervals[: source.detail_requests]
+
+            for interval in intervals:
+                needed.setdefault(interval, []).append(source.site_id)
+
+        run(
+            [
+                (interval, site_ids, "QUARTER_OF_AN_HOUR")
+                for interval, site_ids in sorted(needed.items(), reverse=True)
+            ],
+            False,
+            cls.recording_detail,
+        )
+
+    @contextlib.contextmanager
+    def recording_daily(self):
+        """Records the daily totals written in the body of the with statement."""
+        changes = self.conn.total_changes
+        row_count = self.conn.execute(
+            "SELECT count(*) FROM solaredge_daily"
+        ).fetchone()[0]
+
+        yield
 
+        inserted = (
+            self.conn.execute("SELECT count(*) FROM solaredge_daily").fetchone()[0]
+            - row_count
+        )
+        updated = self.conn.total_changes - changes - inserted
+
+        netzero.db.record_collection(
+            self.conn, "solaredge_daily", "solaredge_daily", "date", inserted, updated
+        )
+        # Exports of this source are computed from the daily totals
+        if inserted or updated:
+            netzero.db.bump_version(self.conn, self.name)
+
+    @contextlib.contextmanager
+    def recording_detail(self):
+        """Records the detail written in the body of the with statement."""
+        changes = self.conn.total_changes
+
+        yield
+
+        netzero.db.record_collection(
+            self.conn, self.name, "solaredge", "time", self.conn.total_changes - changes
+        )
+
+    def store_daily(self, rows):
+        # The total of the last day grows until the day is over
+        with netzero.instrument.phase(self.name, "write"):
+            self.conn.executemany(
+                """
+                INSERT INTO solaredge_daily VALUES (?, ?)
+                ON CONFLICT (date) DO UPDATE SET watt_hrs = excluded.watt_hrs
+                WHERE watt_hrs IS NOT excluded.watt_hrs""",
+                rows,
+            )
             self.conn.commit()
 
-        cur.close()
+    def store_detail(self, rows):
+        with netzero.instrument.phase(self.name, "write"):
+            rows = netzero.db.skip_downsampled(self.conn, self.name, rows)
+            self.conn.executemany("INSERT OR IGNORE INTO solaredge VALUES (?, ?)", rows)
+            self.conn.commit()
 
-        netzero.util.print_status("SolarEdge", "Complete", newline=True)
+    def missing_detail(self, start_date, end_date):
+        """Finds the date ranges that still need quarter hour detail.
+
+        Returns
+        -------
+        A list of date ranges of at most 30 days, the latest first. The last
+        day with detail is always collected again because it may have only
+        been partially available.
+        """
+        first_daily = netzero.db.date_bounds(self.conn, "solaredge_daily")[0]
+        if first_daily is not None and first_daily < start_date:
+            start_date = first_daily
+
+        # Compacted days have hourly detail that must not be collected again
+        compacted = netzero.db.downsampled_before(self.conn, self.name)
+        if compacted is not None and start_date < compacted:
+            start_date = compacted
+
+        present = {
+            datetime.date.fromisoformat(row[0])
+            for row in self.conn.execute(
+                """
+                SELECT DISTINCT date(time) FROM solaredge
+                WHERE time >= date(:start) AND time < date(:end, '+1 day')""",
+                {"start": start_date, "end": end_date},
+            )
+        }
+        last = max(present, default=None)
+
+        # Group the days without detail into runs of consecutive days
+        runs = []
+        for day in netzero.util.iter_days(start_date, end_date):
+            if day in present and day != last:
+                continue
+
+            if runs and runs[-1][1] == day - datetime.timedelta(days=1):
+                runs[-1][1] = day
+            else:
+                runs.append([day, day])
+
+        # The API allows a month of quarter hour detail per request
+        intervals = []
+        for run_start, run_end in runs:
+            intervals.extend(netzero.util.time_intervals(run_start, run_end, days=30))
 
-    def query_api(self, start_date, end_date):
+        return intervals[::-1]
+
+    def parse(self, result, unit="s"):
+        """Converts an API response into rows of the solaredge table"""
+        values = result["energy"]["values"]
+
+        times = netzero.util.format_times([entry["date"] for entry in values], unit)
+        energy = [entry["value"] or 0 for entry in values]
+
+        return list(zip(times, energy))
+
+    def parse_daily(self, result):
+        """Converts an API response into rows of the solaredge_daily table"""
+        return self.parse(result, unit="D")
+
+    def query_api(self, start_date, end_date, time_unit="QUARTER_OF_AN_HOUR"):
         """A method to query the Solar Edge api for energy data
 
         Parameters
@@ -90,6 +355,9 @@ class Solar:
             The start of the time interval to query the api for
         end_date : datetime.date
             The end of the time interval to query the api for
+        time_unit : str
+            "QUARTER_OF_AN_HOUR" for detail, limited to a month per request, or
+            "DAY" for daily totals, limited to a year per request
 
         Returns
         -------
@@ -113,57 +381,152 @@ class Solar:
             "endDate": end_date.strftime("%Y-%m-%d"),
             # Even though we condense this data down to a daily sum we still want to
             # collect as much data as possible because perhaps it may some day be
-            # useful. Because of this we do quarter of an hour
-            "timeUnit": "QUARTER_OF_AN_HOUR",
+            # useful. Because of this we do quarter of an hour after the totals
+            "timeUnit": time_unit,
+        }
+        data = netzero.web.request(
+            self.session,
+            self.name,
+            "GET",
+            self.base_url + "/site/" + self.site_id + "/energy.json",
+            params=payload,
+        )
+
+        with netzero.instrument.phase(self.name, "parse"):
+            return json.loads(data.text)
+
+    def query_bulk(self, site_ids, start_date, end_date, time_unit):
+        """Queries the energy of several sites in one request.
+
+        Parameters
+        ----------
+        site_ids : list of str
+            The sites to query, at most `bulk_size` of them
+        start_date : datetime.date
+            The start of the time interval to query the api for
+        end_date : datetime.date
+            The end of the time interval to query the api for
+        time_unit : str
+            "QUARTER_OF_AN_HOUR" or "DAY", see `query_api`
+
+        Returns
+        -------
+        A dict with a response in the format of `query_api` for each site ID.
+        """
+        payload = {
+            "api_key": self.api_key,
+            "startDate": start_date.strftime("%Y-%m-%d"),
+            "endDate": end_date.strftime("%Y-%m-%d"),
+            "timeUnit": time_unit,
         }
-        data = requests.get(
-            "https://monitoringapi.solaredge.com/site/" + self.site_id + "/energy.json",
+        data = netzero.web.request(
+            self.session,
+            self.name,
+            "GET",
+            self.base_url + "/sites/" + ",".join(site_ids) + "/energy",
             params=payload,
         )
-        return json.loads(data.text)
+
+        with netzero.instrument.phase(self.name, "parse"):
+            result = json.loads(data.text)
+
+        # {"sitesEnergy": {"siteEnergyList": [{"siteId": _, "energyValues": {
+        #     "values": [{"date": "YYYY-MM-DD HH:MM:SS", "value": _}, ...]}}]}}
+        return {
+            str(site["siteId"]): {"energy": site["energyValues"]}
+            for site in result["sitesEnergy"]["siteEnergyList"]
+        }
+
+    def compact(self, before):
+        """Replaces the quarter hours before a date with hourly totals
+
+        The daily totals are kept as they are.
+
+        Returns
+        -------
+        The number of rows removed.
+        """
+        return netzero.db.downsample(
+            self.conn, self.name, "solaredge", before, netzero.util.hourly_totals
+        )
+
+    def check(self):
+        """Checks the quarter hours and daily totals for gaps and other issues
+
+        Intervals the API reports as null are stored as zero, so nights are
+        zeros and a whole day of them hides missing data.
+
+        Returns
+        -------
+        A list of issues, see `netzero.check.scan`.
+        """
+        detail = netzero.check.scan(
+            self.conn,
+            "solaredge",
+            "watt_hrs",
+            step=datetime.timedelta(minutes=15),
+            flat=datetime.timedelta(hours=2),
+            flat_zero=datetime.timedelta(days=1),
+            low=0,
+            since=netzero.db.downsampled_before(self.conn, self.name),
+        )
+        daily = netzero.check.scan(
+            self.conn,
+            "solaredge_daily",
+            "watt_hrs",
+            time="date",
+            unit="D",
+            step=datetime.timedelta(days=1),
+            flat_zero=datetime.timedelta(days=2),
+            low=0,
+        )
+
+        return detail + daily
 
     def min_date(self):
-        result = self.conn.execute("SELECT date(min(time)) FROM solaredge").fetchone()[
-            0
+        dates = [
+            netzero.db.date_bounds(self.conn, source)[0]
+            for source in [self.name, "solaredge_daily"]
         ]
-
-        if result is None:
-            return None
-        else:
-            return datetime.datetime.strptime(result, "%Y-%m-%d").date()
+        return min([date for date in dates if date is not None], default=None)
 
     def max_date(self):
-        result = self.conn.execute("SELECT date(max(time)) FROM solaredge").fetchone()[
-            0
+        dates = [
+            netzero.db.date_bounds(self.conn, source)[1]
+            for source in [self.name, "solaredge_daily"]
         ]
-
-        if result is None:
-            return None
-        else:
-            return datetime.datetime.strptime(result, "%Y-%m-%d").date()
+        return max([date for date in dates if date is not None], default=None)
 
     def format(self, start_date, end_date):
         netzero.util.print_status("SolarEdge", "Querying Database")
 
+        netzero.db.ensure_calendar(self.conn, start_date, end_date)
+
+        # The quarter hours are only read for days without a daily total
         data = self.conn.execute(
             """
-            WITH RECURSIVE
-                range(d) AS (
-                    SELECT date(?)
-                    UNION ALL
-                    SELECT date(d, '+1 day')
-                    FROM range
-                    WHERE range.d <= date(?)
-                ),
-                data(d, v) AS (
-                    SELECT date(time), SUM(watt_hrs) / 1000
-                    FROM solaredge
-                    GROUP BY date(time)
-                )
-            SELECT v FROM range NATURAL LEFT JOIN data""",
-            (start_date, end_date),
+            SELECT coalesce(daily.watt_hrs, SUM(detail.watt_hrs)) / 1000
+            FROM calendar
+            LEFT JOIN solaredge_daily AS daily ON daily.date = day
+            LEFT JOIN solaredge AS detail
+                ON daily.date IS NULL
+                AND detail.time >= day
+                AND detail.time < date(day, '+1 day')
+            WHERE day BETWEEN date(:start) AND date(:end)
+            GROUP BY day
+            ORDER BY day""",
+            {"start": start_date, "end": end_date},
         )
 
         netzero.util.print_status("SolarEdge", "Complete", newline=True)
 
         return data
+
+
+def print_interval(message, interval):
+    netzero.util.print_status(
+        "SolarEdge",
+        "{}: {} to {}".format(
+            message, interval[0].strftime("%Y-%m-%d"), interval[1].strftime("%Y-%m-%d")
+        ),
+    )
@@ -1,15 +1,19 @@
 import datetime
 import json
 import os
-import requests
-import sqlite3
 
+import netzero.check
+import netzero.collect
+import netzero.db
+import netzero.instrument
 import netzero.util
+import netzero.web
 
 
 class Weather:
     name = "weather"
     summary = "NOAA weather data"
+    rollup = "mean"
 
     default_start = datetime.date(2014, 1, 1)
     default_end = datetime.date.today()
@@ -21,12 +25,18 @@ class Weather:
 
         self.api_key = config["weather"]["api_key"]
         self.stations = json.loads(config["weather"]["stations"])
+        self.base_url = config["weather"].get(
+            "base_url", "https://www.ncdc.noaa.gov/cdo-web/api/v2"
+        )
+        self.session = netzero.web.session()
+        self.pipeline = netzero.collect.pipeline_options(config, "weather")
 
-        self.conn = sqlite3.connect(database)
+        self.conn = netzero.db.connect(database)
 
         self.conn.execute(
             "CREATE TABLE IF NOT EXISTS weather (date DATE, temperature FLOAT, station TEXT, PRIMARY KEY (date, station))"
         )
+        netzero.db.create_metadata(self.conn, self.name, "weather", "date")
 
     def collect(self, start_date=None, end_date=None):
         """Collect the raw weather data from NCDC API
@@ -51,9 +61,7 @@ class Weather:
         if num_days > 365:
             num_days = 365
 
-        for interval in netzero.util.time_intervals(
-            start_date, end_date, days=num_days
-        ):
+        def fetch(interval):
             netzero.util.print_status(
                 "Weather",
                 "Collecting: {} to {}".format(
@@ -66,25 +74,107 @@ class Weather:
 
             if raw_data is None:
                 print("ERROR QUERYING API")  # TODO exception here?
-                continue
-
-            for entry in raw_data.get("results", []):
-                # Insert the weather data to the table, to be averaged later
-                date = datetime.datetime.strptime(
-                    entry["date"], "%Y-%m-%dT%H:%M:%S"
-                ).date()
-                value = entry["value"]
-                station = entry["station"]
-
-                cur.execute(
-                    "INSERT INTO weather VALUES (?, ?, ?)", (date, value, station)
-                )
+                netzero.instrument.count(self.name, "api_errors")
+
+            return raw_data
 
-            self.conn.commit()
+        counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+
+        def write(rows):
+            with netzero.instrument.phase(self.name, "write"):
+                for key, count in self.merge(cur, rows).items():
+                    counts[key] += count
+
+        intervals = netzero.util.time_intervals(start_date, end_date, days=num_days)
+
+        pipeline = netzero.collect.Pipeline(
+            self.name, intervals, self.pipeline["queue_size"]
+        )
+        pipeline.map(fetch, self.pipeline["fetch_workers"])
+        pipeline.map(self.parse, self.pipeline["parse_workers"], phase="parse")
+        pipeline.run(write)
 
         cur.close()
 
-        netzero.util.print_status("Weather", "Complete", newline=True)
+        netzero.db.record_collection(
+            self.conn,
+            self.name,
+            "weather",
+            "date",
+            counts["inserted"],
+            counts["updated"],
+        )
+        netzero.instrument.count(self.name, "rows_unchanged", counts["unchanged"])
+
+        netzero.util.print_status(
+            "Weather",
+            "Complete: {inserted} inserted, {updated} updated, {unchanged} unchanged".format(
+                **counts
+            ),
+            newline=True,
+        )
+
+    def merge(self, cur, rows):
+        """Merges a batch of rows into the weather table.
+
+        The rows are loaded into a staging table and merged with a single upsert,
+        so collecting a range again updates the temperatures that changed
+        instead of failing on the rows already there.
+
+        Returns
+        -------
+        A dict with the number of rows ``inserted``, ``updated`` and
+        ``unchanged``.
+        """
+        # Temporary tables belong to the connection and never touch the database
+        cur.execute(
+            """
+            CREATE TEMP TABLE IF NOT EXISTS weather_staging (
+                date DATE, temperature FLOAT, station TEXT, PRIMARY KEY (date, station)
+            )"""
+        )
+        cur.execute("DELETE FROM weather_staging")
+        cur.executemany("INSERT OR REPLACE INTO weather_staging VALUES (?, ?, ?)", rows)
+
+        staged, inserted, updated = cur.execute(
+            """
+            SELECT
+                count(*),
+                count(*) FILTER (WHERE weather.date IS NULL),
+                count(*) FILTER (
+                    WHERE weather.date IS NOT NULL
+                    AND weather.temperature IS NOT staging.temperature
+                )
+            FROM weather_staging AS staging
+            LEFT JOIN weather USING (date, station)"""
+        ).fetchone()
+
+        # WHERE true tells the parser the ON CONFLICT belongs to the INSERT
+        cur.execute(
+            """
+            INSERT INTO weather
+            SELECT date, temperature, station FROM weather_staging WHERE true
+            ON CONFLICT (date, station) DO UPDATE SET temperature = excluded.temperature
+            WHERE temperature IS NOT excluded.temperature"""
+        )
+        self.conn.commit()
+
+        return {
+            "inserted": inserted,
+            "updated": updated,
+            "unchanged": staged - inserted - updated,
+        }
+
+    def parse(self, raw_data):
+        """Converts an API response into rows of the weather table"""
+        results = raw_data.get("results", [])
+
+        # Insert the weather data to the table, to be averaged later
+        dates = netzero.util.format_times([entry["date"] for entry in results], "D")
+        values = [entry["value"] for entry in results]
+        stations = [entry["station"] for entry in results]
+
+        return list(zip(dates, values, stations))
 
     def query_api(self, start_date, end_date):
         """Query the NCDC API for average daily temperature data
@@ -119,54 +209,62 @@ class Weather:
             "enddate": end_date.strftime("%Y-%m-%d"),
         }
 
-        response = requests.get(
-            "https://www.ncdc.noaa.gov/cdo-web/api/v2/data",
+        response = netzero.web.request(
+            self.session,
+            self.name,
+            "GET",
+            self.base_url + "/data",
             headers=headers,
             params=params,
         )
 
         if response.ok:
-            return response.json()
+            with netzero.instrument.phase(self.name, "parse"):
+                return response.json()
         else:
             print(response.text)
             return None
 
-    def min_date(self):
-        result = self.conn.execute("SELECT min(date) FROM weather").fetchone()[0]
+    def check(self):
+        """Checks each station's temperatures for missing days and outliers
 
-        if result is None:
-            return None
-        else:
-            return datetime.datetime.strptime(result, "%Y-%m-%d").date()
+        Returns
+        -------
+        A list of issues, see `netzero.check.scan`.
+        """
+        return netzero.check.scan(
+            self.conn,
+            "weather",
+            "temperature",
+            time="date",
+            unit="D",
+            key="station",
+            step=datetime.timedelta(days=1),
+            flat=datetime.timedelta(days=5),
+            low=-80,
+            high=140,
+        )
 
-    def max_date(self):
-        result = self.conn.execute("SELECT max(date) FROM weather").fetchone()[0]
+    def min_date(self):
+        return netzero.db.date_bounds(self.conn, self.name)[0]
 
-        if result is None:
-            return None
-        else:
-            return datetime.datetime.strptime(result, "%Y-%m-%d").date()
+    def max_date(self):
+        return netzero.db.date_bounds(self.conn, self.name)[1]
 
     def format(self, start_date, end_date):
         netzero.util.print_status("Weather", "Querying Database")
 
+        netzero.db.ensure_calendar(self.conn, start_date, end_date)
+
         data = self.conn.execute(
             """
-            WITH RECURSIVE
-                range(d) AS (
-                    SELECT date(?)
-                    UNION ALL
-                    SELECT date(d, '+1 day')
-                    FROM range
-                    WHERE range.d <= date(?)
-                ),
-                data(d, v) AS (
-                    SELECT date, AVG(temperature)
-                    FROM weather
-                    GROUP BY date
-                )
-            SELECT v FROM range NATURAL LEFT JOIN data""",
-            (start_date, end_date),
+            SELECT AVG(temperature)
+            FROM calendar
+            LEFT JOIN weather ON date = day
+            WHERE day BETWEEN date(:start) AND date(:end)
+            GROUP BY day
+            ORDER BY day""",
+            {"start": start_date, "end": end_date},
         )
 
         netzero.util.print_status("Weather", "Complete", newline=True)
@@ -0,0 +1,90 @@
+"""Cache of exported data stored alongside the collected data.
+
+Each entry holds the exported columns for one set of sources, date range and
+resolution. Entries remember the data version of every source they were
+computed from, so they stop being used as soon as `collect` writes new rows
+for any of those sources.
+"""
+import json
+import sqlite3
+
+# Number of entries kept before the least recently used ones are dropped
+max_entries = 64
+
+# Days before a hit marks an entry as used again, so most hits only read
+touch_after = 1 / 24
+
+
+def key(sources, start_date, end_date, resolution="day"):
+    return json.dumps(
+        [list(sources), start_date.isoformat(), end_date.isoformat(), resolution]
+    )
+
+
+def load(conn, key, versions):
+    """Looks up the cached columns for ``key``.
+
+    Returns
+    -------
+    The cached columns, or None if there is no entry for ``key`` or it was
+    computed from different data versions.
+    """
+    create_table(conn)
+
+    row = conn.execute(
+        """
+        SELECT versions, columns, used < julianday('now') - ?
+        FROM format_cache WHERE key = ?""",
+        (touch_after, key),
+    ).fetchone()
+
+    if row is None or json.loads(row[0]) != list(versions):
+        return None
+
+    # Only decides which entries are dropped first, so it is skipped rather
+    # than waited for while another process is writing
+    if row[2]:
+        try:
+            conn.execute(
+                "UPDATE format_cache SET used = julianday('now') WHERE key = ?",
+                (key,),
+            )
+            conn.commit()
+        except sqlite3.OperationalError:
+            conn.rollback()
+
+    return json.loads(row[1])
+
+
+def store(conn, key, versions, columns):
+    """Caches the columns exported for ``key``.
+
+    Nothing is cached if the database stays locked by another process, the
+    columns are still good to export.
+    """
+    try:
+        create_table(conn)
+
+        conn.execute(
+            "INSERT OR REPLACE INTO format_cache VALUES (?, ?, ?, julianday('now'))",
+            (key, json.dumps(list(versions)), json.dumps(columns)),
+        )
+        conn.execute(
+            """
+            DELETE FROM format_cache WHERE key NOT IN (
+                SELECT key FROM format_cache ORDER BY used DESC LIMIT ?
+            )""",
+            (max_entries,),
+        )
+        conn.commit()
+    except sqlite3.OperationalError:
+        conn.rollback()
+
+
+def create_table(conn):
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS format_cache (
+            key TEXT PRIMARY KEY, versions TEXT, columns TEXT, used REAL
+        )"""
+    )
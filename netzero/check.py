@@ -0,0 +1,496 @@
+"""Data-quality checks of the readings collected by each source.
+
+`netzero check` reads the raw tables of each source as NumPy arrays and looks
+for problems that would otherwise only show up as odd values in an export:
+
+    gap         no readings for longer than usual
+    flat        one value repeated for longer than is plausible
+    outlier     values outside the plausible range, or far from both neighbours
+    irregular   readings closer together than usual, or off the usual interval
+    duplicate   readings of the hour that happens twice when daylight saving
+                time ends, which their local times cannot tell apart
+
+Every check is a whole-array operation, so millions of readings take seconds.
+The issues found replace those found before in the quality_issues table, with
+the first and last reading of each, where they can be picked up by anything
+that fills in or works around the missing data (see `issues`).
+
+Readings already downsampled by `netzero compact` are not checked.
+"""
+
+import collections
+import datetime
+import sqlite3
+import time
+
+import netzero.config
+import netzero.db
+import netzero.sources
+import netzero.util
+
+# How many times the usual largest change between readings (the 99th
+# percentile) a reading must stand out from both neighbours to be an outlier
+spike_factor = 4
+
+kinds = ["gap", "flat", "outlier", "irregular", "duplicate"]
+
+
+def add_args(parser):
+    netzero.sources.add_args(parser)
+    netzero.db.add_args(parser)
+    netzero.config.add_args(parser)
+
+    parser.add_argument(
+        "-l",
+        "--list",
+        help="list every issue found instead of only counting them",
+        dest="list",
+        action="store_true",
+    )
+
+
+def main(arguments):
+    if not hasattr(arguments, "sources") or arguments.sources is None:
+        print("No sources specified, nothing to check")
+        return
+
+    config = netzero.config.load_config(arguments.config)
+
+    sources = [source(config, arguments.database) for source in arguments.sources]
+
+    found = []
+    for source in sources:
+        if not hasattr(source, "check"):
+            netzero.util.print_status(source.name, "Nothing to check", newline=True)
+            source.conn.close()
+            continue
+
+        netzero.util.print_status(source.name, "Checking readings")
+
+        issues = source.check()
+        record(source.conn, source.name, issues)
+
+        counts = collections.Counter(issue[1] for issue in issues)
+        summary = ", ".join(
+            "{} {}".format(counts[kind], kind) for kind in kinds if counts[kind]
+        )
+        netzero.util.print_status(
+            source.name,
+            "Found {} issues{}".format(len(issues), summary and ": " + summary),
+            newline=True,
+        )
+
+        found.extend((source.name,) + issue for issue in issues)
+        source.conn.close()
+
+    if arguments.list and found:
+        header = ("source", "series", "kind", "first", "last", "detail")
+        netzero.util.print_table(header, found)
+
+
+def scan(
+    conn,
+    table,
+    column,
+    time="time",
+    unit="s",
+    key=None,
+    step=None,
+    gap=None,
+    flat=None,
+    flat_zero=None,
+    low=None,
+    high=None,
+    since=None,
+):
+    """Checks the readings of one column of a table.
+
+    Parameters
+    ----------
+    table : str
+        The table of readings
+    column : str
+        The column of values to check
+    time : str
+        The column of times
+    unit : str
+        "s" if the times are times of day, or "D" if they are dates
+    key : str, optional
+        A column that splits the table into series checked one by one, like
+        the station of each temperature
+    step : datetime.timedelta, optional
+        The usual interval between readings, by default the most common one
+    gap : datetime.timedelta, optional
+        The longest interval without readings that is not a gap, by default
+        ``step``
+    flat : datetime.timedelta, optional
+        How long a value other than zero must be repeated to be an issue
+    flat_zero : datetime.timedelta, optional
+        How long zero must be repeated to be an issue
+    low : float, optional
+        The lowest plausible value
+    high : float, optional
+        The highest plausible value
+    since : datetime.date, optional
+        The first day to check
+
+    Returns
+    -------
+    A list of ``(series, kind, first_time, last_time, detail)`` issues, where
+    the series is the table or, with ``key``, the key.
+    """
+    import numpy
+
+    times, values, keys = load(conn, table, column, time, key, since)
+
+    if keys is None:
+        series = [(table, 0, len(times))]
+    elif not len(keys):
+        series = []
+    else:
+        bounds = numpy.flatnonzero(keys[1:] != keys[:-1]) + 1
+        starts = numpy.concatenate(([0], bounds))
+        ends = numpy.concatenate((bounds, [len(keys)]))
+        series = [(keys[a], a, b) for a, b in zip(starts, ends)]
+
+    issues = []
+    for name, start, end in series:
+        t = times[start:end]
+        v = values[start:end]
+        if len(t) < 2:
+            continue
+
+        usual = find_step(t) if step is None else int(step.total_seconds())
+        longest = usual if gap is None else int(gap.total_seconds())
+
+        found = find_gaps(t, longest, unit)
+        found += find_flat(t, v, seconds(flat), seconds(flat_zero))
+        found += find_outliers(t, v, low, high)
+        found += find_irregular(t, usual, longest)
+        if unit == "s":
+            found += find_duplicates(conn, t, usual)
+
+        found.sort(key=lambda issue: issue[1])
+
+        first = format_times([issue[1] for issue in found], unit)
+        last = format_times([issue[2] for issue in found], unit)
+        for (kind, _, _, detail), a, b in zip(found, first, last):
+            issues.append((str(name), kind, a, b, detail))
+
+    return issues
+
+
+def load(conn, table, column, time="time", key=None, since=None):
+    """Reads the readings of a table as arrays, in order.
+
+    SQLite joins each column into one string which NumPy splits, which is
+    faster than fetching a tuple for every row and takes a fraction of the
+    memory.
+
+    Returns
+    -------
+    A tuple of the times as int64 seconds from 1970 in local time, the values
+    as float64 with NaN for NULL, and the keys as an array of strings or None
+    without ``key``. They are ordered by key then time.
+    """
+    import numpy
+
+    columns = [
+        "group_concat({})".format(time),
+        "group_concat(coalesce({}, 'nan'))".format(column),
+    ]
+    if key is not None:
+        # Keys come from the configuration and could have commas in them
+        columns.append("group_concat({}, char(31))".format(key))
+
+    query = "SELECT {} FROM {}".format(", ".join(columns), table)
+    parameters = {}
+    if since is not None:
+        query += " WHERE {} >= :since".format(time)
+        parameters["since"] = since.isoformat()
+
+    result = conn.execute(query, parameters).fetchone()
+
+    if result[0] is None:
+        empty = numpy.array([], dtype=numpy.int64)
+        keys = None if key is None else numpy.array([], dtype=str)
+        return empty, empty.astype(numpy.float64), keys
+
+    times = numpy.array(result[0].split(","), "M8[s]").astype(numpy.int64)
+    values = numpy.array(result[1].split(","), dtype=numpy.float64)
+
+    if key is None:
+        order = numpy.argsort(times, kind="stable")
+        return times[order], values[order], None
+
+    keys = numpy.array(result[2].split(chr(31)))
+    order = numpy.lexsort((times, keys))
+
+    return times[order], values[order], keys[order]
+
+
+def find_step(times):
+    """Finds the most common interval between readings, in seconds."""
+    import numpy
+
+    intervals, counts = numpy.unique(numpy.diff(times), return_counts=True)
+
+    return int(intervals[numpy.argmax(counts)])
+
+
+def find_gaps(times, longest, unit="s"):
+    import numpy
+
+    issues = []
+    for i in numpy.flatnonzero(numpy.diff(times) > longest):
+        start, end = int(times[i]), int(times[i + 1])
+
+        # The hour skipped when daylight saving time starts is not a gap
+        if unit == "s":
+            length = elapsed(start, end)
+        else:
+            length = end - start
+
+        if length > longest:
+            detail = "no readings for {}".format(describe(length))
+            issues.append(("gap", start, end, detail))
+
+    return issues
+
+
+def find_flat(times, values, flat=None, flat_zero=None):
+    import numpy
+
+    if flat is None and flat_zero is None:
+        return []
+
+    first, last = runs(values[1:] == values[:-1])
+    if not len(first):
+        return []
+
+    # A run of equal intervals covers the reading after its last interval
+    last = last + 1
+    lengths = times[last] - times[first]
+    repeated = values[first]
+
+    limits = numpy.where(
+        repeated == 0,
+        numpy.inf if flat_zero is None else flat_zero,
+        numpy.inf if flat is None else flat,
+    )
+
+    issues = []
+    for i in numpy.flatnonzero(lengths >= limits):
+        detail = "{:g} for {}".format(repeated[i], describe(lengths[i]))
+        issues.append(("flat", int(times[first[i]]), int(times[last[i]]), detail))
+
+    return issues
+
+
+def find_outliers(times, values, low=None, high=None):
+    import numpy
+
+    outside = numpy.zeros(len(values), dtype=bool)
+    if low is not None:
+        outside |= values < low
+    if high is not None:
+        outside |= values > high
+
+    changes = numpy.abs(numpy.diff(values))
+    changes = changes[~numpy.isnan(changes)]
+
+    if len(values) > 2 and len(changes):
+        threshold = spike_factor * numpy.percentile(changes, 99)
+
+        before = values[1:-1] - values[:-2]
+        after = values[1:-1] - values[2:]
+
+        # Readings that jump the same way away from both neighbours
+        with numpy.errstate(invalid="ignore"):
+            outside[1:-1] |= (
+                (numpy.sign(before) == numpy.sign(after))
+                & (numpy.minimum(numpy.abs(before), numpy.abs(after)) > threshold)
+                & (threshold > 0)
+            )
+
+    issues = []
+    for start, end in zip(*runs(outside)):
+        run = values[start : end + 1]
+        if len(run) == 1:
+            detail = "{:g}".format(run[0])
+        else:
+            detail = "{} readings from {:g} to {:g}".format(
+                len(run), run.min(), run.max()
+            )
+
+        issues.append(("outlier", int(times[start]), int(times[end]), detail))
+
+    return issues
+
+
+def find_irregular(times, step, longest):
+    import numpy
+
+    intervals = numpy.diff(times)
+
+    # Timestamps jitter a little, a tenth of the interval is still on time
+    slack = step // 10
+    off = intervals % step
+    off = numpy.minimum(off, step - off)
+
+    odd = (intervals < step - slack) | ((off > slack) & (intervals <= longest))
+
+    issues = []
+    for start, end in zip(*runs(odd)):
+        detail = "{} intervals off every {}".format(end - start + 1, describe(step))
+        issues.append(("irregular", int(times[start]), int(times[end + 1]), detail))
+
+    return issues
+
+
+def find_duplicates(conn, times, step):
+    import numpy
+
+    issues = []
+    for hour in repeated_hours(conn, int(times[0]), int(times[-1])):
+        start, end = numpy.searchsorted(times, [hour, hour + 3600])
+        if start == end:
+            continue
+
+        detail = "{} readings for an hour that happened twice, {} expected".format(
+            end - start, 2 * 3600 // step
+        )
+        issues.append(("duplicate", int(times[start]), int(times[end - 1]), detail))
+
+    return issues
+
+
+def repeated_hours(conn, start, end):
+    """Finds the hours of local time that happen twice between two times.
+
+    Times are given and returned as seconds from 1970 in local time.
+    """
+    epoch = datetime.date(1970, 1, 1)
+    start_date = epoch + datetime.timedelta(seconds=start)
+    end_date = epoch + datetime.timedelta(seconds=end)
+
+    netzero.db.ensure_calendar(conn, start_date, end_date)
+
+    days = conn.execute(
+        "SELECT day FROM calendar WHERE hours = 25 AND day BETWEEN ? AND ?",
+        (start_date.isoformat(), end_date.isoformat()),
+    ).fetchall()
+
+    hours = []
+    for (day,) in days:
+        day = datetime.date.fromisoformat(day)
+        midnight = time.mktime(day.timetuple())
+
+        seen = set()
+        for i in range(25):
+            hour = time.localtime(midnight + 3600 * i).tm_hour
+            if hour in seen:
+                hours.append((day - epoch).days * 86400 + hour * 3600)
+            seen.add(hour)
+
+    return hours
+
+
+def elapsed(start, end):
+    """How many seconds really passed between two local times."""
+
+    def timestamp(local):
+        # Let mktime decide whether daylight saving time was in effect
+        return time.mktime(time.gmtime(local)[:8] + (-1,))
+
+    return int(timestamp(end) - timestamp(start))
+
+
+def runs(mask):
+    """Finds the runs of true values in a boolean array.
+
+    Returns
+    -------
+    Arrays of the first and last index of each run.
+    """
+    import numpy
+
+    edges = numpy.diff(numpy.concatenate(([0], mask.astype(numpy.int8), [0])))
+
+    return numpy.flatnonzero(edges == 1), numpy.flatnonzero(edges == -1) - 1
+
+
+def format_times(times, unit="s"):
+    """Formats seconds from 1970 in local time the way times are stored."""
+    import numpy
+
+    texts = numpy.datetime_as_string(numpy.array(times, dtype="M8[s]"))
+
+    return netzero.util.format_times(list(texts), unit)
+
+
+def describe(seconds):
+    """Describes a number of seconds, like "2 days" or "3:15:00"."""
+    days, rest = divmod(int(seconds), 86400)
+    if rest:
+        return str(datetime.timedelta(seconds=int(seconds)))
+
+    return "{} day{}".format(days, "" if days == 1 else "s")
+
+
+def seconds(duration):
+    return None if duration is None else int(duration.total_seconds())
+
+
+def record(conn, source, issues):
+    """Replaces the issues found in a source's readings by a new set."""
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS quality_issues (
+            source TEXT,
+            series TEXT,
+            kind TEXT,
+            first_time TIMESTAMP,
+            last_time TIMESTAMP,
+            detail TEXT
+        )"""
+    )
+    conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS quality_issues_source
+        ON quality_issues (source, kind, first_time)"""
+    )
+
+    conn.execute("DELETE FROM quality_issues WHERE source = ?", (source,))
+    conn.executemany(
+        "INSERT INTO quality_issues VALUES (?, ?, ?, ?, ?, ?)",
+        [(source,) + tuple(issue) for issue in issues],
+    )
+    conn.commit()
+
+
+def issues(conn, source, kind=None):
+    """Looks up the issues the last check found in a source's readings.
+
+    Parameters
+    ----------
+    source : str
+        The name of the source
+    kind : str, optional
+        Only look up issues of this kind, like "gap"
+
+    Returns
+    -------
+    A list of ``(series, kind, first_time, last_time, detail)`` tuples in order
+    of time. A gap's first and last time are those of the readings on either
+    side of it.
+    """
+    query = """
+        SELECT series, kind, first_time, last_time, detail FROM quality_issues
+        WHERE source = :source AND (:kind IS NULL OR kind = :kind)
+        ORDER BY first_time"""
+
+    try:
+        return conn.execute(query, {"source": source, "kind": kind}).fetchall()
+    except sqlite3.OperationalError:  # Nothing has been checked yet
+        return []
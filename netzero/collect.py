@@ -1,15 +1,25 @@
 import argparse
+import concurrent.futures
+import contextlib
 import datetime
+import queue
+import threading
 
 import netzero.sources
 import netzero.db
 import netzero.config
+import netzero.instrument
+import netzero.metrics
+import netzero.sites
 
 
 def add_args(parser):
     netzero.sources.add_args(parser)
     netzero.db.add_args(parser)
     netzero.config.add_args(parser)
+    netzero.instrument.add_args(parser)
+    netzero.metrics.add_args(parser)
+    netzero.sites.add_args(parser)
 
     parser.add_argument(
         "-s",
@@ -37,7 +47,266 @@ def main(arguments):
     config = netzero.config.load_config(arguments.config)
 
     # Load configurations into sources early so user can respond to errors
-    sources = [source(config, arguments.database) for source in arguments.sources]
+    sites = {}
+    for site in netzero.sites.select(config, arguments.sites):
+        site_config, database = netzero.sites.resolve(config, site, arguments.database)
+        sites[site] = [source(site_config, database) for source in arguments.sources]
 
-    for source in sources:
-        source.collect(arguments.start, arguments.end)
+    try:
+        if list(sites) == [None]:
+            for source in sites[None]:
+                collect(source, arguments.start, arguments.end)
+        else:
+            collect_sites(sites, arguments.start, arguments.end, arguments.jobs)
+    finally:
+        if arguments.metrics:
+            netzero.metrics.write_textfile(
+                arguments.metrics, arguments.database, list(sites)
+            )
+
+
+def collect_sites(sites, start_date, end_date, jobs):
+    """Collects several sites at the same time.
+
+    Sources with a ``collect_bulk`` class method collect all of their sites
+    with it, so they can share requests between sites. A site that fails does
+    not stop the others from being collected.
+    """
+    bulk = {}
+    single = {site: [] for site in sites}
+    for site, sources in sites.items():
+        for source in sources:
+            if hasattr(type(source), "collect_bulk"):
+                bulk.setdefault(type(source), []).append((site, source))
+            else:
+                single[site].append(source)
+
+    # A source with only one site has nothing to share
+    for source_class, members in list(bulk.items()):
+        if len(members) == 1:
+            site, source = members[0]
+            single[site].append(source)
+            del bulk[source_class]
+
+    def collect_site(sources):
+        for source in sources:
+            collect(source, start_date, end_date)
+
+    def collect_bulk(source_class, sources):
+        with netzero.instrument.phase(source_class.name, "total"):
+            try:
+                source_class.collect_bulk(sources, start_date, end_date)
+            except Exception:
+                netzero.instrument.count(source_class.name, "failures")
+                raise
+
+    # Each job is paired with the sites it collects
+    with concurrent.futures.ThreadPoolExecutor(jobs) as executor:
+        running = [
+            (
+                [site for site, source in members],
+                executor.submit(
+                    collect_bulk, source_class, [source for site, source in members]
+                ),
+            )
+            for source_class, members in bulk.items()
+        ]
+        running.extend(
+            ([site], executor.submit(collect_site, sources))
+            for site, sources in single.items()
+            if sources
+        )
+
+    failed = []
+    for job_sites, future in running:
+        if future.exception() is not None:
+            print(
+                "Collecting {} failed: {!r}".format(
+                    ", ".join(job_sites), future.exception()
+                )
+            )
+            failed.extend(site for site in job_sites if site not in failed)
+
+    if failed:
+        raise RuntimeError("Collection failed for {}".format(", ".join(failed)))
+
+
+def collect(source, start_date, end_date):
+    """Runs the collection of a single source, recording it in its statistics."""
+    with netzero.instrument.phase(source.name, "total"):
+        try:
+            source.collect(start_date, end_date)
+        except Exception:
+            netzero.instrument.count(source.name, "failures")
+            raise
+
+
+# Defaults for the pipeline options of a source
+pipeline_defaults = {"queue_size": 4, "fetch_workers": 1, "parse_workers": 1}
+
+
+def pipeline_options(config, entry):
+    """Reads the pipeline options of a source.
+
+    Options are read from the source's section of the configuration, then from
+    the ``[pipeline]`` section shared by all sources, then from
+    `pipeline_defaults`.
+    """
+    options = dict(pipeline_defaults)
+    for key in options:
+        for section in [entry, "pipeline"]:
+            if section in config and key in config[section]:
+                options[key] = config[section].getint(key)
+                break
+
+    return options
+
+
+class Pipeline:
+    """Streams work through stages connected by bounded queues.
+
+    Items are read lazily from ``items`` and passed through each stage added
+    with `map`, and every result of the last stage is handed to the sink given
+    to `run`. When a stage falls behind, the queue in front of it fills up and
+    the stages before it wait, so no more than ``queue_size`` items are ever
+    waiting between two stages however much work there is.
+
+    Each stage runs in its own threads and the sink runs in the thread that
+    called `run`, so sources can keep writing through their own connection.
+    Results are not kept in order.
+
+    Parameters
+    ----------
+    name : str
+        The name of the source, used for its statistics
+    items : iterable
+        The work to do, like the date ranges to request
+    queue_size : int
+        The number of items that may wait between two stages
+    phase : str, optional
+        The phase to record the time spent reading ``items`` under
+    """
+
+    done = object()
+
+    def __init__(self, name, items, queue_size=4, phase=None):
+        self.name = name
+        self.items = items
+        self.queue_size = queue_size
+        self.phase = phase
+        self.stages = []
+
+    def map(self, function, workers=1, phase=None):
+        """Adds a stage calling ``function`` on every item.
+
+        Results which are None are dropped.
+        """
+        self.stages.append((function, workers, phase))
+        return self
+
+    def run(self, sink):
+        """Runs the pipeline until every item has reached ``sink``.
+
+        The first exception raised by any stage stops the pipeline and is
+        raised again here.
+        """
+        stop = threading.Event()
+        errors = []
+
+        queues = [queue.Queue(self.queue_size) for stage in range(len(self.stages) + 1)]
+        # The number of workers reading from each queue, the sink reads the last
+        readers = [workers for function, workers, phase in self.stages] + [1]
+
+        def put(index, item):
+            while not stop.is_set():
+                try:
+                    queues[index].put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    pass
+
+        def timed(phase):
+            if phase is None:
+                return contextlib.nullcontext()
+            return netzero.instrument.phase(self.name, phase)
+
+        def feed():
+            try:
+                items = iter(self.items)
+                while not stop.is_set():
+                    with timed(self.phase):
+                        item = next(items, self.done)
+
+                    if item is self.done:
+                        break
+
+                    put(0, item)
+            except Exception as e:
+                errors.append(e)
+                stop.set()
+            finally:
+                for reader in range(readers[0]):
+                    put(0, self.done)
+
+        remaining = [workers for function, workers, phase in self.stages]
+        lock = threading.Lock()
+
+        def work(index, function, phase):
+            try:
+                while not stop.is_set():
+                    try:
+                        item = queues[index].get(timeout=0.1)
+                    except queue.Empty:
+                        continue
+
+                    if item is self.done:
+                        break
+
+                    with timed(phase):
+                        result = function(item)
+
+                    if result is not None:
+                        put(index + 1, result)
+            except Exception as e:
+                errors.append(e)
+                stop.set()
+            finally:
+                # The last worker of a stage tells the next stage it is done
+                with lock:
+                    remaining[index] -= 1
+                    last = remaining[index] == 0
+
+                if last:
+                    for reader in range(readers[index + 1]):
+                        put(index + 1, self.done)
+
+        threads = [threading.Thread(target=feed, daemon=True)]
+        for index, (function, workers, phase) in enumerate(self.stages):
+            for worker in range(workers):
+                threads.append(
+                    threading.Thread(
+                        target=work, args=(index, function, phase), daemon=True
+                    )
+                )
+
+        for thread in threads:
+            thread.start()
+
+        try:
+            while not stop.is_set():
+                try:
+                    item = queues[-1].get(timeout=0.1)
+                except queue.Empty:
+                    continue
+
+                if item is self.done:
+                    break
+
+                sink(item)
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+        if errors:
+            raise errors[0]
@@ -0,0 +1,102 @@
+"""Downsampling of old readings to keep the database from growing forever.
+
+How long each source's readings are kept as they were collected is set in the
+``[retention]`` section of the configuration:
+
+    [retention]
+    solaredge = 730d
+    gshp = 365d
+
+Older readings are replaced with one per hour by `netzero compact`, which
+leaves the daily values it exports unchanged. Sources that are not listed are
+never compacted.
+"""
+import datetime
+
+import netzero.config
+import netzero.db
+import netzero.sources
+import netzero.util
+
+
+def add_args(parser):
+    netzero.sources.add_args(parser)
+    netzero.db.add_args(parser)
+    netzero.config.add_args(parser)
+
+    parser.add_argument(
+        "--keep",
+        metavar="DURATION",
+        help="keep this much of every source's readings as they are, like 730d, "
+        "instead of what the [retention] section says",
+        dest="keep",
+        type=netzero.util.parse_duration,
+    )
+    parser.add_argument(
+        "--vacuum",
+        help="rebuild the database so freed space can be returned a little at a "
+        "time from then on, which locks it for as long as the rebuild takes and "
+        "is only needed once for databases created by older versions",
+        dest="vacuum",
+        action="store_true",
+    )
+
+
+def main(arguments):
+    if not hasattr(arguments, "sources") or arguments.sources is None:
+        print("No sources specified, nothing to compact")
+        return
+
+    config = netzero.config.load_config(arguments.config)
+
+    sources = [source(config, arguments.database) for source in arguments.sources]
+
+    retention = config["retention"] if "retention" in config else {}
+
+    for source in sources:
+        keep = arguments.keep
+        if keep is None and source.name in retention:
+            keep = netzero.util.parse_duration(retention[source.name])
+
+        if not hasattr(source, "compact"):
+            netzero.util.print_status(
+                source.name, "Nothing to downsample", newline=True
+            )
+        elif keep is None:
+            netzero.util.print_status(
+                source.name, "No retention configured", newline=True
+            )
+        else:
+            before = datetime.date.today() - keep
+            netzero.util.print_status(
+                source.name, "Downsampling readings before {}".format(before)
+            )
+
+            removed = source.compact(before)
+            netzero.util.print_status(
+                source.name, "Removed {} rows".format(removed), newline=True
+            )
+
+        source.conn.close()
+
+    conn = netzero.db.connect(arguments.database)
+
+    if arguments.vacuum:
+        netzero.util.print_status("Compact", "Rebuilding the database")
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
+
+    released = netzero.db.vacuum(conn)
+    if released is None:
+        netzero.util.print_status(
+            "Compact",
+            "Freed space is reused but not returned, run with --vacuum once to "
+            "return it",
+            newline=True,
+        )
+    else:
+        netzero.util.print_status(
+            "Compact", "Returned {} pages".format(released), newline=True
+        )
+
+    conn.close()
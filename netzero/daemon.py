@@ -0,0 +1,198 @@
+"""Long running collection with a schedule for every source.
+
+Running `netzero collect` from cron pays for starting the interpreter, parsing
+the configuration, loading the sources, connecting to the database and logging
+in to the source's website on every run. The daemon does all of that once and
+then collects each source on its own schedule, read from the ``[schedule]``
+section of the configuration:
+
+    [schedule]
+    solaredge = 15m
+    weather = 1d
+
+Each run collects from the last day already collected up to today. Runs are
+jittered so sources do not all hit the network at the same moment, and a run
+that comes due while the previous run of the same source is still going is
+skipped rather than queued.
+"""
+import concurrent.futures
+import datetime
+import functools
+import heapq
+import random
+import signal
+import threading
+import time
+
+import netzero.collect
+import netzero.config
+import netzero.db
+import netzero.instrument
+import netzero.metrics
+import netzero.sources
+import netzero.util
+
+default_interval = "1d"
+
+
+def add_args(parser):
+    netzero.sources.add_args(parser)
+    netzero.db.add_args(parser)
+    netzero.config.add_args(parser)
+
+    parser.add_argument(
+        "--jitter",
+        metavar="FRACTION",
+        help="randomly shift each run by up to this fraction of its interval "
+        "(default 0.1)",
+        dest="jitter",
+        type=float,
+        default=0.1,
+    )
+    parser.add_argument(
+        "--metrics",
+        metavar="FILE",
+        help="rewrite Prometheus metrics to FILE after every run",
+        dest="metrics",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        metavar="PORT",
+        help="serve Prometheus metrics over HTTP on PORT",
+        dest="metrics_port",
+        type=int,
+    )
+
+
+def main(arguments):
+    if not hasattr(arguments, "sources") or arguments.sources is None:
+        print("No sources specified, nothing to collect")
+        return
+
+    config = netzero.config.load_config(arguments.config)
+
+    sources = [source(config, arguments.database) for source in arguments.sources]
+
+    schedule = {}
+    for source in sources:
+        interval = default_interval
+        if "schedule" in config:
+            interval = config["schedule"].get(source.name, default_interval)
+
+        schedule[source.name] = netzero.util.parse_duration(interval).total_seconds()
+
+    if arguments.metrics_port is not None:
+        netzero.metrics.serve(arguments.database, arguments.metrics_port)
+
+    stop = threading.Event()
+
+    def request_stop(signum, frame):
+        stop.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    scheduler = Scheduler(sources, schedule, arguments.jitter, arguments.metrics)
+    scheduler.run(stop, arguments.database)
+
+
+class Scheduler:
+    """Runs the collection of each source on its own interval.
+
+    Parameters
+    ----------
+    sources : list
+        The loaded sources
+    schedule : dict
+        The interval between runs of each source in seconds, keyed by name
+    jitter : float
+        Fraction of the interval by which runs are randomly shifted
+    metrics : str, optional
+        File to write Prometheus metrics to after every run
+    """
+
+    def __init__(self, sources, schedule, jitter=0.1, metrics=None):
+        self.sources = {source.name: source for source in sources}
+        self.schedule = schedule
+        self.jitter = jitter
+        self.metrics = metrics
+
+        # Every source gets its own worker so a slow source never delays others
+        self.executor = concurrent.futures.ThreadPoolExecutor(len(sources))
+        self.running = {}
+
+        # Spread the first runs over the jitter window of each source
+        now = time.monotonic()
+        self.queue = [
+            (now + random.uniform(0, jitter) * schedule[name], name)
+            for name in self.sources
+        ]
+        heapq.heapify(self.queue)
+
+    def run(self, stop, database):
+        """Runs sources as they come due until ``stop`` is set."""
+        while not stop.is_set():
+            due, name = self.queue[0]
+
+            if stop.wait(max(0, due - time.monotonic())):
+                break
+
+            heapq.heappop(self.queue)
+            self.start(name, database)
+
+            interval = self.schedule[name]
+            next_due = due + interval * (1 + random.uniform(-self.jitter, self.jitter))
+            heapq.heappush(self.queue, (max(next_due, time.monotonic()), name))
+
+        log("Daemon", "Stopping, waiting for running collections")
+        self.executor.shutdown(wait=True)
+
+    def start(self, name, database):
+        """Starts a run of a source unless its previous run is still going."""
+        previous = self.running.get(name)
+        if previous is not None and not previous.done():
+            log(name, "Previous run still in progress, skipping this one")
+            netzero.instrument.count(name, "coalesced")
+            return
+
+        future = self.executor.submit(self.collect, name, database)
+        future.add_done_callback(functools.partial(self.finished, name))
+        self.running[name] = future
+
+    def finished(self, name, future):
+        """Logs an error that ended a run, like failing to write the metrics"""
+        if not future.cancelled() and future.exception() is not None:
+            log(name, "Run failed: {!r}".format(future.exception()))
+
+    def collect(self, name, database):
+        source = self.sources[name]
+
+        # Recollect the last day, it was probably only partially available
+        start_date = source.max_date()
+        end_date = datetime.date.today()
+
+        log(name, "Collecting from {}".format(start_date or "the beginning"))
+
+        try:
+            netzero.collect.collect(source, start_date, end_date)
+        except Exception as e:
+            # Release the write lock held by a half finished transaction, the
+            # connection is kept for the next run and shared with no one else
+            source.conn.rollback()
+            log(name, "Collection failed: {!r}".format(e))
+        else:
+            log(name, "Collection complete")
+
+        if self.metrics:
+            netzero.metrics.write_textfile(self.metrics, database)
+
+
+def log(source, message):
+    print(
+        "{} {} -- {}".format(
+            datetime.datetime.now().isoformat(sep=" ", timespec="seconds"),
+            source,
+            message,
+        ),
+        flush=True,
+    )
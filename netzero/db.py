@@ -1,6 +1,12 @@
+import datetime
 import os.path
+import pathlib
+import sqlite3
+import time
 
 import netzero.dirs
+import netzero.instrument
+import netzero.util
 
 
 def add_args(parser):
@@ -8,7 +14,393 @@ def add_args(parser):
         "-d",
         required=False,
         metavar="database",
-        default=os.path.join(netzero.dirs.user_data_dir("netzero"), "database.sqlite3"),
+        default=default_location(),
         help="stores data in the specified database instead of the default",
         dest="database",
     )
+
+
+def default_location():
+    return os.path.join(netzero.dirs.user_data_dir("netzero"), "database.sqlite3")
+
+
+def connect(database):
+    """Opens a connection to the database.
+
+    The database is switched to write-ahead logging so readers never block
+    each other or the writer, which lets every source query the database from
+    its own thread over its own connection.
+    """
+    conn = sqlite3.connect(database, check_same_thread=False)
+
+    # Only takes effect for a new database, see `vacuum`. Setting it needs the
+    # write lock, so opening a database that is being written would wait.
+    if conn.execute("PRAGMA page_count").fetchone()[0] == 0:
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    conn.execute("PRAGMA journal_mode=WAL")
+
+    return conn
+
+
+def connect_readonly(database):
+    """Opens a connection that can only read an existing database.
+
+    Unlike `connect` it never creates the database or waits for a writer to
+    change its settings.
+
+    Raises
+    ------
+    sqlite3.OperationalError if the database does not exist.
+    """
+    uri = pathlib.Path(database).absolute().as_uri() + "?mode=ro"
+
+    return sqlite3.connect(uri, uri=True, check_same_thread=False)
+
+
+def bump_version(conn, source):
+    """Marks the data of a source as changed.
+
+    Anything derived from the source's rows (like cached exports) that was
+    computed under an older version is considered stale.
+    """
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS data_version (source TEXT PRIMARY KEY, version INTEGER)"
+    )
+    conn.execute(
+        """
+        INSERT INTO data_version VALUES (?, 1)
+        ON CONFLICT(source) DO UPDATE SET version = version + 1""",
+        (source,),
+    )
+    conn.commit()
+
+
+def data_versions(conn, sources):
+    """Looks up the current data version of each of the given sources.
+
+    Returns
+    -------
+    A list of versions in the same order as ``sources``. Sources which have
+    never been collected have version 0.
+    """
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS data_version (source TEXT PRIMARY KEY, version INTEGER)"
+    )
+    versions = dict(conn.execute("SELECT source, version FROM data_version"))
+
+    return [versions.get(source, 0) for source in sources]
+
+
+def create_metadata(conn, source, table, column):
+    """Makes sure a source has a row in the source metadata table.
+
+    The first time a source is seen its row is computed from its table, after
+    that it is kept up to date by `record_collection`.
+    """
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS source_metadata (
+            source TEXT PRIMARY KEY,
+            first_time TIMESTAMP,
+            last_time TIMESTAMP,
+            row_count INTEGER,
+            last_collected TIMESTAMP
+        )"""
+    )
+
+    exists = conn.execute(
+        "SELECT 1 FROM source_metadata WHERE source = ?", (source,)
+    ).fetchone()
+
+    if exists is None:
+        row_count = conn.execute("SELECT count(*) FROM " + table).fetchone()[0]
+        update_metadata(conn, source, table, column, row_count)
+
+
+def record_collection(conn, source, table, column, inserted, updated=0):
+    """Records that a collection run of a source inserted some number of rows.
+
+    Updates the source's metadata and, if any rows were inserted or updated,
+    bumps its data version.
+    """
+    row_count = conn.execute(
+        "SELECT row_count FROM source_metadata WHERE source = ?", (source,)
+    ).fetchone()[0]
+
+    netzero.instrument.count(source, "rows_written", inserted)
+    if updated:
+        netzero.instrument.count(source, "rows_updated", updated)
+
+    update_metadata(conn, source, table, column, row_count + inserted)
+    conn.execute(
+        """
+        UPDATE source_metadata SET last_collected = datetime('now', 'localtime')
+        WHERE source = ?""",
+        (source,),
+    )
+    conn.commit()
+
+    if inserted or updated:
+        bump_version(conn, source)
+
+
+def update_metadata(conn, source, table, column, row_count):
+    # Plain min/max on an indexed column only has to look at one end of the index
+    first, last = conn.execute(
+        "SELECT min({0}), max({0}) FROM {1}".format(column, table)
+    ).fetchone()
+
+    # Exports only read the days in the metadata off the calendar, so it is
+    # extended before they can see them and reading never has to write
+    if first is not None:
+        ensure_calendar(
+            conn,
+            datetime.date.fromisoformat(first[:10]),
+            datetime.date.fromisoformat(last[:10]),
+        )
+
+    conn.execute(
+        """
+        INSERT INTO source_metadata VALUES (?, ?, ?, ?, NULL)
+        ON CONFLICT(source) DO UPDATE SET
+            first_time = excluded.first_time,
+            last_time = excluded.last_time,
+            row_count = excluded.row_count""",
+        (source, first, last, row_count),
+    )
+    conn.commit()
+
+
+def date_bounds(conn, source):
+    """Looks up the dates of the first and last rows collected for a source.
+
+    Returns
+    -------
+    A tuple of datetime.date objects, both None if nothing has been collected.
+    """
+    first, last = conn.execute(
+        "SELECT first_time, last_time FROM source_metadata WHERE source = ?",
+        (source,),
+    ).fetchone()
+
+    if first is None:
+        return None, None
+
+    # Timestamps and dates both start with YYYY-MM-DD
+    return (
+        datetime.date.fromisoformat(first[:10]),
+        datetime.date.fromisoformat(last[:10]),
+    )
+
+
+def ensure_calendar(conn, start_date, end_date):
+    """Makes sure the calendar table has a row for every day of a date range.
+
+    The calendar has a row for each day between the first and last day it was
+    ever asked for, with the first day of its week (starting on Monday), month
+    and year, its weekday (0 for Monday) and how many hours long it is, which
+    is 23 or 25 on the days daylight saving time starts or ends. Sources join
+    their tables against it to export a value for every day.
+
+    It is extended whenever a source's metadata is, so once it covers a range
+    this only reads.
+    """
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'calendar'"
+    ).fetchone()
+    if exists is None:
+        conn.execute(
+            """
+            CREATE TABLE calendar (
+                day DATE PRIMARY KEY,
+                week DATE,
+                month DATE,
+                year DATE,
+                weekday INTEGER,
+                hours INTEGER
+            ) WITHOUT ROWID"""
+        )
+
+    first, last = conn.execute("SELECT min(day), max(day) FROM calendar").fetchone()
+
+    # Keep the calendar contiguous so a range can be read straight off it
+    if first is not None:
+        first = datetime.date.fromisoformat(first)
+        last = datetime.date.fromisoformat(last)
+        if first <= start_date and end_date <= last:
+            return
+
+        start_date = min(start_date, first)
+        end_date = max(end_date, last)
+
+    rows = []
+    for day in netzero.util.iter_days(start_date, end_date):
+        midnight = time.mktime(day.timetuple())
+        next_midnight = time.mktime((day + datetime.timedelta(days=1)).timetuple())
+
+        rows.append(
+            (
+                day.isoformat(),
+                netzero.util.period_start(day, "week").isoformat(),
+                netzero.util.period_start(day, "month").isoformat(),
+                netzero.util.period_start(day, "year").isoformat(),
+                day.weekday(),
+                round((next_midnight - midnight) / 3600),
+            )
+        )
+
+    conn.executemany("INSERT OR IGNORE INTO calendar VALUES (?, ?, ?, ?, ?, ?)", rows)
+    conn.commit()
+
+
+def downsample(conn, source, table, before, rollup, days=7):
+    """Replaces the rows of a source's table before a date with coarser ones.
+
+    The table is rewritten a few days at a time, each in its own short
+    transaction, picking up after the days already downsampled by an earlier
+    run.
+
+    Parameters
+    ----------
+    source : str
+        The name of the source
+    table : str
+        A table with a time column and a value column
+    before : datetime.date
+        The first day to keep as it is
+    rollup : function
+        Takes the ``(time, value)`` rows of some whole days, ordered by time,
+        and returns the rows to replace them with
+    days : int
+        How many days to rewrite in one transaction
+
+    Returns
+    -------
+    The number of rows removed.
+    """
+    start_date = downsampled_before(conn, source)
+    if start_date is None:
+        start_date = date_bounds(conn, source)[0]
+
+    if start_date is None or start_date >= before:
+        return 0
+
+    removed = 0
+    for start, end in netzero.util.time_intervals(start_date, before, days=days):
+        window = {"start": start.isoformat(), "end": end.isoformat()}
+
+        rows = conn.execute(
+            """
+            SELECT * FROM {} WHERE time >= :start AND time < :end
+            ORDER BY time""".format(table),
+            window,
+        ).fetchall()
+        replacements = rollup(rows)
+
+        conn.execute(
+            "DELETE FROM {} WHERE time >= :start AND time < :end".format(table), window
+        )
+        conn.executemany("INSERT INTO {} VALUES (?, ?)".format(table), replacements)
+        conn.execute(
+            """
+            INSERT INTO compaction VALUES (?, ?)
+            ON CONFLICT(source) DO UPDATE SET before = excluded.before""",
+            (source, end.isoformat()),
+        )
+        conn.commit()
+
+        removed += len(rows) - len(replacements)
+
+    row_count = conn.execute(
+        "SELECT row_count FROM source_metadata WHERE source = ?", (source,)
+    ).fetchone()[0]
+    update_metadata(conn, source, table, "time", row_count - removed)
+
+    if removed:
+        bump_version(conn, source)
+
+    return removed
+
+
+def downsampled_before(conn, source):
+    """Looks up the first day of a source's rows not yet rewritten by `downsample`.
+
+    Returns
+    -------
+    A datetime.date, or None if none of the source's rows have been downsampled.
+    """
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS compaction (source TEXT PRIMARY KEY, before DATE)"
+    )
+
+    done = conn.execute(
+        "SELECT before FROM compaction WHERE source = ?", (source,)
+    ).fetchone()
+    if done is None:
+        return None
+
+    return datetime.date.fromisoformat(done[0])
+
+
+def skip_downsampled(conn, source, rows):
+    """Leaves out the rows of days already rewritten by `downsample`.
+
+    Raw readings written into those days again would be counted alongside the
+    coarser rows that replaced them, and never be downsampled themselves.
+
+    Parameters
+    ----------
+    rows : list of tuple
+        Rows whose first value is their time or date
+    """
+    before = downsampled_before(conn, source)
+    if before is None:
+        return rows
+
+    # Times and dates both start with YYYY-MM-DD, so they sort after the day
+    before = before.isoformat()
+    return [row for row in rows if row[0] >= before]
+
+
+def vacuum(conn, pages=1024):
+    """Returns the pages freed by deleted rows to the file system.
+
+    The pages are released a few at a time, so the database is only locked for
+    a moment at once. This needs incremental vacuuming, which new databases
+    have. Older ones are converted by ``VACUUM``-ing them once.
+
+    Returns
+    -------
+    The number of pages released, or None if the database does not support
+    incremental vacuuming.
+    """
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:  # INCREMENTAL
+        return None
+
+    released = 0
+    free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    while free:
+        # The pragma frees a page every time it is stepped, which execute()
+        # only does once
+        conn.executescript("PRAGMA incremental_vacuum({:d})".format(pages))
+
+        remaining = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if remaining == free:
+            break
+
+        released += free - remaining
+        free = remaining
+
+    return released
+
+
+def metadata(conn):
+    """Returns the metadata row of every source in the database."""
+    try:
+        return conn.execute(
+            """
+            SELECT source, first_time, last_time, row_count, last_collected
+            FROM source_metadata ORDER BY source"""
+        ).fetchall()
+    except sqlite3.OperationalError:  # No source has been set up yet
+        return []
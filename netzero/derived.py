@@ -0,0 +1,108 @@
+"""Metrics derived from the daily values of several sources.
+
+Derived metrics are computed by `netzero format` from the columns it has
+already queried, as whole-array operations, and exported as extra columns:
+
+    net             energy used from the grid minus solar energy produced (kWh)
+    hdd             heating degree days from the daily high temperature
+    cdd             cooling degree days from the daily high temperature
+    gshp_per_hdd    heat pump energy used per heating degree day (kWh)
+
+Degree days are measured from a base temperature of 65°F. Each metric needs the
+columns of the sources it is computed from to be exported as well.
+"""
+import collections
+
+# Degree days count how far the temperature is from this base, in °F
+base_temperature = 65
+
+Metric = collections.namedtuple("Metric", ["sources", "help", "function"])
+
+metrics = {}
+
+
+def metric(name, sources, help):
+    def register(function):
+        metrics[name] = Metric(sources, help, function)
+        return function
+
+    return register
+
+
+@metric("net", ["pepco", "solaredge"], "grid energy minus solar energy")
+def net(columns):
+    return columns["pepco"] - columns["solaredge"]
+
+
+@metric("hdd", ["weather"], "heating degree days")
+def heating_degree_days(columns):
+    import numpy
+
+    return numpy.maximum(base_temperature - columns["weather"], 0)
+
+
+@metric("cdd", ["weather"], "cooling degree days")
+def cooling_degree_days(columns):
+    import numpy
+
+    return numpy.maximum(columns["weather"] - base_temperature, 0)
+
+
+@metric("gshp_per_hdd", ["gshp", "weather"], "heat pump energy per degree day")
+def gshp_per_degree_day(columns):
+    import numpy
+
+    degree_days = heating_degree_days(columns)
+
+    # Days without any heating demand have no meaningful ratio
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        return numpy.where(degree_days > 0, columns["gshp"] / degree_days, numpy.nan)
+
+
+def check(names, selected):
+    """Makes sure every selected metric has the sources it is computed from.
+
+    Raises
+    ------
+    ValueError if a source is missing.
+    """
+    for name in selected:
+        missing = [source for source in metrics[name].sources if source not in names]
+        if missing:
+            raise ValueError(
+                "The {} metric needs the {} source(s)".format(name, ", ".join(missing))
+            )
+
+
+def derive(names, columns, selected):
+    """Computes metrics from the columns of some sources.
+
+    Parameters
+    ----------
+    names : list of str
+        The name of the source of each column
+    columns : list of list
+        Aligned daily values of each source, None where a day has no value
+    selected : list of str
+        The names of the metrics to compute
+
+    Returns
+    -------
+    A list with a column for each metric, None where it could not be computed.
+    """
+    import numpy
+
+    check(names, selected)
+
+    # None becomes NaN, which carries through the arithmetic
+    arrays = {
+        name: numpy.array(column, dtype=numpy.float64)
+        for name, column in zip(names, columns)
+    }
+
+    results = []
+    for name in selected:
+        values = metrics[name].function(arrays)
+        results.append(numpy.where(numpy.isnan(values), None, values).tolist())
+
+    return results
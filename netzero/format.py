@@ -1,9 +1,16 @@
 import argparse
+import concurrent.futures
 import csv
 import datetime
+import os
 
+import netzero.cache
 import netzero.sources
 import netzero.db
+import netzero.config
+import netzero.derived
+import netzero.instrument
+import netzero.sites
 import netzero.util
 
 
@@ -11,6 +18,8 @@ def add_args(parser):
     netzero.sources.add_args(parser)
     netzero.db.add_args(parser)
     netzero.config.add_args(parser)
+    netzero.instrument.add_args(parser)
+    netzero.sites.add_args(parser)
 
     parser.add_argument(
         "-s",
@@ -18,7 +27,7 @@ def add_args(parser):
         metavar="YYYY-MM-DD",
         help="start date for date range",
         dest="start",
-        type=datetime.date.fromisoformat,
+        type=netzero.util.parse_date,
     )
     parser.add_argument(
         "-e",
@@ -26,12 +35,68 @@ def add_args(parser):
         metavar="YYYY-MM-DD",
         help="end date for date range",
         dest="end",
-        type=datetime.date.fromisoformat,
+        type=netzero.util.parse_date,
+    )
+
+    parser.add_argument(
+        "-a",
+        "--append",
+        help="only export the days after the last one already in the output file",
+        dest="append",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-w",
+        "--window",
+        metavar="DAYS",
+        help="when appending, also re-export this many trailing days of the output "
+        "file to pick up late-arriving data",
+        dest="window",
+        type=window_days,
+        default=0,
+    )
+    parser.add_argument(
+        "--no-cache",
+        help="always query the sources instead of reusing a cached export",
+        dest="cache",
+        action="store_false",
+    )
+
+    parser.add_argument(
+        "--combine",
+        help="export one column per source combining every site, instead of a "
+        "column per site and source",
+        dest="combine",
+        choices=["sum", "mean"],
+    )
+
+    parser.add_argument(
+        "--derive",
+        metavar="METRIC",
+        help="also export a metric computed from the selected sources, may be "
+        "given more than once. One of: "
+        + ", ".join(
+            "{} ({})".format(name, metric.help)
+            for name, metric in netzero.derived.metrics.items()
+        ),
+        dest="derive",
+        action="append",
+        choices=list(netzero.derived.metrics),
+        default=[],
     )
 
     parser.add_argument("output", help="the file to export data to")
 
 
+def window_days(text):
+    """Parses a number of days to re-export, which must not be negative"""
+    days = int(text)
+    if days < 0:
+        raise argparse.ArgumentTypeError("must not be negative: '{}'".format(text))
+
+    return days
+
+
 def main(arguments):
     if not hasattr(arguments, "sources") or arguments.sources is None:
         print("No sources specified, nothing to export")
@@ -40,42 +105,323 @@ def main(arguments):
     config = netzero.config.load_config(arguments.config)
 
     # Load configurations into sources early so user can respond to errors
-    sources = [source(config, arguments.database) for source in arguments.sources]
+    sites = {}
+    for site in netzero.sites.select(config, arguments.sites):
+        site_config, database = netzero.sites.resolve(config, site, arguments.database)
+        sites[site] = (
+            [source(site_config, database) for source in arguments.sources],
+            database,
+        )
+
+    names = [source.name for source in arguments.sources]
+    netzero.derived.check(names, arguments.derive)
+
+    # Combined sites are exported as if they were one
+    groups = [None] if arguments.combine else list(sites)
+
+    header = ["date"]
+    for columns in [names, arguments.derive]:
+        for site in groups:
+            for name in columns:
+                if site is None:
+                    header.append(name)
+                else:
+                    header.append("{}:{}".format(site, name))
 
     start_date = arguments.start
     end_date = arguments.end
 
-    # TODO what if all min/max dates return none?
+    offset = None
+    last_date = None
+    if arguments.append:
+        last_date = last_exported(arguments.output, header)
 
-    if start_date is None:
-        start_date = min([source.min_date() for source in sources])
+        if last_date is not None:
+            # Every row from the start date on is replaced, so the export has
+            # to reach the last one
+            if end_date is not None and end_date < last_date:
+                raise ValueError(
+                    "Cannot append up to {}, {} already has rows until {}".format(
+                        end_date, arguments.output, last_date
+                    )
+                )
 
-    if end_date is None:
-        end_date = max([source.max_date() for source in sources])
+            # Appending from later on would leave out the days in between
+            next_date = last_date + datetime.timedelta(days=1)
+            if start_date is not None and start_date > next_date:
+                raise ValueError(
+                    "Cannot append from {}, {} only has rows until {}".format(
+                        start_date, arguments.output, last_date
+                    )
+                )
 
-    cursors = []
+            if start_date is None:
+                start_date = last_date + datetime.timedelta(days=1 - arguments.window)
+            offset = truncate_offset(arguments.output, start_date)
 
-    for source in sources:
-        cursors.append(source.format(start_date, end_date))
+    start_date, end_date = date_range(
+        [source for sources, database in sites.values() for source in sources],
+        start_date,
+        end_date,
+    )
 
-    with open(arguments.output, "w") as f:
-        writer = csv.writer(f)
+    # The sources may end before rows exported with an explicit end date
+    if last_date is not None and end_date is not None:
+        end_date = max(end_date, last_date)
 
-        header = ["date"]
-        for source in sources:
-            header.append(source.name)
+    if start_date is None or end_date is None or end_date < start_date:
+        netzero.util.print_status("Format", "Nothing to export", newline=True)
+        return
+
+    columns = query_sites(
+        list(sites.values()), start_date, end_date, arguments.cache, arguments.jobs
+    )
+
+    if arguments.combine:
+        columns = [
+            netzero.sites.combine(
+                columns[i :: len(arguments.sources)], arguments.combine
+            )
+            for i in range(len(arguments.sources))
+        ]
+
+    if arguments.derive:
+        for i in range(len(groups)):
+            group = columns[i * len(names) : (i + 1) * len(names)]
+            columns.extend(netzero.derived.derive(names, group, arguments.derive))
 
-        writer.writerow(header)
+    if offset is None:
+        mode = "w"
+    else:
+        mode = "a"
+        # Drop the trailing rows that are about to be re-exported
+        with open(arguments.output, "r+b") as f:
+            f.truncate(offset)
 
-        for date in netzero.util.iter_days(start_date, end_date):
+    with open(arguments.output, mode, newline="") as f:
+        writer = csv.writer(f)
+
+        if offset is None:
+            writer.writerow(header)
+
+        days = netzero.util.iter_days(start_date, end_date)
+        for date, *values in zip(days, *columns):
             netzero.util.print_status(
                 "Format", "Exporting: {}".format(date.strftime("%Y-%m-%d"))
             )
 
-            row = [date.strftime("%Y-%m-%d")]
-            for cursor in cursors:
-                row.append(cursor.fetchone()[0])
-
-            writer.writerow(row)
+            writer.writerow([date.strftime("%Y-%m-%d")] + values)
 
     netzero.util.print_status("Format", "Exporting Complete", newline=True)
+
+
+def date_range(sources, start_date=None, end_date=None):
+    """Fills in a missing start or end date with the first or last day collected
+    by any of the sources.
+
+    Returns
+    -------
+    The start and end dates, either of which is None if none of the sources
+    have collected anything.
+    """
+    if start_date is None:
+        dates = [source.min_date() for source in sources]
+        start_date = min([date for date in dates if date is not None], default=None)
+
+    if end_date is None:
+        dates = [source.max_date() for source in sources]
+        end_date = max([date for date in dates if date is not None], default=None)
+
+    return start_date, end_date
+
+
+def query(sources, start_date, end_date, database, use_cache=True):
+    """Queries the daily values of each source over a date range.
+
+    The sources are queried concurrently. Results are cached in the database
+    and reused until one of the sources collects new data.
+
+    Returns
+    -------
+    A list with one column of daily values for each source.
+    """
+    conn = netzero.db.connect(database)
+
+    names = [source.name for source in sources]
+    key = netzero.cache.key(names, start_date, end_date)
+    versions = netzero.db.data_versions(conn, names)
+
+    columns = None
+    if use_cache:
+        columns = netzero.cache.load(conn, key, versions)
+
+    if columns is None:
+
+        def fetch(source):
+            with netzero.instrument.phase(source.name, "aggregate"):
+                return daily_values(source, start_date, end_date)
+
+        # Every source reads over its own connection, so the slowest source
+        # rather than the sum of all of them determines how long this takes
+        with concurrent.futures.ThreadPoolExecutor(len(sources)) as executor:
+            columns = list(executor.map(fetch, sources))
+
+        netzero.cache.store(conn, key, versions, columns)
+    else:
+        netzero.util.print_status("Format", "Using cached export", newline=True)
+
+    conn.close()
+
+    return columns
+
+
+def daily_values(source, start_date, end_date):
+    """Queries the daily values of a source over a date range.
+
+    Only the days between the first and last day the source has collected are
+    queried, the days before and after them are None. This keeps the calendar
+    the sources join against from growing to whatever range is asked for.
+
+    Returns
+    -------
+    A list with a value for every day of the range.
+    """
+    first, last = source.min_date(), source.max_date()
+    if first is None or last < start_date or end_date < first:
+        return [None] * ((end_date - start_date).days + 1)
+
+    start, end = max(start_date, first), min(end_date, last)
+    values = [row[0] for row in source.format(start, end)]
+
+    return [None] * (start - start_date).days + values + [None] * (end_date - end).days
+
+
+def query_sites(sites, start_date, end_date, use_cache=True, jobs=4):
+    """Queries the sources of several sites, each from its own shard.
+
+    Parameters
+    ----------
+    sites : list
+        The ``(sources, database)`` of each site
+
+    Returns
+    -------
+    A list with one column of daily values for every source of every site, in
+    the order of the sites.
+    """
+    if len(sites) == 1:
+        sources, database = sites[0]
+        return query(sources, start_date, end_date, database, use_cache)
+
+    def query_site(site):
+        sources, database = site
+        return query(sources, start_date, end_date, database, use_cache)
+
+    with concurrent.futures.ThreadPoolExecutor(jobs) as executor:
+        results = list(executor.map(query_site, sites))
+
+    return [column for columns in results for column in columns]
+
+
+def last_exported(path, header):
+    """Finds the date of the last row in a previous export.
+
+    Parameters
+    ----------
+    path : str
+        The CSV file written by a previous export
+    header : list of str
+        The header the new rows will be written under
+
+    Returns
+    -------
+    The date of the last row as a datetime.date, or None if the file does not
+    exist or has no rows yet.
+    """
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return None
+
+    with open(path, newline="") as f:
+        existing = next(csv.reader(f), None)
+
+    if existing != header:
+        raise ValueError(
+            "Cannot append to {}, its columns {} do not match {}".format(
+                path, existing, header
+            )
+        )
+
+    offset, line = next(reversed_lines(path))
+    if offset == 0:  # Only the header
+        return None
+
+    return datetime.date.fromisoformat(line.split(b",", 1)[0].decode())
+
+
+def truncate_offset(path, start_date):
+    """Finds the byte offset of the first row on or after ``start_date``.
+
+    Only the end of the file is read, so the cost depends on how far back
+    ``start_date`` is rather than on the size of the file.
+    """
+    for offset, line in reversed_lines(path):
+        if offset == 0:  # The header
+            return len(line)
+
+        date = datetime.date.fromisoformat(line.split(b",", 1)[0].decode())
+        if date < start_date:
+            return offset + len(line)
+
+
+def reversed_lines(path, block=4096):
+    """Generates the lines of a file from the last one to the first.
+
+    The end of the file is read in growing blocks, so only about as much of it
+    is read as the lines taken, however long they are.
+
+    Yields
+    ------
+    ``(offset, line)`` tuples where ``line`` includes its line ending.
+    """
+    taken = None
+    while True:
+        lines = tail_lines(path, block)
+        if not lines:
+            return
+
+        # The first line may be a partial line unless we reached the header
+        complete = lines if lines[0][0] == 0 else lines[1:]
+
+        for offset, line in reversed(complete):
+            if taken is None or offset < taken:
+                taken = offset
+                yield offset, line
+
+        if lines[0][0] == 0:
+            return
+
+        block *= 4
+
+
+def tail_lines(path, size=4096):
+    """Reads the lines within the last ``size`` bytes of a file.
+
+    Returns
+    -------
+    A list of ``(offset, line)`` tuples where ``line`` includes its line ending.
+    """
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        start = max(0, end - size)
+
+        f.seek(start)
+        data = f.read()
+
+    lines = []
+    offset = start
+    for line in data.splitlines(keepends=True):
+        lines.append((offset, line))
+        offset += len(line)
+
+    return lines
@@ -0,0 +1,130 @@
+"""Timing and counters for collecting and formatting data.
+
+Sources record how long they spend in each phase of their work and count
+things like requests and rows written. The recorded statistics can be dumped
+as JSON with the --profile flag, and the whole run can be wrapped in cProfile
+with --cprofile.
+
+Phases used by the builtin sources:
+
+    network     waiting on HTTP requests, including downloading the body
+    parse       decoding responses and files into rows
+    write       inserting rows into the database
+    aggregate   computing the daily values when formatting
+    total       the whole collection run of a source
+
+Counters used by the builtin sources:
+
+    requests, bytes, retries, rows_written, rows_updated, rows_unchanged,
+    api_errors, failures, coalesced
+
+Histograms used by the builtin sources:
+
+    request_seconds     the duration of each HTTP request
+"""
+import collections
+import contextlib
+import cProfile
+import json
+import threading
+import time
+
+# Upper bounds of the histogram buckets in seconds
+buckets = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_lock = threading.Lock()
+_stats = collections.defaultdict(collections.Counter)
+_histograms = collections.defaultdict(dict)
+
+
+def add_args(parser):
+    parser.add_argument(
+        "--profile",
+        metavar="FILE",
+        help="write per-source timings and counters as JSON to FILE",
+        dest="profile",
+    )
+    parser.add_argument(
+        "--cprofile",
+        metavar="FILE",
+        help="run under cProfile and write the profile to FILE",
+        dest="cprofile",
+    )
+
+
+@contextlib.contextmanager
+def phase(source, name):
+    """Adds the time spent in the body of the with statement to a phase."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        count(source, name + "_seconds", time.perf_counter() - start)
+
+
+def count(source, name, amount=1):
+    with _lock:
+        _stats[source][name] += amount
+
+
+def observe(source, name, value):
+    """Adds a value to a histogram."""
+    with _lock:
+        histogram = _histograms[source].get(name)
+        if histogram is None:
+            histogram = {"buckets": [0] * len(buckets), "sum": 0, "count": 0}
+            _histograms[source][name] = histogram
+
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                histogram["buckets"][i] += 1
+        histogram["sum"] += value
+        histogram["count"] += 1
+
+
+def report():
+    """Returns a copy of the statistics recorded so far, keyed by source.
+
+    Histograms map their name to a dict with the cumulative ``buckets`` count
+    for each bound, and the ``sum`` and ``count`` of all values.
+    """
+    with _lock:
+        result = {source: dict(stats) for source, stats in _stats.items()}
+
+        for source, histograms in _histograms.items():
+            for name, histogram in histograms.items():
+                result.setdefault(source, {})[name] = {
+                    "buckets": dict(zip(buckets, histogram["buckets"])),
+                    "sum": histogram["sum"],
+                    "count": histogram["count"],
+                }
+
+        return result
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+        _histograms.clear()
+
+
+def run(func, arguments):
+    """Runs a command, profiling it if the arguments ask for it."""
+    profiler = None
+    if getattr(arguments, "cprofile", None):
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    start = time.perf_counter()
+    try:
+        func(arguments)
+    finally:
+        elapsed = time.perf_counter() - start
+
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(arguments.cprofile)
+
+        if getattr(arguments, "profile", None):
+            with open(arguments.profile, "w") as f:
+                json.dump({"seconds": elapsed, "sources": report()}, f, indent=2)
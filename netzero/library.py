@@ -0,0 +1,121 @@
+"""Python interface to the collected data.
+
+    >>> import netzero
+    >>> data = netzero.load(["solaredge", "weather"], resolution="month")
+
+Loads the same values `netzero format` exports, straight from the database and
+without the CSV, as NumPy arrays or a pandas DataFrame.
+"""
+import configparser
+import importlib.util
+
+import entrypoints
+
+import netzero.config
+import netzero.db
+import netzero.format
+import netzero.sources
+import netzero.util
+
+
+def load(
+    sources,
+    start=None,
+    end=None,
+    resolution="day",
+    database=None,
+    config=None,
+    frame=None,
+):
+    """Loads the values of one or more sources over a date range.
+
+    Parameters
+    ----------
+    sources : str, source class or list of them
+        The names (like "solaredge") or classes of the sources to load
+    start : datetime.date or str, optional
+        The first day to load, defaults to the first day any source collected
+    end : datetime.date or str, optional
+        The last day to load, defaults to the last day any source collected
+    resolution : str
+        One of "day", "week", "month" or "year". Values are combined over each
+        period the way the source says they combine (summed or averaged).
+    database : str, optional
+        The database to load from instead of the default
+    config : str or configparser.ConfigParser, optional
+        The configuration, or its path, to create the sources with
+    frame : bool, optional
+        Whether to return a pandas DataFrame. By default one is returned if
+        pandas is installed.
+
+    Returns
+    -------
+    A pandas DataFrame indexed by the first day of each period with a column
+    for every source, or a dict mapping "date" to a datetime64[D] array and
+    each source's name to a float64 array. Missing values are NaN.
+    """
+    import numpy
+
+    if frame is None:
+        frame = importlib.util.find_spec("pandas") is not None
+
+    if isinstance(sources, str) or isinstance(sources, type):
+        sources = [sources]
+    if isinstance(start, str):
+        start = netzero.util.parse_date(start)
+    if isinstance(end, str):
+        end = netzero.util.parse_date(end)
+    if resolution not in netzero.util.resolutions:
+        raise ValueError("Invalid resolution: '%s'" % resolution)
+
+    if database is None:
+        database = netzero.db.default_location()
+    if config is None:
+        config = netzero.config.default_location()
+    if not isinstance(config, configparser.ConfigParser):
+        config = netzero.config.load_config(config)
+
+    sources = [find_source(source)(config, database) for source in sources]
+
+    start, end = netzero.format.date_range(sources, start, end)
+
+    dates = []
+    columns = [[] for source in sources]
+    if start is not None and end is not None and start <= end:
+        daily = netzero.format.query(sources, start, end, database)
+
+        for source, values, column in zip(sources, daily, columns):
+            days = netzero.util.iter_days(start, end)
+            dates, rolled = netzero.util.rollup(
+                days, values, resolution, getattr(source, "rollup", "sum")
+            )
+            column.extend(rolled)
+
+    for source in sources:
+        source.conn.close()
+
+    data = {"date": numpy.array(dates, dtype="datetime64[D]")}
+    for source, column in zip(sources, columns):
+        # None becomes NaN when converted to floats
+        data[source.name] = numpy.array(column, dtype=numpy.float64)
+
+    if frame:
+        import pandas
+
+        return pandas.DataFrame(data).set_index("date")
+
+    return data
+
+
+def find_source(source):
+    """Looks up a source class by the name of its entry point."""
+    if isinstance(source, type):
+        return source
+
+    group = entrypoints.get_group_named("netzero.sources")
+    if source not in group:
+        raise ValueError(
+            "Unknown source: '{}', expected one of {}".format(source, sorted(group))
+        )
+
+    return netzero.sources.load_source(source, group[source])
@@ -0,0 +1,211 @@
+"""Prometheus metrics for scheduled collection runs.
+
+The metrics combine the statistics recorded by `netzero.instrument` during the
+current process with what the database knows about each source. They can be
+written to a file for the node exporter's textfile collector, or served over
+HTTP by a long running process.
+"""
+import datetime
+import http.server
+import os
+import tempfile
+import threading
+
+import netzero.db
+import netzero.instrument
+import netzero.sites
+
+# Counters recorded by the sources and the metric each is exported as
+counters = {
+    "requests": ("netzero_requests_total", "HTTP requests made"),
+    "bytes": ("netzero_response_bytes_total", "Bytes received in HTTP responses"),
+    "retries": ("netzero_retries_total", "HTTP requests retried"),
+    "rows_written": ("netzero_rows_inserted_total", "Rows inserted"),
+    "rows_updated": ("netzero_rows_updated_total", "Existing rows given new values"),
+    "api_errors": ("netzero_api_errors_total", "Failed API queries"),
+    "failures": ("netzero_collect_failures_total", "Collection runs that failed"),
+    "coalesced": (
+        "netzero_collect_coalesced_total",
+        "Scheduled runs skipped because the previous run was still going",
+    ),
+}
+
+
+def add_args(parser):
+    parser.add_argument(
+        "--metrics",
+        metavar="FILE",
+        help="write Prometheus metrics to FILE in the node exporter textfile format",
+        dest="metrics",
+    )
+
+
+def render(database, sites=None):
+    """Renders the current metrics in the Prometheus text format.
+
+    Parameters
+    ----------
+    database : str
+        The database, or the one the site shards are named after
+    sites : list of str, optional
+        The sites whose shards are read, labelled with their site, as returned
+        by `netzero.sites.select`. Only the plain database is read by default.
+    """
+    if sites is None:
+        sites = [None]
+
+    lines = []
+
+    def metric(name, kind, help, samples):
+        """Adds a metric from a list of ``(suffix, labels, value)`` samples."""
+        if not samples:
+            return
+
+        lines.append("# HELP {} {}".format(name, help))
+        lines.append("# TYPE {} {}".format(name, kind))
+        for suffix, labels, value in samples:
+            label_text = ",".join('{}="{}"'.format(key, value) for key, value in labels)
+            if label_text:
+                label_text = "{" + label_text + "}"
+
+            lines.append("{}{}{} {}".format(name, suffix, label_text, float(value)))
+
+    stats = sorted(netzero.instrument.report().items())
+
+    for key, (name, help) in counters.items():
+        samples = [
+            ("", [("source", source)], values[key])
+            for source, values in stats
+            if key in values
+        ]
+        metric(name, "counter", help, samples)
+
+    samples = []
+    for source, values in stats:
+        for key, value in sorted(values.items()):
+            if key.endswith("_seconds") and not isinstance(value, dict):
+                phase = key[: -len("_seconds")]
+                samples.append(("", [("source", source), ("phase", phase)], value))
+    metric(
+        "netzero_phase_seconds_total",
+        "counter",
+        "Seconds spent in each phase of collecting and formatting",
+        samples,
+    )
+
+    samples = []
+    for source, values in stats:
+        histogram = values.get("request_seconds")
+        if histogram is None:
+            continue
+
+        for bound, count in histogram["buckets"].items():
+            samples.append(("_bucket", [("source", source), ("le", bound)], count))
+        samples.append(
+            ("_bucket", [("source", source), ("le", "+Inf")], histogram["count"])
+        )
+        samples.append(("_sum", [("source", source)], histogram["sum"]))
+        samples.append(("_count", [("source", source)], histogram["count"]))
+    metric(
+        "netzero_request_duration_seconds",
+        "histogram",
+        "Duration of HTTP requests",
+        samples,
+    )
+
+    last_success = []
+    source_rows = []
+    database_size = []
+    for site in sites:
+        # Sites have nothing in the plain database, see `netzero.sites.resolve`
+        path = database if site is None else netzero.sites.shard(database, site)
+        site_labels = [] if site is None else [("site", site)]
+
+        conn = netzero.db.connect(path)
+        rows = netzero.db.metadata(conn)
+        page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        conn.close()
+
+        last_success.extend(
+            ("", site_labels + [("source", row[0])], timestamp(row[4]))
+            for row in rows
+            if row[4] is not None
+        )
+        source_rows.extend(
+            ("", site_labels + [("source", row[0])], row[3]) for row in rows
+        )
+        database_size.append(("", site_labels, page_count * page_size))
+
+    metric(
+        "netzero_last_success_timestamp_seconds",
+        "gauge",
+        "Unix time of the last successful collection",
+        last_success,
+    )
+    metric("netzero_source_rows", "gauge", "Rows stored for each source", source_rows)
+    metric(
+        "netzero_database_size_bytes", "gauge", "Size of the database", database_size
+    )
+
+    return "\n".join(lines) + "\n"
+
+
+def timestamp(text):
+    # Collection times are stored in local time
+    return datetime.datetime.fromisoformat(text).timestamp()
+
+
+def write_textfile(path, database, sites=None):
+    """Writes the metrics to ``path``, see `render`.
+
+    The file is replaced atomically, so the textfile collector never reads a
+    partially written file. Every call writes its own temporary file, so the
+    daemon's sources can finish at the same time.
+    """
+    fd, temporary = tempfile.mkstemp(
+        dir=os.path.dirname(path) or ".", prefix=os.path.basename(path) + "."
+    )
+    try:
+        # mkstemp only lets the owner read it, the collector may run as another user
+        os.fchmod(fd, 0o644)
+        with os.fdopen(fd, "w") as f:
+            f.write(render(database, sites))
+
+        os.replace(temporary, path)
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+
+def serve(database, port, host=""):
+    """Serves the metrics at ``/metrics`` from a background thread.
+
+    Returns
+    -------
+    The running http.server.ThreadingHTTPServer.
+    """
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+
+            body = render(database).encode()
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
@@ -0,0 +1,339 @@
+"""Read-only HTTP API over the collected data.
+
+Dashboards can query the values of a source over a date range instead of
+running `netzero format` and parsing the CSV:
+
+    GET /sources
+    GET /series/<source>?start=YYYY-MM-DD&end=YYYY-MM-DD&resolution=day
+
+``start`` and ``end`` default to the first and last day collected for the
+source, and ``resolution`` is one of day, week, month or year. Daily values are
+rolled up into coarser periods the way the source says they combine (summed
+for energy, averaged for temperatures).
+
+Series are returned as JSON, or as an Arrow IPC stream with ``format=arrow`` or
+an ``Accept: application/vnd.apache.arrow.stream`` header when pyarrow is
+installed.
+
+Every source is queried through a small pool of its own instances, each with
+its own read connection, and recently computed series are kept in memory until
+the source collects new data.
+"""
+import collections
+import contextlib
+import http.server
+import json
+import queue
+import threading
+import urllib.parse
+
+import netzero.cache
+import netzero.config
+import netzero.db
+import netzero.format
+import netzero.instrument
+import netzero.sources
+import netzero.util
+
+arrow_type = "application/vnd.apache.arrow.stream"
+
+
+def add_args(parser):
+    netzero.sources.add_args(parser)
+    netzero.db.add_args(parser)
+    netzero.config.add_args(parser)
+
+    parser.add_argument(
+        "--host",
+        help="address to listen on (default localhost)",
+        dest="host",
+        default="localhost",
+    )
+    parser.add_argument(
+        "-p",
+        "--port",
+        help="port to listen on (default 8000)",
+        dest="port",
+        type=int,
+        default=8000,
+    )
+    parser.add_argument(
+        "--readers",
+        metavar="N",
+        help="database connections kept open for each source (default 4)",
+        dest="readers",
+        type=int,
+        default=4,
+    )
+
+
+def main(arguments):
+    if not hasattr(arguments, "sources") or arguments.sources is None:
+        print("No sources specified, nothing to serve")
+        return
+
+    config = netzero.config.load_config(arguments.config)
+
+    api = Api(arguments.sources, config, arguments.database, arguments.readers)
+    server = serve(api, arguments.host, arguments.port)
+
+    print(
+        "Serving {} on http://{}:{}".format(
+            ", ".join(api.pools), *server.server_address
+        )
+    )
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+class Pool:
+    """A fixed number of instances of a source shared between threads.
+
+    Every instance has its own database connection, so up to ``size`` queries
+    of the source run at the same time. Instances are created when first
+    needed.
+    """
+
+    def __init__(self, factory, size):
+        self.factory = factory
+        self.size = size
+        self.created = 0
+        self.idle = queue.LifoQueue()
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def get(self):
+        try:
+            instance = self.idle.get_nowait()
+        except queue.Empty:
+            with self.lock:
+                create = self.created < self.size
+                if create:
+                    self.created += 1
+
+            instance = self.factory() if create else self.idle.get()
+
+        try:
+            yield instance
+        finally:
+            self.idle.put(instance)
+
+
+class Api:
+    """Answers queries for the series of a set of sources.
+
+    Parameters
+    ----------
+    sources : list
+        The source classes to serve
+    config : configparser.ConfigParser
+        The configuration the sources are created with
+    database : str
+        The database the data was collected into
+    readers : int
+        The number of instances, and so connections, kept for each source
+    cache_size : int
+        The number of series kept in memory
+    """
+
+    def __init__(self, sources, config, database, readers=4, cache_size=None):
+        if cache_size is None:
+            cache_size = netzero.cache.max_entries
+
+        self.pools = {}
+        for source in sources:
+            # Create one instance up front so configuration errors show early
+            pool = Pool(lambda source=source: source(config, database), readers)
+            with pool.get() as instance:
+                # Databases collected before the calendar was kept up to date
+                # get it now, so requests only read
+                start_date, end_date = instance.min_date(), instance.max_date()
+                if start_date is not None:
+                    netzero.db.ensure_calendar(instance.conn, start_date, end_date)
+
+            self.pools[source.name] = pool
+
+        self.cache_size = cache_size
+        self.cache = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def sources(self):
+        """Lists the collected date range and size of every served source."""
+        result = []
+        for name, pool in self.pools.items():
+            with pool.get() as source:
+                start_date, end_date = netzero.db.date_bounds(source.conn, name)
+                rows = netzero.db.metadata(source.conn)
+
+            row_count = sum(row[3] for row in rows if row[0] == name)
+            result.append(
+                {
+                    "name": name,
+                    "summary": source.summary,
+                    "rollup": getattr(source, "rollup", "sum"),
+                    "start": start_date and start_date.isoformat(),
+                    "end": end_date and end_date.isoformat(),
+                    "rows": row_count,
+                }
+            )
+
+        return result
+
+    def series(self, name, start_date=None, end_date=None, resolution="day"):
+        """Queries the values of a source over a date range.
+
+        Returns
+        -------
+        A list of the first day of every period and a list of its value.
+        """
+        if resolution not in netzero.util.resolutions:
+            raise ValueError("Invalid resolution: '%s'" % resolution)
+
+        with self.pools[name].get() as source:
+            if start_date is None:
+                start_date = source.min_date()
+            if end_date is None:
+                end_date = source.max_date()
+
+            if start_date is None or end_date is None or end_date < start_date:
+                return [], []
+
+            key = netzero.cache.key([name], start_date, end_date, resolution)
+            version = netzero.db.data_versions(source.conn, [name])
+
+            with self.lock:
+                entry = self.cache.get(key)
+                if entry is not None and entry[0] == version:
+                    self.cache.move_to_end(key)
+                    return entry[1]
+
+            with netzero.instrument.phase(name, "aggregate"):
+                values = netzero.format.daily_values(source, start_date, end_date)
+
+            days = netzero.util.iter_days(start_date, end_date)
+            result = netzero.util.rollup(
+                days, values, resolution, getattr(source, "rollup", "sum")
+            )
+
+        with self.lock:
+            self.cache[key] = (version, result)
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+        return result
+
+
+def to_json(name, resolution, periods, values):
+    return json.dumps(
+        {
+            "source": name,
+            "resolution": resolution,
+            "dates": [period.isoformat() for period in periods],
+            "values": values,
+        }
+    ).encode()
+
+
+def to_arrow(name, periods, values):
+    """Encodes a series as an Arrow IPC stream, if pyarrow is installed."""
+    try:
+        import pyarrow
+    except ImportError:
+        return None
+
+    table = pyarrow.table(
+        {
+            "date": pyarrow.array(periods, pyarrow.date32()),
+            name: pyarrow.array(values, pyarrow.float64()),
+        }
+    )
+
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+
+    return sink.getvalue().to_pybytes()
+
+
+def serve(api, host="localhost", port=8000):
+    """Serves an Api from a background thread.
+
+    Returns
+    -------
+    The running http.server.ThreadingHTTPServer.
+    """
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            try:
+                self.answer()
+            except Exception:
+                self.send_error(500)
+
+        def answer(self):
+            url = urllib.parse.urlsplit(self.path)
+            query = dict(urllib.parse.parse_qsl(url.query))
+
+            if url.path == "/sources":
+                self.send(200, "application/json", json.dumps(api.sources()).encode())
+                return
+
+            name = url.path[len("/series/") :]
+            if not url.path.startswith("/series/") or name not in api.pools:
+                self.send_error(404)
+                return
+
+            try:
+                start_date = parse_date(query.get("start"))
+                end_date = parse_date(query.get("end"))
+                resolution = query.get("resolution", "day")
+
+                periods, values = api.series(name, start_date, end_date, resolution)
+            except ValueError as e:
+                self.send_error(400, str(e))
+                return
+
+            arrow = query.get("format") == "arrow" or arrow_type in self.headers.get(
+                "Accept", ""
+            )
+            if arrow:
+                body = to_arrow(name, periods, values)
+                if body is None:
+                    self.send_error(501, "Arrow output needs pyarrow installed")
+                else:
+                    self.send(200, arrow_type, body)
+            else:
+                self.send(
+                    200,
+                    "application/json",
+                    to_json(name, resolution, periods, values),
+                )
+
+        def send(self, status, content_type, body):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
+
+
+def parse_date(text):
+    if text is None:
+        return None
+
+    return netzero.util.parse_date(text)
@@ -0,0 +1,138 @@
+"""Configuration and databases for more than one home.
+
+A site is configured with sections named after the source and the site:
+
+    [solar]
+    api_key = 00000000000000000000000000000000
+
+    [solar:site-a]
+    site_id = 111111
+
+    [solar:site-b]
+    site_id = 222222
+
+The fields of a site's section are added to (or replace) the fields of the
+plain section, so settings shared by every site only need to be given once.
+Each site's data goes to its own shard next to the database, so for a
+database of ``database.sqlite3`` site-a is stored in
+``database-site-a.sqlite3``.
+
+A configuration without any site sections describes a single home stored in
+the database itself, as before.
+"""
+import configparser
+import os.path
+
+
+def add_args(parser):
+    parser.add_argument(
+        "--site",
+        metavar="NAME",
+        help="only use this site, may be given more than once (default all sites)",
+        dest="sites",
+        action="append",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        metavar="N",
+        help="number of sites to work on at the same time (default 4)",
+        dest="jobs",
+        type=int,
+        default=4,
+    )
+
+
+def names(config):
+    """Lists the sites named in the configuration's sections."""
+    return sorted(
+        {section.split(":", 1)[1] for section in config.sections() if ":" in section}
+    )
+
+
+def select(config, wanted=None):
+    """Picks the sites to work on.
+
+    Returns
+    -------
+    The names of the sites, or ``[None]`` if the configuration does not have
+    any sites.
+    """
+    available = names(config)
+
+    if not available:
+        if wanted:
+            raise ValueError("No sites are configured")
+        return [None]
+
+    if not wanted:
+        return available
+
+    for site in wanted:
+        if site not in available:
+            raise ValueError(
+                "Unknown site: '{}', expected one of {}".format(site, available)
+            )
+
+    return list(wanted)
+
+
+def resolve(config, site, database):
+    """Finds the configuration and database of a site.
+
+    Returns
+    -------
+    A configuration with the site's sections merged into the plain ones, and
+    the path of the site's shard. Both are returned unchanged for the ``None``
+    site.
+    """
+    if site is None:
+        return config, database
+
+    # Values are copied after interpolation, so they must not be interpolated
+    # a second time
+    merged = configparser.ConfigParser(interpolation=None)
+    for section in config.sections():
+        if ":" not in section:
+            merged[section] = dict(config[section])
+
+    suffix = ":" + site
+    for section in config.sections():
+        if section.endswith(suffix):
+            name = section[: -len(suffix)]
+            if not merged.has_section(name):
+                merged.add_section(name)
+
+            for key, value in config[section].items():
+                merged[name][key] = value
+
+    return merged, shard(database, site)
+
+
+def shard(database, site):
+    root, extension = os.path.splitext(database)
+
+    return "{}-{}{}".format(root, site, extension)
+
+
+def combine(columns, how="sum"):
+    """Combines the same column from several sites into one.
+
+    Days missing from some sites are combined from the sites that have them,
+    and are None only if no site has them.
+    """
+    if how not in ("sum", "mean"):
+        raise ValueError("Invalid combination: '%s'" % how)
+
+    combined = []
+    for values in zip(*columns):
+        values = [value for value in values if value is not None]
+
+        if not values:
+            combined.append(None)
+        elif how == "mean":
+            combined.append(sum(values) / len(values))
+        else:
+            combined.append(sum(values))
+
+    return combined
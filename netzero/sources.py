@@ -1,3 +1,5 @@
+import argparse
+
 import entrypoints
 
 
@@ -6,25 +8,50 @@ def add_args(parser):
         "data sources", description="Flags used to select the supported data sources"
     )
 
-    for name, source in load():
-        if not hasattr(source, "name"):
-            source.name = name
-        if not hasattr(source, "option"):
-            source.option = source.name[0]
-        if not hasattr(source, "long_option"):
-            source.long_option = source.name
-
+    # The flags are built from the entry point names alone. A source's module
+    # is only imported once its flag is actually given on the command line.
+    for name, entrypoint in entrypoints.get_group_named("netzero.sources").items():
         sources_group.add_argument(
-            "+" + source.option,
-            "--" + source.long_option,
-            help=source.summary,
+            "+" + name[0],
+            "--" + name,
+            help="{} data".format(name),
             dest="sources",
-            action="append_const",
-            const=source,
+            action=SelectSource,
+            entrypoint=entrypoint,
         )
 
 
+class SelectSource(argparse.Action):
+    """Appends the source of an entry point to the selected sources.
+
+    Works like the ``append_const`` action except the source is only loaded
+    when the flag is used.
+    """
+
+    def __init__(self, option_strings, dest, entrypoint, **kwargs):
+        super().__init__(option_strings, dest, nargs=0, **kwargs)
+        self.entrypoint = entrypoint
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        selected = list(getattr(namespace, self.dest, None) or [])
+        selected.append(load_source(self.entrypoint.name, self.entrypoint))
+
+        setattr(namespace, self.dest, selected)
+
+
+def load_source(name, entrypoint):
+    source = entrypoint.load()
+
+    if not hasattr(source, "name"):
+        source.name = name
+    if not hasattr(source, "option"):
+        source.option = source.name[0]
+    if not hasattr(source, "long_option"):
+        source.long_option = source.name
+
+    return source
+
+
 def load():
     for name, entrypoint in entrypoints.get_group_named("netzero.sources").items():
-        source = entrypoint.load()
-        yield name, source
+        yield name, load_source(name, entrypoint)
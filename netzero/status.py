@@ -0,0 +1,53 @@
+import configparser
+import os.path
+import sqlite3
+
+import netzero.config
+import netzero.db
+import netzero.sites
+import netzero.util
+
+
+def add_args(parser):
+    netzero.db.add_args(parser)
+    netzero.config.add_args(parser)
+    netzero.sites.add_args(parser)
+
+
+def main(arguments):
+    # Sites are only known from the configuration, but status works without
+    # the default one
+    config = configparser.ConfigParser()
+    default = arguments.config == netzero.config.default_location()
+    if not default or os.path.exists(arguments.config):
+        config = netzero.config.load_config(arguments.config)
+
+    sites = netzero.sites.select(config, arguments.sites)
+
+    rows = []
+    for site in sites:
+        database = arguments.database
+        if site is not None:
+            database = netzero.sites.shard(database, site)
+
+        try:
+            conn = netzero.db.connect_readonly(database)
+        except sqlite3.OperationalError:  # Nothing collected for the site yet
+            continue
+
+        site_rows = netzero.db.metadata(conn)
+        conn.close()
+
+        if site is None:
+            rows.extend(site_rows)
+        else:
+            rows.extend((site,) + row for row in site_rows)
+
+    if not rows:
+        print("Nothing has been collected yet")
+        return
+
+    header = ("source", "first", "last", "rows", "last collected")
+    if sites != [None]:
+        header = ("site",) + header
+    netzero.util.print_table(header, rows)
@@ -1,4 +1,5 @@
 import datetime
+import time
 
 
 def time_intervals(
@@ -37,13 +38,191 @@ def iter_days(start_date, end_date):
     assert type(start_date) is datetime.date
     assert type(end_date) is datetime.date
 
-    if start_date < end_date:
-        delta = datetime.timedelta(days=1)
+    delta = datetime.timedelta(days=1)
 
-        curr = start_date
-        while curr <= end_date:
-            yield curr
-            curr = curr + delta
+    curr = start_date
+    while curr <= end_date:
+        yield curr
+        curr = curr + delta
+
+
+# Every day in this range has a next one, and a range of them stays short
+# enough to hold a value for each day in memory
+first_date = datetime.date(1900, 1, 1)
+last_date = datetime.date(2199, 12, 31)
+
+
+def parse_date(text):
+    """Parses a YYYY-MM-DD date between `first_date` and `last_date`"""
+    date = datetime.date.fromisoformat(text)
+    if not first_date <= date <= last_date:
+        raise ValueError(
+            "Date out of range: '{}', expected {} to {}".format(
+                text, first_date, last_date
+            )
+        )
+
+    return date
+
+
+resolutions = ["day", "week", "month", "year"]
+
+
+def period_start(date, resolution):
+    """Finds the first day of the week, month or year containing a date"""
+    if resolution == "day":
+        return date
+    elif resolution == "week":
+        return date - datetime.timedelta(days=date.weekday())
+    elif resolution == "month":
+        return date.replace(day=1)
+    elif resolution == "year":
+        return date.replace(month=1, day=1)
+    else:
+        raise ValueError("Invalid resolution: '%s'" % resolution)
+
+
+def rollup(days, values, resolution, how="sum"):
+    """Combines daily values into weekly, monthly or yearly ones.
+
+    Parameters
+    ----------
+    days : iterable of datetime.date
+        The consecutive days the values are for
+    values : iterable
+        The daily values, None where a day has no data
+    resolution : str
+        One of `resolutions`
+    how : str
+        "sum" to add up the values of each period, "mean" to average them
+
+    Returns
+    -------
+    A list of the first day of each period and a list of its value, None if
+    none of its days have data.
+    """
+    if how not in ("sum", "mean"):
+        raise ValueError("Invalid rollup: '%s'" % how)
+
+    periods = []
+    totals = []
+    counts = []
+    for day, value in zip(days, values):
+        start = period_start(day, resolution)
+        if not periods or periods[-1] != start:
+            periods.append(start)
+            totals.append(0)
+            counts.append(0)
+
+        if value is not None:
+            totals[-1] += value
+            counts[-1] += 1
+
+    results = []
+    for total, count in zip(totals, counts):
+        if count == 0:
+            results.append(None)
+        elif how == "mean":
+            results.append(total / count)
+        else:
+            results.append(total)
+
+    return periods, results
+
+
+def local_times(timestamps):
+    """Converts a batch of Unix timestamps into local times.
+
+    Gives the same result as formatting ``datetime.datetime.fromtimestamp`` of
+    each timestamp, but only looks up the UTC offset at both ends of every hour
+    of the batch and formats the date and hour once for each.
+
+    Returns
+    -------
+    A list of "YYYY-MM-DD HH:MM:SS" strings, the way times are stored.
+    """
+    offsets = {}
+    hours = {}
+
+    times = []
+    for timestamp in timestamps:
+        utc_hour = timestamp // 3600
+        if utc_hour not in offsets:
+            offset = time.localtime(utc_hour * 3600).tm_gmtoff
+
+            # Zones a half hour off UTC, or with half hour daylight saving time,
+            # change their offset in the middle of an hour. Those hours are
+            # looked up one timestamp at a time.
+            if time.localtime(utc_hour * 3600 + 3599).tm_gmtoff != offset:
+                offset = None
+            offsets[utc_hour] = offset
+
+        offset = offsets[utc_hour]
+        if offset is None:
+            offset = time.localtime(timestamp).tm_gmtoff
+
+        local = timestamp + offset
+        hour = hours.get(local // 3600)
+        if hour is None:
+            hour = time.strftime("%Y-%m-%d %H:", time.gmtime(local - local % 3600))
+            hours[local // 3600] = hour
+
+        minutes, seconds = divmod(local % 3600, 60)
+        times.append("%s%02d:%02d" % (hour, minutes, seconds))
+
+    return times
+
+
+def format_times(texts, unit="s"):
+    """Checks a batch of ISO 8601 times and formats them the way they are stored.
+
+    Parameters
+    ----------
+    texts : list of str
+        Times like "2019-07-10 12:00:00" or "2019-07-10T12:00:00"
+    unit : str
+        "s" to keep the time of day, or "D" to keep only the date
+
+    Returns
+    -------
+    A list of "YYYY-MM-DD HH:MM:SS" or "YYYY-MM-DD" strings.
+
+    Raises
+    ------
+    ValueError if any of the texts is not a time.
+    """
+    check = datetime.datetime.fromisoformat
+    for text in texts:
+        if len(text) < 19:
+            raise ValueError("Invalid time: '%s'" % text)
+        check(text[:19])
+
+    # Every field is at a fixed offset
+    if unit == "D":
+        return [text[:10] for text in texts]
+
+    return [text[:10] + " " + text[11:19] for text in texts]
+
+
+def hourly_totals(rows):
+    """Sums ``(time, value)`` rows into a row at the start of each hour."""
+    totals = {}
+    for timestamp, value in rows:
+        hour = timestamp[:13] + ":00:00"
+        totals[hour] = totals.get(hour, 0) + (value or 0)
+
+    return list(totals.items())
+
+
+def parse_duration(text):
+    """Parses a duration like "90s", "15m", "6h" or "1d" into a timedelta"""
+    units = {"s": "seconds", "m": "minutes", "h": "hours", "d": "days"}
+
+    text = text.strip()
+    if text[-1:] not in units:
+        raise ValueError("Invalid duration: '%s'" % text)
+
+    return datetime.timedelta(**{units[text[-1]]: float(text[:-1])})
 
 
 def validate_config(config, entry, fields):
@@ -58,3 +237,16 @@ def validate_config(config, entry, fields):
 def print_status(source, message, newline=False):
     end = "\n" if newline else ""
     print("\033[2K\r" + source + " -- " + message, end=end)
+
+
+def print_table(header, rows):
+    """Prints rows of values in aligned columns under a header."""
+    rows = [header] + [
+        tuple("-" if value is None else str(value) for value in row) for row in rows
+    ]
+
+    widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+
+    for row in rows:
+        line = "  ".join(value.ljust(width) for value, width in zip(row, widths))
+        print(line.rstrip())
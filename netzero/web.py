@@ -0,0 +1,68 @@
+"""HTTP helpers shared by the sources that collect from web APIs."""
+import time
+
+import requests
+import urllib3.util.retry
+
+import netzero.instrument
+
+
+def session(retries=5):
+    """Creates a requests session which retries failed requests.
+
+    Connection errors, rate limiting (HTTP 429) and server errors are retried
+    up to ``retries`` times with exponential backoff, honouring any
+    Retry-After header sent by the server.
+    """
+    retry = urllib3.util.retry.Retry(
+        total=retries,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        raise_on_status=False,
+    )
+    adapter = requests.adapters.HTTPAdapter(max_retries=retry)
+
+    s = requests.Session()
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+
+    return s
+
+
+def request(session, source, method, url, **kwargs):
+    """Makes a request with a session, recording it in the source's statistics.
+
+    With ``stream=True`` the body is not downloaded yet, read it with
+    `iter_content` so it is still counted.
+    """
+    start = time.perf_counter()
+    response = session.request(method, url, **kwargs)
+    elapsed = time.perf_counter() - start
+
+    netzero.instrument.count(source, "network_seconds", elapsed)
+    netzero.instrument.observe(source, "request_seconds", elapsed)
+    netzero.instrument.count(source, "requests")
+    if not kwargs.get("stream"):
+        netzero.instrument.count(source, "bytes", len(response.content))
+
+    retries = getattr(response.raw, "retries", None)
+    if retries is not None:
+        netzero.instrument.count(source, "retries", len(retries.history))
+
+    return response
+
+
+def iter_content(response, source, chunk_size=65536):
+    """Yields the body of a streamed response in chunks as it is downloaded,
+    recording the time spent waiting on it and its size."""
+    chunks = response.iter_content(chunk_size)
+    while True:
+        start = time.perf_counter()
+        chunk = next(chunks, None)
+        netzero.instrument.count(source, "network_seconds", time.perf_counter() - start)
+
+        if chunk is None:
+            return
+
+        netzero.instrument.count(source, "bytes", len(chunk))
+        yield chunk
@@ -22,13 +22,14 @@ setup(
         "Operating System :: OS Independent",
     ],
     python_requires='>=3.6',
-    install_requires=["requests", "bs4", "entrypoints"],
+    install_requires=["requests", "bs4", "entrypoints", "numpy"],
+    extras_require={"arrow": ["pyarrow"], "pandas": ["pandas"]},
     entry_points={
         "console_scripts": ["netzero=netzero.__main__:main"],
         "netzero.sources": [
             "pepco=netzero.builtin.pepco:Pepco",
             "gshp=netzero.builtin.gshp:Gshp",
-            "solar=netzero.builtin.solar:Solar",
+            "solaredge=netzero.builtin.solar:Solar",
             "weather=netzero.builtin.weather:Weather",
         ]},
 )
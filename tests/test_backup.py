@@ -0,0 +1,110 @@
+import os
+import shutil
+import tempfile
+import unittest
+import unittest.mock
+
+from netzero import backup, db
+
+
+class TestBackup(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.database = os.path.join(self.directory, "database.sqlite3")
+        self.backups = os.path.join(self.directory, "backups")
+
+        self.conn = db.connect(self.database)
+        self.conn.execute("CREATE TABLE pepco (time TIMESTAMP PRIMARY KEY, watt_hrs)")
+        self.insert(0, 5000)
+
+    def tearDown(self):
+        self.conn.close()
+        shutil.rmtree(self.directory)
+
+    def insert(self, start, end):
+        self.conn.executemany(
+            "INSERT INTO pepco VALUES (?, ?)",
+            [(str(i), "x" * 100) for i in range(start, end)],
+        )
+        self.conn.commit()
+
+    def restore(self):
+        path = os.path.join(self.directory, "restored.sqlite3")
+        if os.path.exists(path):
+            os.remove(path)
+
+        backup.restore(self.backups, path)
+
+        conn = db.connect(path)
+        rows = conn.execute("SELECT count(*) FROM pepco").fetchone()[0]
+        conn.close()
+
+        return rows
+
+    def test_full(self):
+        path = backup.backup(self.database, self.backups, sleep=0)
+
+        self.assertTrue(path.endswith(".sqlite3"))
+        self.assertEqual(5000, self.restore())
+        self.assertEqual(
+            ["manifest", os.path.basename(path)], sorted(os.listdir(self.backups))
+        )
+
+    def test_incremental(self):
+        full = backup.backup(self.database, self.backups, compress=True, sleep=0)
+
+        self.insert(5000, 5010)
+        pages = backup.backup(
+            self.database, self.backups, incremental=True, compress=True, sleep=0
+        )
+
+        self.assertTrue(full.endswith(".sqlite3.gz"))
+        self.assertTrue(pages.endswith(".pages.gz"))
+        self.assertLess(os.path.getsize(pages), os.path.getsize(full) / 10)
+        self.assertEqual(5010, self.restore())
+
+        self.conn.execute("DELETE FROM pepco WHERE time >= '3'")
+        self.conn.commit()
+        db.vacuum(self.conn)
+        backup.backup(self.database, self.backups, incremental=True, pages=1, sleep=0)
+
+        self.assertEqual(
+            self.conn.execute("SELECT count(*) FROM pepco").fetchone()[0],
+            self.restore(),
+        )
+
+    def test_incremental_without_full(self):
+        path = backup.backup(self.database, self.backups, incremental=True, sleep=0)
+
+        self.assertTrue(path.endswith(".sqlite3"))
+
+    def test_snapshot_during_writes(self):
+        path = os.path.join(self.directory, "snapshot.sqlite3")
+        writes = []
+
+        # Another connection writes between every step of the copy
+        def sleep(seconds):
+            if len(writes) == 1000:
+                raise RuntimeError("The copy keeps restarting")
+
+            writes.append(None)
+            self.insert(10000 + len(writes), 10000 + len(writes) + 1)
+
+        with unittest.mock.patch("time.sleep", sleep):
+            backup.snapshot(self.database, path, pages=8)
+
+        conn = db.connect(path)
+        rows = conn.execute("SELECT count(*) FROM pepco").fetchone()[0]
+        conn.close()
+
+        self.assertEqual(5000, rows)
+
+    def test_restore_nothing(self):
+        os.makedirs(self.backups)
+
+        with self.assertRaises(ValueError):
+            backup.restore(self.backups, os.path.join(self.directory, "out.sqlite3"))
+
+
+if __name__ == "__main__":
+    unittest.main()
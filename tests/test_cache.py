@@ -0,0 +1,99 @@
+import datetime
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from netzero import cache, db
+
+
+class TestFormatCache(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:")
+        self.key = cache.key(
+            ["pepco", "weather"], datetime.date(2019, 7, 1), datetime.date(2019, 7, 2)
+        )
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_cache_miss(self):
+        self.assertIsNone(cache.load(self.conn, self.key, [0, 0]))
+
+    def test_cache_hit(self):
+        columns = [[1.5, None], [80.0, 81.5]]
+        versions = db.data_versions(self.conn, ["pepco", "weather"])
+
+        cache.store(self.conn, self.key, versions, columns)
+
+        self.assertEqual(columns, cache.load(self.conn, self.key, versions))
+
+    def test_cache_hit_read_only(self):
+        versions = db.data_versions(self.conn, ["pepco", "weather"])
+        cache.store(self.conn, self.key, versions, [[1.5], [80.0]])
+
+        changes = self.conn.total_changes
+        cache.load(self.conn, self.key, versions)
+
+        self.assertEqual(changes, self.conn.total_changes)
+
+    def test_cache_hit_while_locked(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        database = os.path.join(directory.name, "netzero.sqlite3")
+
+        conn = db.connect(database)
+        versions = db.data_versions(conn, ["pepco", "weather"])
+        cache.store(conn, self.key, versions, [[1.5], [80.0]])
+        conn.execute("UPDATE format_cache SET used = used - 1")
+        conn.commit()
+        conn.close()
+
+        writer = db.connect(database)
+        self.addCleanup(writer.close)
+        writer.execute("BEGIN IMMEDIATE")
+
+        conn = sqlite3.connect(database, timeout=0.1)
+        self.addCleanup(conn.close)
+
+        self.assertEqual([[1.5], [80.0]], cache.load(conn, self.key, versions))
+
+    def test_cache_store_while_locked(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        database = os.path.join(directory.name, "netzero.sqlite3")
+
+        conn = sqlite3.connect(database, timeout=0.1)
+        self.addCleanup(conn.close)
+        versions = db.data_versions(conn, ["pepco", "weather"])
+        conn.commit()
+
+        writer = sqlite3.connect(database)
+        self.addCleanup(writer.close)
+        writer.execute("BEGIN IMMEDIATE")
+
+        cache.store(conn, self.key, versions, [[1.5], [80.0]])
+
+        writer.rollback()
+        self.assertIsNone(cache.load(conn, self.key, versions))
+
+    def test_cache_invalidated_by_collect(self):
+        versions = db.data_versions(self.conn, ["pepco", "weather"])
+        cache.store(self.conn, self.key, versions, [[1.5], [80.0]])
+
+        db.bump_version(self.conn, "weather")
+        versions = db.data_versions(self.conn, ["pepco", "weather"])
+
+        self.assertEqual([0, 1], versions)
+        self.assertIsNone(cache.load(self.conn, self.key, versions))
+
+    def test_cache_entries_limited(self):
+        start_date = datetime.date(2019, 7, 1)
+
+        for days in range(cache.max_entries + 8):
+            end_date = start_date + datetime.timedelta(days=days)
+            cache.store(self.conn, cache.key(["pepco"], start_date, end_date), [0], [])
+
+        count = self.conn.execute("SELECT count(*) FROM format_cache").fetchone()[0]
+
+        self.assertEqual(cache.max_entries, count)
@@ -0,0 +1,190 @@
+import datetime
+import os
+import sqlite3
+import time
+import unittest
+
+from netzero import check, util
+
+
+class TestScan(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:")
+        self.conn.execute("CREATE TABLE pepco (time TIMESTAMP PRIMARY KEY, watt_hrs)")
+        self.conn.execute(
+            "CREATE TABLE weather (date DATE, temperature, station, PRIMARY KEY (date, station))"
+        )
+
+        self.tz = os.environ.get("TZ")
+        os.environ["TZ"] = "America/New_York"
+        time.tzset()
+
+    def tearDown(self):
+        self.conn.close()
+
+        if self.tz is None:
+            del os.environ["TZ"]
+        else:
+            os.environ["TZ"] = self.tz
+        time.tzset()
+
+    def insert(self, start, values, minutes=15):
+        """Inserts readings every few minutes as collection would, in local time."""
+        start = int(time.mktime(start.timetuple()))
+        timestamps = [start + 60 * minutes * i for i in range(len(values))]
+
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO pepco VALUES (?, ?)",
+            [
+                (text, value)
+                for text, value in zip(util.local_times(timestamps), values)
+                if value is not None
+            ],
+        )
+
+    def scan(self, **kwargs):
+        return [
+            issue[1:4] for issue in check.scan(self.conn, "pepco", "watt_hrs", **kwargs)
+        ]
+
+    def test_clean(self):
+        self.insert(datetime.datetime(2019, 7, 10), [100 + i % 7 for i in range(500)])
+
+        self.assertEqual([], self.scan())
+
+    def test_gap(self):
+        values = [100 + i % 7 for i in range(500)]
+        values[100:110] = [None] * 10
+        self.insert(datetime.datetime(2019, 7, 10), values)
+
+        self.assertEqual(
+            [("gap", "2019-07-11 00:45:00", "2019-07-11 03:30:00")], self.scan()
+        )
+
+    def test_daylight_saving_time_starts(self):
+        # 2 am never happens, which is not a gap
+        self.insert(datetime.datetime(2019, 3, 9), [100 + i % 7 for i in range(300)])
+
+        self.assertEqual([], self.scan())
+
+    def test_daylight_saving_time_ends(self):
+        self.insert(datetime.datetime(2019, 11, 2), [100 + i % 7 for i in range(300)])
+
+        self.assertEqual(
+            [("duplicate", "2019-11-03 01:00:00", "2019-11-03 01:45:00")], self.scan()
+        )
+
+    def test_flat(self):
+        values = [100 + i % 7 for i in range(500)]
+        values[200:300] = [0] * 100
+        values[400:410] = [50] * 10
+        self.insert(datetime.datetime(2019, 7, 10), values)
+
+        self.assertEqual(
+            [("flat", "2019-07-12 02:00:00", "2019-07-13 02:45:00")],
+            self.scan(flat_zero=datetime.timedelta(days=1)),
+        )
+        self.assertEqual(
+            [
+                ("flat", "2019-07-12 02:00:00", "2019-07-13 02:45:00"),
+                ("flat", "2019-07-14 04:00:00", "2019-07-14 06:15:00"),
+            ],
+            self.scan(
+                flat=datetime.timedelta(hours=2), flat_zero=datetime.timedelta(1)
+            ),
+        )
+
+    def test_outliers(self):
+        values = [100 + i % 7 for i in range(500)]
+        values[50] = 5000
+        values[60] = -3
+        self.insert(datetime.datetime(2019, 7, 10), values)
+
+        self.assertEqual(
+            [
+                ("outlier", "2019-07-10 12:30:00", "2019-07-10 12:30:00"),
+                ("outlier", "2019-07-10 15:00:00", "2019-07-10 15:00:00"),
+            ],
+            self.scan(low=0),
+        )
+
+    def test_irregular(self):
+        self.insert(datetime.datetime(2019, 7, 10), [100 + i % 7 for i in range(500)])
+        self.conn.execute("INSERT INTO pepco VALUES ('2019-07-10 12:05:00', 103)")
+
+        self.assertEqual(
+            [("irregular", "2019-07-10 12:00:00", "2019-07-10 12:15:00")], self.scan()
+        )
+
+    def test_since(self):
+        values = [100 + i % 7 for i in range(500)]
+        values[100:110] = [None] * 10
+        self.insert(datetime.datetime(2019, 7, 10), values)
+
+        self.assertEqual([], self.scan(since=datetime.date(2019, 7, 12)))
+
+    def test_stations(self):
+        rows = [
+            (str(datetime.date(2019, 7, 1) + datetime.timedelta(days=i)), 80 + i % 5)
+            for i in range(30)
+        ]
+        self.conn.executemany(
+            "INSERT INTO weather VALUES (?, ?, 'A')",
+            [row for i, row in enumerate(rows) if i != 10],
+        )
+        self.conn.executemany(
+            "INSERT INTO weather VALUES (?, ?, 'B')",
+            [(date, 999 if i == 20 else value) for i, (date, value) in enumerate(rows)],
+        )
+
+        issues = check.scan(
+            self.conn,
+            "weather",
+            "temperature",
+            time="date",
+            unit="D",
+            key="station",
+            step=datetime.timedelta(days=1),
+            high=140,
+        )
+
+        self.assertEqual(
+            [
+                ("A", "gap", "2019-07-10", "2019-07-12", "no readings for 2 days"),
+                ("B", "outlier", "2019-07-21", "2019-07-21", "999"),
+            ],
+            issues,
+        )
+
+    def test_empty(self):
+        self.assertEqual([], self.scan())
+        self.assertEqual(
+            [],
+            check.scan(self.conn, "weather", "temperature", "date", "D", "station"),
+        )
+
+
+class TestRecord(unittest.TestCase):
+    def test_record(self):
+        conn = sqlite3.connect(":memory:")
+
+        self.assertEqual([], check.issues(conn, "pepco"))
+
+        gap = ("pepco", "gap", "2019-07-11 00:45:00", "2019-07-11 03:30:00", "")
+        flat = ("pepco", "flat", "2019-07-10 00:00:00", "2019-07-11 00:00:00", "")
+
+        check.record(conn, "pepco", [gap, flat])
+        check.record(conn, "gshp", [gap])
+
+        self.assertEqual([flat, gap], check.issues(conn, "pepco"))
+        self.assertEqual([gap], check.issues(conn, "pepco", kind="gap"))
+
+        # Checking again replaces what was found before
+        check.record(conn, "pepco", [])
+
+        self.assertEqual([], check.issues(conn, "pepco"))
+        self.assertEqual(1, len(check.issues(conn, "gshp")))
+
+
+if __name__ == "__main__":
+    unittest.main()
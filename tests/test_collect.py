@@ -0,0 +1,89 @@
+import configparser
+import threading
+import time
+import unittest
+
+from netzero import collect
+
+
+class TestPipeline(unittest.TestCase):
+    def test_every_item_reaches_the_sink(self):
+        results = []
+
+        pipeline = collect.Pipeline("test", range(100), queue_size=2)
+        pipeline.map(lambda item: item * 2, workers=3)
+        pipeline.map(lambda item: None if item % 4 else item, workers=2)
+        pipeline.run(results.append)
+
+        self.assertEqual(list(range(0, 200, 4)), sorted(results))
+
+    def test_without_stages(self):
+        results = []
+
+        collect.Pipeline("test", iter([1, 2, 3])).run(results.append)
+
+        self.assertEqual([1, 2, 3], results)
+
+    def test_queues_are_bounded(self):
+        lock = threading.Lock()
+        state = {"read": 0, "written": 0, "most": 0}
+
+        def items():
+            for item in range(50):
+                with lock:
+                    state["read"] += 1
+                    state["most"] = max(state["most"], state["read"] - state["written"])
+                yield item
+
+        def slow_sink(item):
+            time.sleep(0.002)
+            with lock:
+                state["written"] += 1
+
+        pipeline = collect.Pipeline("test", items(), queue_size=2)
+        pipeline.map(lambda item: item, workers=2)
+        pipeline.run(slow_sink)
+
+        self.assertEqual(50, state["written"])
+        # Two queues of two, one item in each worker and one with the sink
+        self.assertLessEqual(state["most"], 2 * 2 + 2 + 2)
+
+    def test_errors_stop_the_pipeline(self):
+        def fail(item):
+            if item == 10:
+                raise RuntimeError("bad item")
+            return item
+
+        results = []
+        pipeline = collect.Pipeline("test", range(10000), queue_size=2)
+        pipeline.map(fail, workers=2)
+
+        with self.assertRaises(RuntimeError):
+            pipeline.run(results.append)
+
+        self.assertLess(len(results), 10000)
+
+    def test_sink_errors_stop_the_pipeline(self):
+        def sink(item):
+            raise ValueError("cannot write")
+
+        pipeline = collect.Pipeline("test", range(10000)).map(lambda item: item)
+
+        with self.assertRaises(ValueError):
+            pipeline.run(sink)
+
+    def test_pipeline_options(self):
+        config = configparser.ConfigParser()
+        config["solar"] = {"fetch_workers": "4"}
+        config["pipeline"] = {"fetch_workers": "2", "queue_size": "8"}
+
+        options = collect.pipeline_options(config, "solar")
+
+        self.assertEqual(
+            {"queue_size": 8, "fetch_workers": 4, "parse_workers": 1}, options
+        )
+        self.assertEqual(2, collect.pipeline_options(config, "gshp")["fetch_workers"])
+
+
+if __name__ == "__main__":
+    unittest.main()
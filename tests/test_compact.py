@@ -0,0 +1,222 @@
+import configparser
+import datetime
+import json
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+import unittest.mock
+
+from netzero import db, util
+from netzero.builtin.gshp import Gshp, WattHourAgg, hourly_samples
+from netzero.builtin.pepco import Pepco
+from netzero.builtin.solar import Solar
+
+from .test_solar import energy
+
+
+def green_button(start_date, days):
+    """A Green Button document with readings of 1 to 4 Wh every quarter hour."""
+    start = int(time.mktime(start_date.timetuple()))
+
+    readings = "".join(
+        "<espi:IntervalReading><espi:timePeriod><espi:start>{}</espi:start>"
+        "</espi:timePeriod><espi:value>{}</espi:value>"
+        "</espi:IntervalReading>".format(start + 900 * i, 1 + i % 4)
+        for i in range(96 * days)
+    )
+
+    return (
+        '<feed xmlns="http://www.w3.org/2005/Atom" xmlns:espi="http://naesb.org/espi">'
+        "<entry><title>Energy Usage</title><content><espi:IntervalBlock>"
+        + readings
+        + "</espi:IntervalBlock></content></entry></feed>"
+    )
+
+
+class TestDownsample(unittest.TestCase):
+    def setUp(self):
+        fd, self.database = tempfile.mkstemp(suffix=".sqlite3")
+        os.close(fd)
+        os.remove(self.database)
+
+        self.conn = db.connect(self.database)
+        self.conn.execute(
+            "CREATE TABLE pepco (time TIMESTAMP PRIMARY KEY, watt_hrs FLOAT)"
+        )
+
+        # Two days of quarter hours
+        start = datetime.datetime(2019, 7, 10)
+        self.conn.executemany(
+            "INSERT INTO pepco VALUES (?, 1)",
+            [(str(start + datetime.timedelta(minutes=15 * i)),) for i in range(192)],
+        )
+        self.conn.commit()
+        db.create_metadata(self.conn, "pepco", "pepco", "time")
+
+    def tearDown(self):
+        self.conn.close()
+
+        for suffix in ["", "-wal", "-shm"]:
+            if os.path.exists(self.database + suffix):
+                os.remove(self.database + suffix)
+
+    def downsample(self, before):
+        return db.downsample(
+            self.conn, "pepco", "pepco", before, util.hourly_totals, days=1
+        )
+
+    def daily(self):
+        return self.conn.execute(
+            "SELECT date(time), sum(watt_hrs) FROM pepco GROUP BY date(time)"
+        ).fetchall()
+
+    def test_downsample(self):
+        daily = self.daily()
+
+        self.assertEqual(72, self.downsample(datetime.date(2019, 7, 11)))
+
+        self.assertEqual(daily, self.daily())
+        self.assertEqual(
+            [("2019-07-10 00:00:00", 4), ("2019-07-10 01:00:00", 4)],
+            self.conn.execute("SELECT * FROM pepco ORDER BY time LIMIT 2").fetchall(),
+        )
+        self.assertEqual(120, db.metadata(self.conn)[0][3])
+        self.assertEqual([1], db.data_versions(self.conn, ["pepco"]))
+
+    def test_downsample_picks_up_where_it_left_off(self):
+        self.downsample(datetime.date(2019, 7, 11))
+
+        self.assertEqual(0, self.downsample(datetime.date(2019, 7, 11)))
+        self.assertEqual(72, self.downsample(datetime.date(2019, 7, 12)))
+        self.assertEqual(48, db.metadata(self.conn)[0][3])
+
+    def test_vacuum(self):
+        self.downsample(datetime.date(2019, 7, 12))
+
+        self.assertIsNotNone(db.vacuum(self.conn, pages=1))
+        self.assertEqual(0, self.conn.execute("PRAGMA freelist_count").fetchone()[0])
+
+    def test_connect_while_writing(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        self.conn.execute("DELETE FROM pepco")
+
+        conn = db.connect(self.database)
+        count = conn.execute("SELECT count(*) FROM pepco").fetchone()[0]
+        conn.close()
+        self.conn.rollback()
+
+        self.assertEqual(192, count)
+
+
+class TestCollectAfterCompact(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.database = os.path.join(self.directory.name, "database.sqlite3")
+
+        path = os.path.join(self.directory.name, "usage.xml")
+        with open(path, "w") as f:
+            f.write(green_button(datetime.date(2020, 1, 1), 10))
+
+        self.config = configparser.ConfigParser()
+        self.config["pepco"] = {"files": json.dumps([path])}
+        self.config["solar"] = {"api_key": "test", "site_id": "1"}
+        self.config["gshp"] = {"username": "test", "password": "test"}
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_pepco(self):
+        pepco = Pepco(self.config, self.database)
+        start, end = datetime.date(2020, 1, 1), datetime.date(2020, 1, 10)
+
+        pepco.collect()
+        daily = pepco.format(start, end).fetchall()
+
+        self.assertGreater(pepco.compact(datetime.date(2020, 1, 5)), 0)
+        pepco.collect()
+
+        # The files are read again but the compacted days are left alone
+        self.assertEqual(daily, pepco.format(start, end).fetchall())
+        self.assertEqual(
+            4 * 24 + 6 * 96,
+            pepco.conn.execute("SELECT count(*) FROM pepco").fetchone()[0],
+        )
+
+    def test_solar(self):
+        start, end = datetime.date(2020, 1, 1), datetime.date(2020, 3, 10)
+
+        # Only the last 30 days get detail at first, the rest only daily totals
+        self.config["solar"]["detail_requests"] = "1"
+        solar = Solar(self.config, self.database)
+
+        query_api = unittest.mock.Mock(side_effect=lambda *args: energy(*args))
+        with unittest.mock.patch.object(solar, "query_api", query_api):
+            solar.collect(start, end)
+            self.assertGreater(solar.compact(datetime.date(2020, 3, 5)), 0)
+
+            solar.detail_requests = None
+            query_api.reset_mock()
+            solar.collect(start, end)
+
+        detail = [call.args for call in query_api.call_args_list if len(call.args) == 2]
+        self.assertTrue(detail)
+        self.assertTrue(all(args[0] >= datetime.date(2020, 3, 5) for args in detail))
+
+        # Nothing but the hourly totals before the compacted days
+        self.assertEqual(
+            0,
+            solar.conn.execute("""
+                SELECT count(*) FROM solaredge
+                WHERE time < '2020-03-05' AND time NOT LIKE '%:00:00'""").fetchone()[0],
+        )
+
+    def test_gshp(self):
+        gshp = Gshp(self.config, self.database)
+        gshp.session = unittest.mock.Mock()
+        start, end = datetime.date(2020, 1, 1), datetime.date(2020, 1, 10)
+
+        def scrape_json(session, day):
+            midnight = int(time.mktime(day.timetuple()))
+            return [(midnight + 60 * i, 1000 * (i % 3)) for i in range(1440)]
+
+        with unittest.mock.patch.object(gshp, "scrape_json", scrape_json):
+            gshp.collect(start, end)
+            daily = gshp.format(start, end).fetchall()
+
+            self.assertGreater(gshp.compact(datetime.date(2020, 1, 5)), 0)
+            gshp.collect(start, end)
+
+        self.assertEqual(daily, gshp.format(start, end).fetchall())
+
+
+class TestHourlySamples(unittest.TestCase):
+    def daily(self, rows):
+        conn = sqlite3.connect(":memory:")
+        conn.create_aggregate("WATTAGG", 2, WattHourAgg)
+        conn.execute("CREATE TABLE gshp (time TIMESTAMP, watts FLOAT)")
+        conn.executemany("INSERT INTO gshp VALUES (?, ?)", rows)
+
+        return conn.execute(
+            "SELECT date(time), WATTAGG(time, watts) FROM gshp GROUP BY date(time)"
+        ).fetchall()
+
+    def test_energy_unchanged(self):
+        start = datetime.datetime(2019, 7, 10, 0, 0, 30)
+        rows = [
+            (str(start + datetime.timedelta(seconds=97 * i)), (i * 37) % 4500)
+            for i in range(1780)
+        ]
+
+        samples = hourly_samples(rows)
+
+        self.assertEqual(48, len(samples))
+        for (day, daily), (_, hourly) in zip(self.daily(rows), self.daily(samples)):
+            self.assertAlmostEqual(daily, hourly, delta=0.01)
+
+        self.assertEqual(samples, hourly_samples(samples))
+
+
+if __name__ == "__main__":
+    unittest.main()
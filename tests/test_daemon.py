@@ -0,0 +1,84 @@
+import datetime
+import threading
+import unittest
+import unittest.mock
+
+from netzero import daemon, instrument, util
+
+
+class SlowSource:
+    name = "slow"
+
+    def __init__(self):
+        self.conn = unittest.mock.Mock()
+        self.release = threading.Event()
+        self.runs = []
+
+    def collect(self, start_date, end_date):
+        self.runs.append((start_date, end_date))
+        self.release.wait(5)
+
+    def max_date(self):
+        return datetime.date(2020, 1, 1)
+
+
+class TestDaemon(unittest.TestCase):
+    def setUp(self):
+        instrument.reset()
+
+    def tearDown(self):
+        instrument.reset()
+
+    def test_parse_duration(self):
+        self.assertEqual(util.parse_duration("90s"), datetime.timedelta(seconds=90))
+        self.assertEqual(util.parse_duration("15m"), datetime.timedelta(minutes=15))
+        self.assertEqual(util.parse_duration("6h"), datetime.timedelta(hours=6))
+        self.assertEqual(util.parse_duration(" 1d"), datetime.timedelta(days=1))
+
+        with self.assertRaises(ValueError):
+            util.parse_duration("15")
+
+    def test_overlapping_run_is_skipped(self):
+        source = SlowSource()
+        scheduler = daemon.Scheduler([source], {"slow": 60}, jitter=0)
+
+        with unittest.mock.patch("netzero.daemon.log"):
+            scheduler.start("slow", ":memory:")
+            scheduler.start("slow", ":memory:")
+
+            source.release.set()
+            scheduler.executor.shutdown(wait=True)
+
+        self.assertEqual(
+            source.runs, [(datetime.date(2020, 1, 1), datetime.date.today())]
+        )
+        self.assertEqual(instrument.report()["slow"]["coalesced"], 1)
+
+    def test_failed_run_is_rolled_back(self):
+        source = SlowSource()
+        source.collect = unittest.mock.Mock(side_effect=RuntimeError)
+        scheduler = daemon.Scheduler([source], {"slow": 60}, jitter=0)
+
+        with unittest.mock.patch("netzero.daemon.log"):
+            scheduler.collect("slow", ":memory:")
+
+        source.conn.rollback.assert_called_once()
+        self.assertEqual(instrument.report()["slow"]["failures"], 1)
+
+    def test_failed_metrics_are_logged(self):
+        source = SlowSource()
+        source.release.set()
+        scheduler = daemon.Scheduler([source], {"slow": 60}, jitter=0, metrics="x")
+
+        with unittest.mock.patch("netzero.daemon.log") as log:
+            with unittest.mock.patch(
+                "netzero.metrics.write_textfile", side_effect=OSError("disk full")
+            ):
+                scheduler.start("slow", ":memory:")
+                scheduler.executor.shutdown(wait=True)
+
+        log.assert_called_with("slow", "Run failed: OSError('disk full')")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+import datetime
+import os
+import sqlite3
+import time
+import unittest
+
+from netzero import db
+
+
+class TestSourceMetadata(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:")
+        self.conn.execute(
+            "CREATE TABLE pepco (time TIMESTAMP PRIMARY KEY, watt_hrs FLOAT)"
+        )
+
+    def tearDown(self):
+        self.conn.close()
+
+    def insert(self, *times):
+        self.conn.executemany(
+            "INSERT INTO pepco VALUES (?, 1)", [(time,) for time in times]
+        )
+
+    def test_create_metadata_empty(self):
+        db.create_metadata(self.conn, "pepco", "pepco", "time")
+
+        self.assertEqual((None, None), db.date_bounds(self.conn, "pepco"))
+        self.assertEqual([("pepco", None, None, 0, None)], db.metadata(self.conn))
+
+    def test_create_metadata_existing_rows(self):
+        self.insert(
+            datetime.datetime(2019, 7, 12, 13), datetime.datetime(2019, 7, 10, 2)
+        )
+
+        db.create_metadata(self.conn, "pepco", "pepco", "time")
+
+        self.assertEqual(
+            (datetime.date(2019, 7, 10), datetime.date(2019, 7, 12)),
+            db.date_bounds(self.conn, "pepco"),
+        )
+        self.assertEqual(2, db.metadata(self.conn)[0][3])
+
+    def test_record_collection(self):
+        db.create_metadata(self.conn, "pepco", "pepco", "time")
+
+        self.insert(datetime.datetime(2019, 7, 12, 13))
+        db.record_collection(self.conn, "pepco", "pepco", "time", 1)
+
+        source, first, last, row_count, last_collected = db.metadata(self.conn)[0]
+
+        self.assertEqual("2019-07-12 13:00:00", last)
+        self.assertEqual(1, row_count)
+        self.assertIsNotNone(last_collected)
+        self.assertEqual([1], db.data_versions(self.conn, ["pepco"]))
+
+    def test_record_collection_nothing_new(self):
+        db.create_metadata(self.conn, "pepco", "pepco", "time")
+
+        db.record_collection(self.conn, "pepco", "pepco", "time", 0)
+
+        self.assertEqual([0], db.data_versions(self.conn, ["pepco"]))
+
+    def test_metadata_new_database(self):
+        self.assertEqual([], db.metadata(self.conn))
+
+
+class TestCalendar(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:")
+
+        self.tz = os.environ.get("TZ")
+        os.environ["TZ"] = "America/New_York"
+        time.tzset()
+
+    def tearDown(self):
+        self.conn.close()
+
+        if self.tz is None:
+            del os.environ["TZ"]
+        else:
+            os.environ["TZ"] = self.tz
+        time.tzset()
+
+    def days(self):
+        return self.conn.execute("SELECT * FROM calendar ORDER BY day").fetchall()
+
+    def test_calendar(self):
+        db.ensure_calendar(
+            self.conn, datetime.date(2019, 3, 9), datetime.date(2019, 3, 11)
+        )
+
+        self.assertEqual(
+            [
+                ("2019-03-09", "2019-03-04", "2019-03-01", "2019-01-01", 5, 24),
+                ("2019-03-10", "2019-03-04", "2019-03-01", "2019-01-01", 6, 23),
+                ("2019-03-11", "2019-03-11", "2019-03-01", "2019-01-01", 0, 24),
+            ],
+            self.days(),
+        )
+
+    def test_calendar_extended(self):
+        db.ensure_calendar(
+            self.conn, datetime.date(2019, 11, 3), datetime.date(2019, 11, 3)
+        )
+        db.ensure_calendar(
+            self.conn, datetime.date(2019, 11, 1), datetime.date(2019, 11, 2)
+        )
+        db.ensure_calendar(
+            self.conn, datetime.date(2019, 11, 6), datetime.date(2019, 11, 6)
+        )
+
+        days = self.days()
+        self.assertEqual(
+            ["2019-11-0{}".format(day) for day in range(1, 7)],
+            [day[0] for day in days],
+        )
+        self.assertEqual([24, 24, 25, 24, 24, 24], [day[5] for day in days])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,37 @@
+import unittest
+
+from netzero import derived
+
+
+class TestDerived(unittest.TestCase):
+    def test_net(self):
+        [net] = derived.derive(
+            ["pepco", "solaredge"], [[10.0, None, 5.0], [4.0, 1.0, 6.0]], ["net"]
+        )
+
+        self.assertEqual([6.0, None, -1.0], net)
+
+    def test_degree_days(self):
+        hdd, cdd = derived.derive(
+            ["weather"], [[50.0, 65.0, 80.0, None]], ["hdd", "cdd"]
+        )
+
+        self.assertEqual([15.0, 0.0, 0.0, None], hdd)
+        self.assertEqual([0.0, 0.0, 15.0, None], cdd)
+
+    def test_gshp_per_degree_day(self):
+        [ratio] = derived.derive(
+            ["gshp", "weather"],
+            [[30.0, 2.0, None], [50.0, 70.0, 55.0]],
+            ["gshp_per_hdd"],
+        )
+
+        self.assertEqual([2.0, None, None], ratio)
+
+    def test_missing_source(self):
+        with self.assertRaises(ValueError):
+            derived.derive(["solaredge"], [[1.0]], ["net"])
+
+
+if __name__ == "__main__":
+    unittest.main()
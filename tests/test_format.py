@@ -0,0 +1,191 @@
+import argparse
+import datetime
+import os
+import tempfile
+import threading
+import unittest
+
+from netzero import cache, db, format
+
+exported = "date,pepco\r\n2019-07-10,1.0\r\n2019-07-11,2.0\r\n2019-07-12,3.0\r\n"
+
+
+class StubSource:
+    """A source with two days of values, queried after an event is set"""
+
+    def __init__(self, name, values, wait=None, error=None):
+        self.name = name
+        self.values = values
+        self.wait = wait
+        self.error = error
+        self.done = threading.Event()
+
+    def min_date(self):
+        return datetime.date(2019, 7, 10)
+
+    def max_date(self):
+        return datetime.date(2019, 7, 11)
+
+    def format(self, start_date, end_date):
+        try:
+            if self.wait is not None and not self.wait.wait(5):
+                raise RuntimeError("Waited too long")
+            if self.error is not None:
+                raise self.error
+
+            return [(value,) for value in self.values]
+        finally:
+            self.done.set()
+
+
+class TestAppendExport(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".csv")
+        with os.fdopen(fd, "w", newline="") as f:
+            f.write(exported)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def export(self, *args):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+
+        config = os.path.join(directory.name, "config.ini")
+        with open(config, "w") as f:
+            f.write("[pepco]\nfiles = []\n")
+
+        # Collected up to the day before the last exported one
+        database = os.path.join(directory.name, "netzero.sqlite3")
+        conn = db.connect(database)
+        conn.execute("CREATE TABLE pepco (time TIMESTAMP PRIMARY KEY, watt_hrs FLOAT)")
+        rows = [("2019-07-10 12:00:00", 1000.0), ("2019-07-11 12:00:00", 4000.0)]
+        conn.executemany("INSERT INTO pepco VALUES (?, ?)", rows)
+        db.create_metadata(conn, "pepco", "pepco", "time")
+        conn.close()
+
+        parser = argparse.ArgumentParser(prefix_chars="-+")
+        format.add_args(parser)
+        format.main(
+            parser.parse_args(
+                ["+p", "-c", config, "-d", database, "--append", *args, self.path]
+            )
+        )
+
+        with open(self.path, newline="") as f:
+            return f.read()
+
+    def test_last_exported_long_rows(self):
+        header = ["date"] + ["site-{}:pepco".format(i) for i in range(300)]
+        row = ",".join(["2.345678901234"] * 300)
+        with open(self.path, "w", newline="") as f:
+            f.write(",".join(header) + "\r\n")
+
+        self.assertIsNone(format.last_exported(self.path, header))
+
+        with open(self.path, "a", newline="") as f:
+            f.write("2019-07-10," + row + "\r\n2019-07-11," + row + "\r\n")
+
+        self.assertEqual(
+            datetime.date(2019, 7, 11), format.last_exported(self.path, header)
+        )
+        self.assertEqual(
+            os.path.getsize(self.path) - len(row) - 13,
+            format.truncate_offset(self.path, datetime.date(2019, 7, 11)),
+        )
+
+    def test_append_start_after_last_exported(self):
+        with self.assertRaises(ValueError):
+            self.export("-s", "2019-07-14")
+
+        with open(self.path, newline="") as f:
+            self.assertEqual(exported, f.read())
+
+    def test_append_negative_window(self):
+        with self.assertRaises(SystemExit):
+            self.export("--window", "-1")
+
+    def test_append_end_before_last_exported(self):
+        with self.assertRaises(ValueError):
+            self.export("-s", "2019-07-10", "-e", "2019-07-11")
+
+        with open(self.path, newline="") as f:
+            self.assertEqual(exported, f.read())
+
+    def test_append_keeps_rows_after_collected(self):
+        text = self.export("-s", "2019-07-11")
+
+        self.assertEqual(
+            "date,pepco\r\n2019-07-10,1.0\r\n2019-07-11,4.0\r\n2019-07-12,\r\n", text
+        )
+
+    def test_last_exported(self):
+        last = format.last_exported(self.path, ["date", "pepco"])
+
+        self.assertEqual(datetime.date(2019, 7, 12), last)
+
+    def test_last_exported_header_only(self):
+        with open(self.path, "w", newline="") as f:
+            f.write("date,pepco\r\n")
+
+        self.assertIsNone(format.last_exported(self.path, ["date", "pepco"]))
+
+    def test_last_exported_missing(self):
+        os.remove(self.path)
+
+        self.assertIsNone(format.last_exported(self.path, ["date", "pepco"]))
+
+        open(self.path, "w").close()
+
+    def test_last_exported_mismatched_header(self):
+        with self.assertRaises(ValueError):
+            format.last_exported(self.path, ["date", "weather"])
+
+    def test_truncate_offset_after_end(self):
+        offset = format.truncate_offset(self.path, datetime.date(2019, 7, 13))
+
+        self.assertEqual(len(exported), offset)
+
+    def test_truncate_offset_window(self):
+        offset = format.truncate_offset(self.path, datetime.date(2019, 7, 11))
+
+        self.assertEqual(exported.index("2019-07-11"), offset)
+
+    def test_truncate_offset_before_start(self):
+        offset = format.truncate_offset(self.path, datetime.date(2019, 1, 1))
+
+        self.assertEqual(len("date,pepco\r\n"), offset)
+
+
+class TestQuery(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.database = os.path.join(directory.name, "netzero.sqlite3")
+
+        self.start_date = datetime.date(2019, 7, 10)
+        self.end_date = datetime.date(2019, 7, 12)
+
+    def query(self, sources):
+        return format.query(sources, self.start_date, self.end_date, self.database)
+
+    def test_columns_in_source_order(self):
+        # The first source only finishes once the second one has
+        last = StubSource("last", [3.0, 4.0])
+        first = StubSource("first", [1.0, 2.0], wait=last.done)
+
+        self.assertEqual(
+            [[1.0, 2.0, None], [3.0, 4.0, None]], self.query([first, last])
+        )
+
+    def test_failing_source_fails_query(self):
+        failing = StubSource("failing", [], error=RuntimeError("unreachable"))
+        working = StubSource("working", [1.0, 2.0], wait=failing.done)
+
+        with self.assertRaises(RuntimeError):
+            self.query([working, failing])
+
+        conn = db.connect(self.database)
+        key = cache.key(["working", "failing"], self.start_date, self.end_date)
+        self.assertIsNone(cache.load(conn, key, [0, 0]))
+        conn.close()
@@ -0,0 +1,118 @@
+import configparser
+import json
+import os
+import tempfile
+import unittest
+
+from netzero.builtin import gshp
+
+samples = [
+    {"1": "1562731200", "2": "2019-07-10 00:00:00", "3": "71.5", "78": "0"},
+    {"78": "2840", "3": "72.0, 1", "1": "1562731260", "2": "2019-07-10 00:01:00"},
+    {"1": "1562731320", "2": "2019-07-10 00:02:00", "3": "\"78\"", "78": "-12"},
+]
+
+
+class TestDecodeSamples(unittest.TestCase):
+    def test_decode(self):
+        body = json.dumps(samples).encode()
+
+        self.assertEqual(
+            [(1562731200, 0), (1562731260, 2840), (1562731320, -12)],
+            gshp.decode_samples([body]),
+        )
+
+    def test_decode_any_chunks(self):
+        body = json.dumps(samples, separators=(",", ":")).encode()
+        expected = gshp.decode_samples([body])
+
+        for size in [1, 2, 3, 7, 64]:
+            chunks = [body[i : i + size] for i in range(0, len(body), size)]
+            self.assertEqual(expected, gshp.decode_samples(chunks), size)
+
+    def test_decode_incomplete_sample(self):
+        for broken in [{"1": "1562731380", "78": ""}, {"78": "100"}]:
+            body = json.dumps(samples[:1] + [broken] + samples[1:]).encode()
+
+            with self.assertRaises(ValueError):
+                gshp.decode_samples([body])
+
+    def test_decode_empty(self):
+        self.assertEqual([], gshp.decode_samples([b"[]"]))
+        self.assertEqual([], gshp.decode_samples([]))
+
+
+class TestTelemetry(unittest.TestCase):
+    def setUp(self):
+        fd, self.database = tempfile.mkstemp(suffix=".sqlite3")
+        os.close(fd)
+
+        self.config = configparser.ConfigParser()
+        self.config["gshp"] = {"username": "test", "password": "test"}
+
+    def tearDown(self):
+        for suffix in ["", "-wal", "-shm"]:
+            if os.path.exists(self.database + suffix):
+                os.remove(self.database + suffix)
+
+    def store(self, source, samples):
+        rows, telemetry = source.parse(
+            gshp.decode_telemetry([json.dumps(samples).encode()])
+        )
+
+        cur = source.conn.cursor()
+        inserted = source.store_telemetry(cur, *telemetry)
+        source.conn.commit()
+
+        return rows, inserted
+
+    def test_all_fields(self):
+        self.config["gshp"]["telemetry"] = "all"
+        source = gshp.Gshp(self.config, self.database)
+
+        rows, inserted = self.store(source, samples)
+        self.assertEqual(3, len(rows))
+        self.assertEqual(3, inserted)
+
+        # A field first seen later gets its own column
+        _, inserted = self.store(
+            source, [{"1": "1562731380", "3": "", "78": "0", "12": "7"}]
+        )
+        self.assertEqual(1, inserted)
+
+        values = source.conn.execute(
+            """
+            SELECT field_3, typeof(field_3), field_12, field_78
+            FROM gshp_telemetry ORDER BY time"""
+        ).fetchall()
+
+        self.assertEqual(
+            [
+                (71.5, "real", None, 0),
+                ("72.0, 1", "text", None, 2840),
+                ('"78"', "text", None, -12),
+                (None, "null", 7, 0),
+            ],
+            values,
+        )
+
+    def test_selected_fields(self):
+        self.config["gshp"]["telemetry"] = '["3"]'
+        source = gshp.Gshp(self.config, self.database)
+
+        self.store(source, samples)
+
+        columns = [
+            row[1] for row in source.conn.execute("PRAGMA table_info(gshp_telemetry)")
+        ]
+        self.assertEqual(["time", "field_3"], columns)
+
+    def test_invalid_field(self):
+        self.config["gshp"]["telemetry"] = '["3; DROP TABLE gshp"]'
+
+        with self.assertRaises(ValueError):
+            gshp.Gshp(self.config, self.database)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import configparser
+import datetime
+import os
+import tempfile
+import unittest
+
+import numpy
+
+import netzero
+from netzero import db
+from netzero.builtin.solar import Solar
+
+
+class TestLoad(unittest.TestCase):
+    def setUp(self):
+        fd, self.database = tempfile.mkstemp(suffix=".sqlite3")
+        os.close(fd)
+
+        self.config = configparser.ConfigParser()
+        self.config["solar"] = {"api_key": "test", "site_id": "1"}
+
+        source = Solar(self.config, self.database)
+        rows = [("2019-07-10 12:00:00", 1000.0), ("2019-07-12 12:00:00", 2000.0)]
+        source.conn.executemany("INSERT INTO solaredge VALUES (?, ?)", rows)
+        source.conn.commit()
+        db.record_collection(source.conn, "solaredge", "solaredge", "time", len(rows))
+        source.conn.close()
+
+    def tearDown(self):
+        for suffix in ["", "-wal", "-shm"]:
+            if os.path.exists(self.database + suffix):
+                os.remove(self.database + suffix)
+
+    def load(self, *args, **kwargs):
+        return netzero.load(
+            *args, database=self.database, config=self.config, frame=False, **kwargs
+        )
+
+    def test_load_arrays(self):
+        data = self.load("solaredge")
+
+        self.assertEqual(
+            ["2019-07-10", "2019-07-11", "2019-07-12"],
+            [str(date) for date in data["date"]],
+        )
+        self.assertEqual(numpy.float64, data["solaredge"].dtype)
+        numpy.testing.assert_array_equal([1.0, numpy.nan, 2.0], data["solaredge"])
+
+    def test_load_resolution(self):
+        data = self.load([Solar], start="2019-07-01", resolution="month")
+
+        self.assertEqual([numpy.datetime64("2019-07-01")], list(data["date"]))
+        numpy.testing.assert_array_equal([3.0], data["solaredge"])
+
+    def test_load_empty_range(self):
+        data = self.load(
+            "solaredge", datetime.date(2019, 8, 1), datetime.date(2019, 7, 1)
+        )
+
+        self.assertEqual(0, len(data["date"]))
+        self.assertEqual(0, len(data["solaredge"]))
+
+    def test_load_unknown_source(self):
+        with self.assertRaises(ValueError):
+            self.load("nonexistent")
+
+    def test_load_frame(self):
+        try:
+            import pandas
+        except ImportError:
+            self.skipTest("pandas is not installed")
+
+        data = netzero.load("solaredge", database=self.database, config=self.config)
+
+        self.assertIsInstance(data, pandas.DataFrame)
+        self.assertEqual(["solaredge"], list(data.columns))
+
+
+if __name__ == "__main__":
+    unittest.main()
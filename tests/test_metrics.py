@@ -0,0 +1,109 @@
+import concurrent.futures
+import os
+import tempfile
+import unittest
+
+from netzero import db, instrument, metrics, sites
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        fd, self.database = tempfile.mkstemp(suffix=".sqlite3")
+        os.close(fd)
+
+        instrument.reset()
+
+    def tearDown(self):
+        instrument.reset()
+
+        for suffix in ["", "-wal", "-shm"]:
+            if os.path.exists(self.database + suffix):
+                os.remove(self.database + suffix)
+
+    def test_render_counters(self):
+        instrument.count("weather", "api_errors")
+        instrument.count("weather", "api_errors")
+
+        text = metrics.render(self.database)
+
+        self.assertIn("# TYPE netzero_api_errors_total counter", text)
+        self.assertIn('netzero_api_errors_total{source="weather"} 2.0', text)
+
+    def test_render_histogram(self):
+        instrument.observe("solaredge", "request_seconds", 0.2)
+        instrument.observe("solaredge", "request_seconds", 3)
+
+        text = metrics.render(self.database)
+
+        self.assertIn(
+            'netzero_request_duration_seconds_bucket{source="solaredge",le="0.1"} 0.0',
+            text,
+        )
+        self.assertIn(
+            'netzero_request_duration_seconds_bucket{source="solaredge",le="0.25"} 1.0',
+            text,
+        )
+        self.assertIn(
+            'netzero_request_duration_seconds_bucket{source="solaredge",le="+Inf"} 2.0',
+            text,
+        )
+        self.assertIn(
+            'netzero_request_duration_seconds_sum{source="solaredge"} 3.2', text
+        )
+
+    def test_render_last_success(self):
+        conn = db.connect(self.database)
+        conn.execute("CREATE TABLE pepco (time TIMESTAMP PRIMARY KEY, watt_hrs FLOAT)")
+        db.create_metadata(conn, "pepco", "pepco", "time")
+        db.record_collection(conn, "pepco", "pepco", "time", 0)
+        conn.close()
+
+        text = metrics.render(self.database)
+
+        self.assertIn('netzero_last_success_timestamp_seconds{source="pepco"}', text)
+        self.assertIn('netzero_source_rows{source="pepco"} 0.0', text)
+        self.assertIn("netzero_database_size_bytes ", text)
+
+    def test_render_sites(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        database = os.path.join(directory.name, "netzero.sqlite3")
+
+        for site in ["a", "b"]:
+            conn = db.connect(sites.shard(database, site))
+            conn.execute(
+                "CREATE TABLE pepco (time TIMESTAMP PRIMARY KEY, watt_hrs FLOAT)"
+            )
+            db.create_metadata(conn, "pepco", "pepco", "time")
+            if site == "a":
+                db.record_collection(conn, "pepco", "pepco", "time", 0)
+            conn.close()
+
+        text = metrics.render(database, ["a", "b"])
+
+        self.assertIn(
+            'netzero_last_success_timestamp_seconds{site="a",source="pepco"}', text
+        )
+        self.assertNotIn('netzero_last_success_timestamp_seconds{site="b"', text)
+        self.assertIn('netzero_source_rows{site="b",source="pepco"} 0.0', text)
+        self.assertIn('netzero_database_size_bytes{site="a"} ', text)
+        self.assertFalse(os.path.exists(database))
+
+    def test_write_textfile_concurrently(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "netzero.prom")
+
+        instrument.count("weather", "api_errors")
+        expected = metrics.render(self.database)
+
+        with concurrent.futures.ThreadPoolExecutor(8) as executor:
+            for future in [
+                executor.submit(metrics.write_textfile, path, self.database)
+                for i in range(32)
+            ]:
+                future.result()
+
+        with open(path) as f:
+            self.assertEqual(expected, f.read())
+        self.assertEqual(["netzero.prom"], os.listdir(directory.name))
@@ -0,0 +1,151 @@
+import configparser
+import datetime
+import os
+import tempfile
+import unittest
+import unittest.mock
+import urllib.error
+import urllib.request
+
+from netzero import db, serve, util
+from netzero.builtin.solar import Solar
+
+
+class TestRollup(unittest.TestCase):
+    def test_rollup_sum(self):
+        days = util.iter_days(datetime.date(2019, 1, 30), datetime.date(2019, 2, 2))
+
+        periods, values = util.rollup(days, [1, None, 2, 3], "month")
+
+        self.assertEqual(
+            [datetime.date(2019, 1, 1), datetime.date(2019, 2, 1)], periods
+        )
+        self.assertEqual([1, 5], values)
+
+    def test_rollup_mean(self):
+        days = util.iter_days(datetime.date(2019, 7, 1), datetime.date(2019, 7, 8))
+
+        periods, values = util.rollup(days, [1, 2, 3, 4, 5, 6, 7, None], "week", "mean")
+
+        self.assertEqual(
+            [datetime.date(2019, 7, 1), datetime.date(2019, 7, 8)], periods
+        )
+        self.assertEqual([4, None], values)
+
+    def test_rollup_invalid(self):
+        with self.assertRaises(ValueError):
+            util.rollup([datetime.date(2019, 7, 1)], [1], "hour")
+
+
+class TestApi(unittest.TestCase):
+    def setUp(self):
+        fd, self.database = tempfile.mkstemp(suffix=".sqlite3")
+        os.close(fd)
+
+        config = configparser.ConfigParser()
+        config["solar"] = {"api_key": "test", "site_id": "1"}
+
+        self.api = serve.Api([Solar], config, self.database, readers=2)
+
+        self.insert(
+            [
+                ("2019-07-10 12:00:00", 1000.0),
+                ("2019-07-10 13:00:00", 2000.0),
+                ("2019-07-11 12:00:00", 4000.0),
+            ]
+        )
+
+    def tearDown(self):
+        for suffix in ["", "-wal", "-shm"]:
+            if os.path.exists(self.database + suffix):
+                os.remove(self.database + suffix)
+
+    def insert(self, rows):
+        conn = db.connect(self.database)
+        conn.executemany("INSERT INTO solaredge VALUES (?, ?)", rows)
+        conn.commit()
+        db.record_collection(conn, "solaredge", "solaredge", "time", len(rows))
+        conn.close()
+
+    def test_series_defaults_to_collected_range(self):
+        periods, values = self.api.series("solaredge")
+
+        self.assertEqual(
+            [datetime.date(2019, 7, 10), datetime.date(2019, 7, 11)], periods
+        )
+        self.assertEqual([3.0, 4.0], values)
+
+    def test_series_resolution(self):
+        periods, values = self.api.series("solaredge", resolution="year")
+
+        self.assertEqual([datetime.date(2019, 1, 1)], periods)
+        self.assertEqual([7.0], values)
+
+    def test_series_cached_until_collected(self):
+        self.api.series("solaredge")
+        self.assertEqual(1, len(self.api.cache))
+
+        self.insert([("2019-07-11 13:00:00", 8000.0)])
+
+        _, values = self.api.series("solaredge")
+        self.assertEqual([3.0, 12.0], values)
+
+    def test_series_outside_collected_range(self):
+        periods, values = self.api.series(
+            "solaredge", datetime.date(1900, 1, 1), datetime.date(2199, 12, 31), "year"
+        )
+
+        self.assertEqual(300, len(periods))
+        self.assertEqual(7.0, values[119])
+        self.assertEqual(7.0, sum(value or 0 for value in values))
+
+        # Only the collected days are added to the calendar
+        conn = db.connect(self.database)
+        days = conn.execute("SELECT min(day), max(day) FROM calendar").fetchone()
+        conn.close()
+        self.assertEqual(("2019-07-10", "2019-07-11"), days)
+
+    def test_series_only_reads(self):
+        self.api.series("solaredge")
+        self.insert([("2019-07-12 12:00:00", 1000.0)])
+
+        writer = db.connect(self.database)
+        self.addCleanup(writer.close)
+        writer.execute("BEGIN IMMEDIATE")
+
+        with self.api.pools["solaredge"].get() as source:
+            source.conn.execute("PRAGMA busy_timeout = 100")
+
+        _, values = self.api.series("solaredge")
+        self.assertEqual([3.0, 4.0, 1.0], values)
+
+    def test_unexpected_error(self):
+        server = serve.serve(self.api, port=0)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        url = "http://localhost:{}/series/solaredge".format(server.server_address[1])
+
+        with unittest.mock.patch.object(self.api, "series", side_effect=RuntimeError):
+            with self.assertRaises(urllib.error.HTTPError) as context:
+                urllib.request.urlopen(url)
+
+        self.assertEqual(500, context.exception.code)
+
+    def test_parse_date_out_of_range(self):
+        self.assertEqual(datetime.date(2019, 7, 10), serve.parse_date("2019-07-10"))
+
+        for text in ["1000-01-01", "9999-12-31"]:
+            with self.assertRaises(ValueError):
+                serve.parse_date(text)
+
+    def test_sources(self):
+        [source] = self.api.sources()
+
+        self.assertEqual("solaredge", source["name"])
+        self.assertEqual("2019-07-10", source["start"])
+        self.assertEqual("2019-07-11", source["end"])
+        self.assertEqual(3, source["rows"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,138 @@
+import argparse
+import configparser
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+
+from netzero import collect, db, sites, status
+
+
+class FailingSource:
+    name = "failing"
+
+    def collect(self, start_date, end_date):
+        raise RuntimeError("unreachable")
+
+
+class WorkingSource:
+    name = "working"
+
+    def __init__(self):
+        self.collected = False
+
+    def collect(self, start_date, end_date):
+        self.collected = True
+
+
+class BulkSource:
+    name = "bulk"
+    collected = []
+
+    @classmethod
+    def collect_bulk(cls, sources, start_date, end_date):
+        cls.collected.append(sources)
+
+
+class TestSites(unittest.TestCase):
+    def setUp(self):
+        self.config = configparser.ConfigParser()
+        self.config.read_string("""
+            [solar]
+            api_key = shared
+            site_id = 0
+
+            [solar:home-b]
+            site_id = 2
+
+            [solar:home-a]
+            site_id = 1
+
+            [weather]
+            api_key = weather
+            """)
+
+    def test_names(self):
+        self.assertEqual(["home-a", "home-b"], sites.names(self.config))
+
+    def test_select(self):
+        self.assertEqual(["home-a", "home-b"], sites.select(self.config))
+        self.assertEqual(["home-b"], sites.select(self.config, ["home-b"]))
+
+        with self.assertRaises(ValueError):
+            sites.select(self.config, ["home-c"])
+
+    def test_select_without_sites(self):
+        config = configparser.ConfigParser()
+        config["solar"] = {"site_id": "1"}
+
+        self.assertEqual([None], sites.select(config))
+
+    def test_resolve(self):
+        config, database = sites.resolve(self.config, "home-a", "/data/db.sqlite3")
+
+        self.assertEqual("/data/db-home-a.sqlite3", database)
+        self.assertEqual("shared", config["solar"]["api_key"])
+        self.assertEqual("1", config["solar"]["site_id"])
+        self.assertEqual("weather", config["weather"]["api_key"])
+        self.assertFalse(config.has_section("solar:home-b"))
+
+    def test_resolve_without_site(self):
+        self.assertEqual(
+            (self.config, "db.sqlite3"), sites.resolve(self.config, None, "db.sqlite3")
+        )
+
+    def test_combine(self):
+        columns = [[1.0, None, None], [3.0, 4.0, None]]
+
+        self.assertEqual([4.0, 4.0, None], sites.combine(columns, "sum"))
+        self.assertEqual([2.0, 4.0, None], sites.combine(columns, "mean"))
+
+    def test_failed_site_does_not_stop_others(self):
+        working = WorkingSource()
+
+        with self.assertRaises(RuntimeError) as context:
+            collect.collect_sites(
+                {"home-a": [FailingSource()], "home-b": [working]}, None, None, 1
+            )
+
+        self.assertTrue(working.collected)
+        self.assertIn("home-a", str(context.exception))
+
+    def test_bulk_sources_are_collected_together(self):
+        a, b, working = BulkSource(), BulkSource(), WorkingSource()
+
+        collect.collect_sites({"home-a": [a, working], "home-b": [b]}, None, None, 2)
+
+        self.assertEqual([[a, b]], BulkSource.collected)
+        self.assertTrue(working.collected)
+
+    def test_status(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+
+        config = os.path.join(directory.name, "config.ini")
+        with open(config, "w") as f:
+            self.config.write(f)
+
+        database = os.path.join(directory.name, "netzero.sqlite3")
+        conn = db.connect(sites.shard(database, "home-a"))
+        conn.execute("CREATE TABLE pepco (time TIMESTAMP PRIMARY KEY, watt_hrs FLOAT)")
+        db.create_metadata(conn, "pepco", "pepco", "time")
+        db.record_collection(conn, "pepco", "pepco", "time", 0)
+        conn.close()
+
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            status.main(
+                argparse.Namespace(database=database, config=config, sites=None)
+            )
+
+        self.assertIn("home-a  pepco", output.getvalue())
+        self.assertFalse(os.path.exists(database))
+        self.assertFalse(os.path.exists(sites.shard(database, "home-b")))
+
+
+if __name__ == "__main__":
+    unittest.main()
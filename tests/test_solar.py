@@ -0,0 +1,172 @@
+import configparser
+import datetime
+import os
+import tempfile
+import unittest
+import unittest.mock
+
+from netzero.builtin.solar import Solar
+
+
+def energy(start_date, end_date, time_unit="QUARTER_OF_AN_HOUR"):
+    """A SolarEdge response with 1 Wh every quarter hour."""
+    values = []
+    day = start_date
+    while day <= end_date:
+        midnight = datetime.datetime.combine(day, datetime.time())
+        if time_unit == "DAY":
+            values.append({"date": str(midnight), "value": 96})
+        else:
+            for quarter in range(96):
+                time = midnight + datetime.timedelta(minutes=15 * quarter)
+                values.append({"date": str(time), "value": 1})
+        day += datetime.timedelta(days=1)
+
+    return {"energy": {"timeUnit": time_unit, "values": values}}
+
+
+class TestSolarBackfill(unittest.TestCase):
+    def setUp(self):
+        fd, self.database = tempfile.mkstemp(suffix=".sqlite3")
+        os.close(fd)
+
+        self.config = configparser.ConfigParser()
+        self.config["solar"] = {"api_key": "test", "site_id": "1"}
+
+    def tearDown(self):
+        for suffix in ["", "-wal", "-shm"]:
+            if os.path.exists(self.database + suffix):
+                os.remove(self.database + suffix)
+
+    def collect(self, start_date, end_date, detail_requests=None):
+        if detail_requests is not None:
+            self.config["solar"]["detail_requests"] = str(detail_requests)
+
+        solar = Solar(self.config, self.database)
+        query_api = unittest.mock.Mock(side_effect=lambda *args: energy(*args))
+        with unittest.mock.patch.object(solar, "query_api", query_api):
+            solar.collect(start_date, end_date)
+
+        return solar, query_api.call_args_list
+
+    def test_daily_totals_first(self):
+        solar, calls = self.collect(
+            datetime.date(2019, 1, 1), datetime.date(2019, 12, 31), detail_requests=0
+        )
+
+        self.assertEqual(
+            [
+                unittest.mock.call(
+                    datetime.date(2019, 1, 1), datetime.date(2019, 12, 31), "DAY"
+                )
+            ],
+            calls,
+        )
+
+        values = [
+            row[0]
+            for row in solar.format(
+                datetime.date(2019, 1, 1), datetime.date(2019, 1, 3)
+            )
+        ]
+        self.assertEqual([0.096, 0.096, 0.096], values)
+        self.assertEqual(datetime.date(2019, 12, 31), solar.max_date())
+
+    def test_detail_is_collected_newest_first_within_budget(self):
+        solar, calls = self.collect(
+            datetime.date(2019, 1, 1), datetime.date(2019, 3, 31), detail_requests=1
+        )
+
+        self.assertEqual(2, len(calls))
+        self.assertEqual(
+            unittest.mock.call(datetime.date(2019, 3, 2), datetime.date(2019, 3, 31)),
+            calls[1],
+        )
+
+    def test_later_runs_fill_in_older_detail(self):
+        self.collect(
+            datetime.date(2019, 1, 1), datetime.date(2019, 3, 31), detail_requests=1
+        )
+
+        del self.config["solar"]["detail_requests"]
+        solar, calls = self.collect(
+            datetime.date(2019, 3, 31), datetime.date(2019, 3, 31)
+        )
+
+        detail = [call for call in calls if len(call.args) == 2]
+        self.assertEqual(
+            [
+                # The last day with detail is collected again
+                unittest.mock.call(
+                    datetime.date(2019, 3, 31), datetime.date(2019, 3, 31)
+                ),
+                unittest.mock.call(
+                    datetime.date(2019, 1, 31), datetime.date(2019, 3, 1)
+                ),
+                unittest.mock.call(
+                    datetime.date(2019, 1, 1), datetime.date(2019, 1, 31)
+                ),
+            ],
+            detail,
+        )
+
+        count = solar.conn.execute("SELECT count(*) FROM solaredge").fetchone()[0]
+        self.assertEqual(90 * 96, count)
+
+
+class TestSolarBulk(unittest.TestCase):
+    def setUp(self):
+        self.databases = []
+        self.sources = []
+        for site_id in ["1", "2", "3"]:
+            fd, database = tempfile.mkstemp(suffix=".sqlite3")
+            os.close(fd)
+            self.databases.append(database)
+
+            config = configparser.ConfigParser()
+            config["solar"] = {"api_key": "test", "site_id": site_id}
+            self.sources.append(Solar(config, database))
+
+    def tearDown(self):
+        for source in self.sources:
+            source.conn.close()
+
+        for database in self.databases:
+            for suffix in ["", "-wal", "-shm"]:
+                if os.path.exists(database + suffix):
+                    os.remove(database + suffix)
+
+    def test_collect_bulk(self):
+        calls = []
+
+        def query_bulk(self, site_ids, start_date, end_date, time_unit):
+            calls.append((list(site_ids), start_date, end_date, time_unit))
+            return {
+                site_id: energy(start_date, end_date, time_unit) for site_id in site_ids
+            }
+
+        with unittest.mock.patch.object(Solar, "bulk_size", 2):
+            with unittest.mock.patch.object(Solar, "query_bulk", query_bulk):
+                Solar.collect_bulk(
+                    self.sources, datetime.date(2019, 1, 1), datetime.date(2019, 1, 10)
+                )
+
+        first, last = datetime.date(2019, 1, 1), datetime.date(2019, 1, 10)
+        self.assertEqual(
+            [
+                (["1", "2"], first, last, "DAY"),
+                (["1", "2"], first, last, "QUARTER_OF_AN_HOUR"),
+                (["3"], first, last, "DAY"),
+                (["3"], first, last, "QUARTER_OF_AN_HOUR"),
+            ],
+            calls,
+        )
+
+        for source in self.sources:
+            count = source.conn.execute("SELECT count(*) FROM solaredge").fetchone()[0]
+            self.assertEqual(10 * 96, count)
+            self.assertEqual(datetime.date(2019, 1, 10), source.max_date())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,9 @@
 import unittest
 import datetime
+import os
+import time
 
-from netzero.sources import util
+from netzero import util
 
 
 class TestSourceUtils(unittest.TestCase):
@@ -74,3 +76,55 @@ class TestSourceUtils(unittest.TestCase):
 
         with self.assertRaises(StopIteration):
             next(gen)
+
+
+class TestTimes(unittest.TestCase):
+    def setUp(self):
+        self.tz = os.environ.get("TZ")
+        os.environ["TZ"] = "America/New_York"
+        time.tzset()
+
+    def tearDown(self):
+        if self.tz is None:
+            del os.environ["TZ"]
+        else:
+            os.environ["TZ"] = self.tz
+        time.tzset()
+
+    def test_local_times(self):
+        # A day on either side of both daylight saving time changes
+        timestamps = []
+        for start in [1552194000, 1572757200]:
+            timestamps.extend(range(start - 86400, start + 86400, 900))
+
+        self.assertEqual(
+            [str(datetime.datetime.fromtimestamp(t)) for t in timestamps],
+            util.local_times(timestamps),
+        )
+
+    def test_local_times_half_hour_zone(self):
+        # Adelaide is UTC+9:30, and changes at half past a UTC hour
+        os.environ["TZ"] = "Australia/Adelaide"
+        time.tzset()
+
+        timestamps = []
+        for start in [1554568200, 1570293000]:
+            timestamps.extend(range(start - 86400, start + 86400, 900))
+
+        self.assertEqual(
+            [str(datetime.datetime.fromtimestamp(t)) for t in timestamps],
+            util.local_times(timestamps),
+        )
+
+    def test_format_times(self):
+        times = ["2019-07-10T12:00:00", "2019-07-10 13:15:00"]
+
+        self.assertEqual(
+            ["2019-07-10 12:00:00", "2019-07-10 13:15:00"], util.format_times(times)
+        )
+        self.assertEqual(["2019-07-10", "2019-07-10"], util.format_times(times, "D"))
+
+    def test_format_invalid_times(self):
+        for text in ["2019-07-10", "2019-02-30 12:00:00"]:
+            with self.assertRaises(ValueError):
+                util.format_times([text])
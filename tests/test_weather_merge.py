@@ -0,0 +1,92 @@
+import configparser
+import datetime
+import os
+import tempfile
+import unittest
+import unittest.mock
+
+from netzero import db, instrument
+from netzero.builtin.weather import Weather
+
+
+def results(*entries):
+    return {
+        "results": [
+            {"date": date + "T00:00:00", "value": value, "station": station}
+            for date, value, station in entries
+        ]
+    }
+
+
+class TestWeatherMerge(unittest.TestCase):
+    def setUp(self):
+        fd, self.database = tempfile.mkstemp(suffix=".sqlite3")
+        os.close(fd)
+
+        config = configparser.ConfigParser()
+        config["weather"] = {"api_key": "test", "stations": '["A", "B"]'}
+
+        self.weather = Weather(config, self.database)
+        instrument.reset()
+
+    def tearDown(self):
+        self.weather.conn.close()
+        instrument.reset()
+
+        for suffix in ["", "-wal", "-shm"]:
+            if os.path.exists(self.database + suffix):
+                os.remove(self.database + suffix)
+
+    def collect(self, response):
+        day = datetime.date(2019, 7, 12)
+        with unittest.mock.patch.object(Weather, "query_api", return_value=response):
+            self.weather.collect(day, day)
+
+    def test_collect_again(self):
+        self.collect(results(("2019-07-12", 80, "A"), ("2019-07-12", 82, "B")))
+        self.collect(
+            results(
+                ("2019-07-12", 80, "A"),
+                ("2019-07-12", 84, "B"),
+                ("2019-07-13", 90, "A"),
+            )
+        )
+
+        rows = self.weather.conn.execute(
+            "SELECT date, temperature, station FROM weather ORDER BY date, station"
+        ).fetchall()
+        self.assertEqual(
+            [
+                ("2019-07-12", 80, "A"),
+                ("2019-07-12", 84, "B"),
+                ("2019-07-13", 90, "A"),
+            ],
+            rows,
+        )
+
+        stats = instrument.report()["weather"]
+        self.assertEqual(3, stats["rows_written"])
+        self.assertEqual(1, stats["rows_updated"])
+        self.assertEqual(1, stats["rows_unchanged"])
+
+        self.assertEqual(3, db.metadata(self.weather.conn)[0][3])
+        self.assertEqual(2, db.data_versions(self.weather.conn, ["weather"])[0])
+
+    def test_unchanged_keeps_version(self):
+        response = results(("2019-07-12", 80, "A"))
+        self.collect(response)
+        self.collect(response)
+
+        self.assertEqual(1, db.data_versions(self.weather.conn, ["weather"])[0])
+
+    def test_duplicates_in_one_batch(self):
+        cur = self.weather.conn.cursor()
+        counts = self.weather.merge(
+            cur, [("2019-07-12", 80, "A"), ("2019-07-12", 81, "A")]
+        )
+
+        self.assertEqual({"inserted": 1, "updated": 0, "unchanged": 0}, counts)
+
+
+if __name__ == "__main__":
+    unittest.main()